@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+from benchmarks import runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Groceries MCP offline benchmark")
+    parser.add_argument("--vendor", help="The vendor to benchmark", choices=["rami-levy", "keshet", "shufersal"], default="rami-levy")
+    parser.add_argument("--mode", help="call the provider tools directly or through the streamable-http server", choices=["direct", "mcp"], default="direct")
+    parser.add_argument("--list", help="shopping list the scenarios are built from", default=os.path.join(os.path.dirname(os.path.dirname(__file__)), "grocery.txt"))
+    parser.add_argument("--scenario", help="scenario to run, all by default", action="append", choices=runner.SCENARIOS)
+    parser.add_argument("--iterations", help="calls per scenario", type=int, default=50)
+    parser.add_argument("--list-iterations", help="runs of the full list scenario", type=int, default=5)
+    parser.add_argument("--concurrency", help="concurrent calls", type=int, default=4)
+    parser.add_argument("--latency", help="mean vendor latency in ms", type=float, default=50)
+    parser.add_argument("--jitter", help="vendor latency standard deviation in ms", type=float, default=10)
+    parser.add_argument("--seed", help="latency random seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to a file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+
+    args = parser.parse_args()
+    # configured before the server is imported, a line per request would drown the report
+    logging.basicConfig(level=logging.WARNING)
+
+    report = asyncio.run(
+        runner.run(
+            vendor=args.vendor,
+            mode=args.mode,
+            items=runner.read_list(args.list),
+            iterations=args.iterations,
+            list_iterations=args.list_iterations,
+            concurrency=args.concurrency,
+            latency=args.latency / 1000,
+            jitter=args.jitter / 1000,
+            seed=args.seed,
+            scenarios=args.scenario or runner.SCENARIOS,
+        )
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            for line in runner.compare(report, json.load(baseline_file)):
+                print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import typing
+
+VENDORS = ("rami-levy", "keshet", "shufersal")
+# loaded on first use, importing and registering the providers must not pull them in
+DEFERRED_MODULES = ("playwright", "cryptography")
+# importing and registering the providers must not need them either
+CREDENTIALS = ("VENDOR_API_KEY", "VENDOR_ACCOUNT_ID", "CART_ID", "RAMI_LEVY_API_KEY", "KESHET_API_KEY")
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1500"))
+
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def measure(vendors: typing.Sequence[str] = VENDORS) -> dict:
+    """
+    Import the server and register the providers in a fresh interpreter, with `-X importtime`
+    """
+    snippet = (
+        "from mcp_groceries_server.server import load_provider\n"
+        f"vendors = {list(vendors)!r}\n"
+        "for vendor in vendors:\n"
+        "    load_provider(vendor, vendor.replace('-', '_') if len(vendors) > 1 else '')\n"
+    )
+    env = {key: value for key, value in os.environ.items() if key not in CREDENTIALS}
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", snippet], env=env, capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - started
+
+    top_level: list[tuple[str, int]] = []
+    imported: set[str] = set()
+    for line in process.stderr.splitlines():
+        if match := _IMPORT_TIME.match(line):
+            _, cumulative, indent, module = match.groups()
+            imported.add(module)
+            if not indent:
+                top_level.append((module, int(cumulative)))
+
+    return dict(
+        vendors=list(vendors),
+        import_ms=round(sum(cumulative for _, cumulative in top_level) / 1000, 1),
+        wall_ms=round(wall * 1000, 1),
+        slowest=[
+            dict(module=module, cumulative_ms=round(cumulative / 1000, 1))
+            for module, cumulative in sorted(top_level, key=lambda entry: entry[1], reverse=True)[:10]
+        ],
+        deferred_imported=[module for module in DEFERRED_MODULES if module in imported],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Groceries MCP server import time")
+    parser.add_argument("--vendor", help="vendor to register, all by default", action="append", choices=VENDORS)
+    parser.add_argument("--budget-ms", help="maximal import time", type=float, default=IMPORT_TIME_BUDGET_MS)
+    args = parser.parse_args()
+
+    report = measure(args.vendor or VENDORS)
+    report["budget_ms"] = args.budget_ms
+    report["within_budget"] = report["import_ms"] <= args.budget_ms and not report["deferred_imported"]
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    sys.exit(0 if report["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
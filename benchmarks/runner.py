@@ -0,0 +1,279 @@
+import asyncio
+import contextlib
+import datetime
+import importlib
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import typing
+
+from benchmarks import stub_servers
+
+SCENARIOS = ("search", "search_cached", "add", "remove", "full_list")
+# vendors whose cart is written from a browser page, only the search scenarios run against the stand-in
+BROWSER_CART_VENDORS = ("shufersal",)
+
+# stand-in credentials, the services read them at import time
+_ACCOUNT_ID = "benchmark"
+_CART_ID = "benchmark"
+_PROVIDERS = {
+    "rami-levy": ("mcp_groceries_server.server.providers.rami_levy.tools", "RamiLevyProvider"),
+    "keshet": ("mcp_groceries_server.server.providers.keshet.tools", "KeshetProvider"),
+    "shufersal": ("mcp_groceries_server.server.providers.shufersal.tools", "ShufersalProvider"),
+}
+
+ToolCall = typing.Callable[[str, dict], typing.Awaitable[typing.Any]]
+
+
+def read_list(path: str) -> list[str]:
+    """
+    Items of a shopping list in the `grocery.txt` format, one quoted item per line
+    """
+    with open(path, "r", encoding="utf-8") as list_file:
+        return [item for line in list_file if (item := line.strip().strip('",').strip())]
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of sorted samples
+    """
+    if not samples:
+        return math.nan
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return dict(
+        count=len(latencies),
+        errors=errors,
+        mean_ms=round(sum(latencies) / len(latencies) * 1000, 3) if latencies else math.nan,
+        p50_ms=round(percentile(latencies, 0.50) * 1000, 3),
+        p95_ms=round(percentile(latencies, 0.95) * 1000, 3),
+        p99_ms=round(percentile(latencies, 0.99) * 1000, 3),
+        throughput_rps=round(len(latencies) / elapsed, 3) if elapsed else math.nan,
+    )
+
+
+async def measure(
+    call: typing.Callable[[int], typing.Awaitable[typing.Any]],
+    iterations: int,
+    concurrency: int,
+    setup: typing.Optional[typing.Callable[[int], typing.Awaitable[typing.Any]]] = None,
+) -> dict:
+    """
+    Run `call(iteration)` `iterations` times from `concurrency` workers, after the untimed `setup(iteration)`.
+    Failed calls are counted, not timed.
+    """
+    latencies: list[float] = []
+    errors = 0
+    pending = iter(range(iterations))
+
+    async def _worker() -> None:
+        nonlocal errors
+        for iteration in pending:
+            try:
+                if setup:
+                    await setup(iteration)
+                started = time.perf_counter()
+                await call(iteration)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                errors += 1
+                print(f"Iteration {iteration} failed: {e!r}", file=sys.stderr)
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[_worker() for _ in range(max(1, concurrency))])
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def _stub_app(vendor: str, latency: stub_servers.Latency) -> typing.Any:
+    match vendor:
+        case "rami-levy":
+            return stub_servers.rami_levy_app(latency, _ACCOUNT_ID)
+        case "keshet":
+            return stub_servers.keshet_app(latency, "1219", "2725", _CART_ID)
+        case "shufersal":
+            return stub_servers.shufersal_app(latency)
+        case _:
+            raise ValueError(f"Unsupported vendor: {vendor}")
+
+
+def _configure(vendor: str, url: str) -> None:
+    """
+    Point the vendor service at the stand-in, before it is imported
+    """
+    module_name = _PROVIDERS[vendor][0].replace(".tools", "._service")
+    if module_name in sys.modules:
+        raise RuntimeError(f"{module_name} is already imported, the benchmark must configure it first")
+    os.environ.update(
+        RAMI_LEVY_URL=url,
+        RAMI_LEVY_API_URL=url,
+        KESHET_URL=url,
+        SHUFERSAL_URL=url,
+        VENDOR_ACCOUNT_ID=_ACCOUNT_ID,
+        CART_ID=_CART_ID,
+    )
+    os.environ.setdefault("VENDOR_API_KEY", "benchmark")
+
+
+@contextlib.asynccontextmanager
+async def _direct_calls(provider: typing.Any) -> typing.AsyncIterator[ToolCall]:
+    from mcp_groceries_server.server import types  # pylint: disable=import-outside-toplevel
+
+    async def _call(tool: str, arguments: dict) -> typing.Any:
+        if "items" in arguments and tool != "search_many":
+            arguments = {**arguments, "items": [types.CartItemSchema(**item) for item in arguments["items"]]}
+        return await getattr(provider, tool)(**arguments)
+
+    yield _call
+
+
+@contextlib.asynccontextmanager
+async def _mcp_calls() -> typing.AsyncIterator[ToolCall]:
+    """
+    Serve the registered tools over streamable-http on a local port and call them with an MCP client
+    """
+    from mcp import ClientSession  # pylint: disable=import-outside-toplevel
+    from mcp.client.streamable_http import streamablehttp_client  # pylint: disable=import-outside-toplevel
+
+    from mcp_groceries_server.server.mcp_server import server  # pylint: disable=import-outside-toplevel
+
+    async with stub_servers.LocalServer(server.streamable_http_app(), lifespan="on") as local:
+        async with streamablehttp_client(f"{local.url}{server.settings.streamable_http_path}") as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+
+                async def _call(tool: str, arguments: dict) -> typing.Any:
+                    result = await session.call_tool(tool, arguments)
+                    if result.isError:
+                        raise RuntimeError(" ".join(getattr(content, "text", "") for content in result.content))
+                    return result
+
+                yield _call
+
+
+async def run(
+    vendor: str,
+    mode: str = "direct",
+    items: typing.Sequence[str] = (),
+    iterations: int = 50,
+    list_iterations: int = 5,
+    concurrency: int = 4,
+    latency: float = 0.05,
+    jitter: float = 0.01,
+    seed: int = 0,
+    scenarios: typing.Sequence[str] = SCENARIOS,
+) -> dict:
+    """
+    Start the vendor stand-in, drive the provider tools through every scenario and return the report
+    """
+    if not items:
+        raise ValueError("The benchmark needs at least one item")
+
+    async with stub_servers.LocalServer(_stub_app(vendor, stub_servers.Latency(latency, jitter, seed))) as stub:
+        _configure(vendor, stub.url)
+        from mcp_groceries_server.server import cache, catalog  # pylint: disable=import-outside-toplevel
+
+        module_name, class_name = _PROVIDERS[vendor]
+        provider = getattr(importlib.import_module(module_name), class_name)()
+        # cold searches must reach the vendor, not the local catalog
+        local_search = catalog.CATALOG_LOCAL_SEARCH
+        catalog.CATALOG_LOCAL_SEARCH = False
+        report: dict[str, typing.Any] = {}
+        try:
+            ids = [products[0]["id"] for item in items if (products := await provider.search_products(item))]
+            cart_items = [dict(id=str(_id), quantity="1", selling_method="unit") for _id in ids]
+
+            async with (_mcp_calls() if mode == "mcp" else _direct_calls(provider)) as call:
+
+                async def _cold_search(iteration: int) -> typing.Any:
+                    cache.search_cache.invalidate()
+                    return await call("search", dict(item=items[iteration % len(items)]))
+
+                async def _cached_search(iteration: int) -> typing.Any:
+                    return await call("search", dict(item=items[iteration % len(items)]))
+
+                async def _add(iteration: int) -> typing.Any:
+                    return await call("add_items_to_cart", dict(items=[cart_items[iteration % len(cart_items)]]))
+
+                async def _remove(iteration: int) -> typing.Any:
+                    return await call("remove_items_from_cart", dict(items=[cart_items[iteration % len(cart_items)]]))
+
+                async def _full_list(iteration: int) -> typing.Any:
+                    cache.search_cache.invalidate()
+                    await call("search_many", dict(items=list(items)))
+                    return await call("add_items_to_cart", dict(items=cart_items))
+
+                async def _clear_cart(iteration: int) -> typing.Any:
+                    return await call("remove_items_from_cart", dict(items=cart_items))
+
+                # the setups make every timed cart call a real write, the cart mirror skips no-op writes
+                runs = dict(
+                    search=(_cold_search, iterations, None),
+                    search_cached=(_cached_search, iterations, None),
+                    add=(_add, iterations, _remove),
+                    remove=(_remove, iterations, _add),
+                    full_list=(_full_list, list_iterations, _clear_cart),
+                )
+                for scenario in scenarios:
+                    if scenario in ("add", "remove", "full_list") and vendor in BROWSER_CART_VENDORS:
+                        report[scenario] = dict(skipped="cart writes run in the vendor site browser page")
+                        continue
+                    function, count, setup = runs[scenario]
+                    if scenario == "search_cached":
+                        # warm the cache, a full cycle over the items
+                        await measure(function, len(items), concurrency)
+                    report[scenario] = await measure(function, count, concurrency, setup)
+        finally:
+            catalog.CATALOG_LOCAL_SEARCH = local_search
+            await provider.aclose()
+
+    return dict(
+        vendor=vendor,
+        mode=mode,
+        commit=_commit(),
+        timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        python=platform.python_version(),
+        settings=dict(
+            items=len(items),
+            iterations=iterations,
+            list_iterations=list_iterations,
+            concurrency=concurrency,
+            latency_ms=latency * 1000,
+            jitter_ms=jitter * 1000,
+            seed=seed,
+        ),
+        scenarios=report,
+    )
+
+
+def _commit() -> typing.Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    """
+    One line per scenario measured in both reports, with the p50/p95 change against the baseline
+    """
+    lines = []
+    for scenario, result in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario, {})
+        if "p95_ms" not in result or "p95_ms" not in previous:
+            continue
+        changes = [
+            f"{key} {previous[key]:.1f} -> {result[key]:.1f} ms ({(result[key] / previous[key] - 1) * 100:+.1f}%)"
+            for key in ("p50_ms", "p95_ms")
+            if previous[key]
+        ]
+        lines.append(f"{scenario}: " + ", ".join(changes))
+    return lines
@@ -0,0 +1,153 @@
+import asyncio
+import copy
+import json
+import os
+import random
+import socket
+import typing
+import zlib
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# recorded vendor responses, replayed by the local stand-ins of the vendor APIs
+PAYLOADS_DIR = os.path.join(os.path.dirname(__file__), "payloads")
+
+
+def load_payload(vendor: str) -> dict:
+    with open(os.path.join(PAYLOADS_DIR, f"{vendor}.json"), "r", encoding="utf-8") as payload_file:
+        return json.load(payload_file)
+
+
+class Latency:
+    """
+    Gaussian response delay in seconds, never negative. Seeded so runs are comparable.
+    """
+
+    def __init__(self, mean: float = 0.05, jitter: float = 0.01, seed: int = 0):
+        self.mean = mean
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    async def wait(self) -> None:
+        if delay := max(0.0, self._random.gauss(self.mean, self.jitter)):
+            await asyncio.sleep(delay)
+
+
+def _products_for(query: str, products: list[dict], id_key: str, name_key: str) -> list[dict]:
+    """
+    The recorded products renamed after the query, with ids stable per query so the catalog sees distinct products
+    """
+    offset = zlib.crc32(query.encode()) % 100_000 * 100
+    result = []
+    for index, product in enumerate(products):
+        product = copy.deepcopy(product)
+        _id = product[id_key]
+        product[id_key] = f"P_{offset + index}" if isinstance(_id, str) else offset + index
+        product[name_key] = f"{query} {product[name_key]}"
+        result.append(product)
+    return result
+
+
+def rami_levy_app(latency: Latency, account_id: str) -> Starlette:
+    payload = load_payload("rami-levy")
+    cart: dict[str, str] = {}
+
+    async def catalog(request: Request) -> JSONResponse:
+        await latency.wait()
+        body = await request.json()
+        return JSONResponse({**payload, "data": _products_for(body.get("q", ""), payload["data"], "id", "name")})
+
+    async def update_cart(request: Request) -> JSONResponse:
+        await latency.wait()
+        body = await request.json()
+        cart.clear()
+        cart.update({str(_id): str(quantity) for _id, quantity in (body.get("items") or {}).items()})
+        return JSONResponse({"status": "ok"})
+
+    async def get_cart(request: Request) -> JSONResponse:
+        await latency.wait()
+        return JSONResponse({"cart": {"items": cart}})
+
+    return Starlette(
+        routes=[
+            Route("/api/catalog", catalog, methods=["POST"]),
+            Route("/api/v2/cart", update_cart, methods=["POST"]),
+            Route(f"/api/v2/site/clubs/customer/{account_id}", get_cart, methods=["GET"]),
+        ]
+    )
+
+
+def keshet_app(latency: Latency, store_id: str, branch_id: str, cart_id: str) -> Starlette:
+    payload = load_payload("keshet")
+    products = payload["suggestions"]["suggestProducts"]["products"]
+    cart: dict[str, int] = {}
+
+    async def autocomplete(request: Request) -> JSONResponse:
+        await latency.wait()
+        query = request.query_params.get("query", "")
+        return JSONResponse({"suggestions": {"suggestProducts": {"products": _products_for(query, products, "id", "localName")}}})
+
+    async def patch_cart(request: Request) -> JSONResponse:
+        await latency.wait()
+        body = await request.json()
+        for line in body.get("lines", []):
+            _id = str(line["retailerProductId"])
+            if line.get("delete"):
+                cart.pop(_id, None)
+            else:
+                cart[_id] = line["quantity"]
+        return JSONResponse({"cart": {"lines": [dict(id=_id, quantity=quantity) for _id, quantity in cart.items()]}})
+
+    base = f"/v2/retailers/{store_id}/branches/{branch_id}"
+    return Starlette(
+        routes=[
+            Route(f"{base}/products/autocomplete", autocomplete, methods=["GET"]),
+            Route(f"{base}/carts/{cart_id}", patch_cart, methods=["POST"]),
+        ]
+    )
+
+
+def shufersal_app(latency: Latency) -> Starlette:
+    payload = load_payload("shufersal")
+
+    async def search(request: Request) -> JSONResponse:
+        await latency.wait()
+        query = request.query_params.get("q", "").removesuffix(":relevance")
+        return JSONResponse({"results": _products_for(query, payload["results"], "baseProduct", "baseProductDescription")})
+
+    return Starlette(routes=[Route("/online/he/search/results", search, methods=["GET"])])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """
+    Serve an app on a local port in the running event loop, until the context exits
+    """
+
+    def __init__(self, app: Starlette, port: typing.Optional[int] = None, lifespan: str = "off"):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan=lifespan))
+        self._task: typing.Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "LocalServer":
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc_info: typing.Any) -> None:
+        self._server.should_exit = True
+        if self._task:
+            await self._task
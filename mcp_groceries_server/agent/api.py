@@ -1,19 +1,134 @@
-from fastapi import FastAPI
+import contextlib
+import json
+import typing
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from mcp_groceries_server.agent.groceries_agent import GroceriesAgent
+from mcp_groceries_server.agent import jobs
+from mcp_groceries_server.agent.groceries_agent import GroceriesAgent, format_shopping_list
 
-app = FastAPI()
 agent = GroceriesAgent()
 
 class GroceriesRequest(BaseModel):
     groceries_list: list[str]
     preferences: str = ""
 
+async def _shop(payload: dict) -> dict:
+    request = GroceriesRequest(**payload)
+    result = await agent.invoke(
+        shopping_list=format_shopping_list(request.groceries_list),
+        preferences=request.preferences,
+        items=request.groceries_list,
+    )
+    return {"result": result["messages"][-1].content, "resolved": result.get("resolved", [])}
+
+job_queue = jobs.JobQueue(_shop)
+
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI) -> typing.AsyncIterator[None]:
+    yield
+    await job_queue.aclose()
+    await agent.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+# scopes the idempotency keys, and picks the vendor cart of the run with AGENT_CART_PER_USER
+UserHeader = Header(default=None, alias="X-User-Id")
+IdempotencyKeyHeader = Header(default=None, alias="Idempotency-Key")
+
+def _cart(user: typing.Optional[str]) -> str:
+    try:
+        return jobs.cart_of(user)
+    except jobs.MissingUser as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+def _submit(request: GroceriesRequest, user: typing.Optional[str], idempotency_key: typing.Optional[str]) -> tuple[jobs.Job, bool]:
+    cart = _cart(user)
+    try:
+        return job_queue.submit(user or jobs.SHARED_CART, request.model_dump(), idempotency_key, cart=cart)
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}) from e
+    except jobs.IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+def _get_job(job_id: str) -> jobs.Job:
+    if (job := job_queue.get(job_id)) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
 @app.post("/execute")
-async def execute(request: GroceriesRequest):
-    shopping_list_str = ", ".join(request.groceries_list)
-    result = await agent.invoke(shopping_list=f"<shopping_list>{shopping_list_str}</shopping_list>", preferences=request.preferences)
-    return {"result": result["messages"][-1].content}
+async def execute(request: GroceriesRequest, user: typing.Optional[str] = UserHeader, idempotency_key: typing.Optional[str] = IdempotencyKeyHeader):
+    # queued like the jobs, so inline runs respect the worker pool and the cart order too
+    job, _ = _submit(request, user, idempotency_key)
+    await job_queue.wait(job)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    return job.result
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: GroceriesRequest,
+    response: Response,
+    user: typing.Optional[str] = UserHeader,
+    idempotency_key: typing.Optional[str] = IdempotencyKeyHeader,
+):
+    """
+    Queue a shopping run, poll `/jobs/{id}` and fetch `/jobs/{id}/result`.
+    Submitting again with the same `Idempotency-Key` returns the first job (200).
+    """
+    job, created = _submit(request, user, idempotency_key)
+    response.status_code = 202 if created else 200
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job.as_dict()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return _get_job(job_id).as_dict()
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = _get_job(job_id)
+    if not job.done:
+        return JSONResponse(job.as_dict(), status_code=202, headers={"Retry-After": str(job_queue.retry_after())})
+    return job.as_dict(with_result=True)
+
+async def _ndjson(events: typing.AsyncIterator[dict]) -> typing.AsyncIterator[str]:
+    async for event in events:
+        yield json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+async def _sse(events: typing.AsyncIterator[dict]) -> typing.AsyncIterator[str]:
+    async for event in events:
+        yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+async def _serialized(cart: str, request: GroceriesRequest, reservation: jobs.Reservation) -> typing.AsyncIterator[dict]:
+    async with job_queue.running(cart, reservation):
+        async for event in agent.stream(
+            shopping_list=format_shopping_list(request.groceries_list),
+            preferences=request.preferences,
+            items=request.groceries_list,
+        ):
+            yield event
+
+@app.post("/execute/stream")
+async def execute_stream(request: GroceriesRequest, http_request: Request, user: typing.Optional[str] = UserHeader):
+    """
+    `/execute` streaming its progress as NDJSON, or as server-sent events with `Accept: text/event-stream`.
+    Disconnecting cancels the run.
+    """
+    cart = _cart(user)
+    try:
+        # counted from the admission, not once the stream starts
+        reservation = job_queue.try_reserve()
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}) from e
+    events = _serialized(cart, request, reservation)
+    # released by the run, or here when the stream never started (the client went away first)
+    release = BackgroundTask(reservation.release)
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        return StreamingResponse(_sse(events), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}, background=release)
+    return StreamingResponse(_ndjson(events), media_type="application/x-ndjson", background=release)
 
 @app.get("/health")
 def healthcheck():
@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from mcp_groceries_server.agent import fast_path  # noqa: E402
 from mcp_groceries_server.agent.groceries_agent import GroceriesAgent  # noqa: E402
 
 
@@ -19,7 +20,7 @@ def main():
     else:
         preferences = ""
     coroutine = GroceriesAgent().invoke(
-        shopping_list=grocery_list, preferences=preferences, debug=DEBUG
+        shopping_list=grocery_list, preferences=preferences, debug=DEBUG, items=fast_path.split_items(grocery_list)
     )
     result = asyncio.run(coroutine)
     logging.info("Results:\n%s", result["messages"][-1].content)
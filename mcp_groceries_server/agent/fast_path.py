@@ -0,0 +1,224 @@
+import dataclasses
+import json
+import logging
+import os
+import re
+import typing
+
+from mcp import ClientSession
+
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH_ENABLED", "true").lower() == "true"
+DEFAULT_QUANTITY = "1"
+
+logger = logging.getLogger(__name__)
+
+# "2 x milk", "milk x2", "milk ×2"
+_LEADING_QUANTITY = re.compile(r"^(\d+(?:\.\d+)?)\s*[x×*]\s*(.+)$", re.IGNORECASE)
+_TRAILING_QUANTITY = re.compile(r"^(.+?)\s*[x×*]\s*(\d+(?:\.\d+)?)$", re.IGNORECASE)
+_TOKEN = re.compile(r"[\w%.]+")
+# the per item outcome of vendors reporting them instead of the cart, "2 of P_123 added"
+_ADDED_OUTCOME = re.compile(r"^\S+ of (\S+) added$")
+
+
+class PurchaseHistory(typing.Protocol):
+    async def last_purchases(self, items: list[str]) -> dict[str, dict]:
+        """
+        Map the list items to their last purchase still available, `{"product": {...}, "quantity": ...}`.
+        Items never bought are left out.
+        """
+
+
+class McpPurchaseHistory:
+    """
+    The purchase history of the MCP server, through its `resolve_from_history` tool
+    """
+
+    def __init__(self, session: ClientSession, tool: str = "resolve_from_history"):
+        self.session = session
+        self.tool = tool
+
+    async def last_purchases(self, items: list[str]) -> dict[str, dict]:
+        result = await self.session.call_tool(self.tool, {"items": items})
+        if result.isError:
+            raise RuntimeError(f"{self.tool} failed: {result.content}")
+        return {
+            block["query"]: block
+            for block in _payload(result)
+            if isinstance(block, dict) and block.get("product") and block.get("available")
+        }
+
+
+@dataclasses.dataclass
+class Resolution:
+    item: str
+    product: dict
+    quantity: str
+    # "history" when the product was bought for the item before, "match" when it is the only product matching the item
+    reason: str
+
+    def cart_item(self) -> dict:
+        return dict(
+            id=str(self.product["id"]),
+            quantity=self.quantity,
+            selling_method=self.product.get("selling_method") or "",
+            # remembered by the server history for the next runs
+            term=parse_item(self.item)[0],
+        )
+
+    def as_dict(self) -> dict:
+        return dict(item=self.item, id=str(self.product["id"]), name=self.product.get("name"), quantity=self.quantity, reason=self.reason)
+
+
+@dataclasses.dataclass
+class FastPathResult:
+    resolved: list[Resolution] = dataclasses.field(default_factory=list)
+    # the items left to the LLM agent, as written in the list
+    leftovers: list[str] = dataclasses.field(default_factory=list)
+
+
+def split_items(shopping_list: str) -> list[str]:
+    """
+    Split a free text shopping list, one item per line or comma separated, quotes are dropped
+    """
+    items = []
+    for part in re.split(r"[\n,]", shopping_list):
+        if item := part.strip().strip("\"'").strip():
+            items.append(item)
+    return items
+
+
+def parse_item(item: str) -> tuple[str, typing.Optional[str]]:
+    """
+    The search term and quantity of a list item, only an explicit multiplier is read as a quantity
+    so "גבינה 28%" or "ביצים L 12" stay search terms. The quantity is None when not given.
+    """
+    item = item.strip()
+    if quantity_match := _LEADING_QUANTITY.match(item):
+        return quantity_match.group(2).strip(), quantity_match.group(1)
+    if quantity_match := _TRAILING_QUANTITY.match(item):
+        return quantity_match.group(1).strip(), quantity_match.group(2)
+    return item, None
+
+
+def _tokens(text: str) -> list[str]:
+    text = str(text or "").casefold().replace("׳", "'").replace("’", "'")
+    return _TOKEN.findall(text)
+
+
+def match(query: str, products: list[dict]) -> typing.Optional[dict]:
+    """
+    The only product whose name contains every word of the query, or None when the LLM should choose
+    """
+    products = [product for product in products if product.get("id") is not None and product.get("price") is not None]
+    query_tokens = set(_tokens(query))
+    if not query_tokens:
+        return None
+    candidates = [product for product in products if query_tokens <= set(_tokens(product.get("name")))]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _payload(result: typing.Any) -> list[typing.Any]:
+    """
+    The blocks of a provider tool result, `{"content": [{"type": "text", "text": block}]}`
+    """
+    payload = result.structuredContent
+    if payload is None:
+        payload = json.loads(result.content[0].text)
+    return [block["text"] for block in payload.get("content", [])]
+
+
+def _cart_ids(result: typing.Any) -> set[str]:
+    """
+    The product ids an `add_items_to_cart` result (`response_format="full"`) reports in the cart: the cart lines
+    with a quantity, or the items reported as added by vendors answering with per item outcomes
+    """
+    ids = set()
+    for block in _payload(result):
+        lines = json.loads(block) if isinstance(block, str) else block
+        for line in lines if isinstance(lines, list) else []:
+            if isinstance(line, dict):
+                try:
+                    in_cart = float(line.get("quantity") or 0) > 0
+                except (TypeError, ValueError):
+                    in_cart = True
+                if in_cart and line.get("id") is not None:
+                    ids.add(str(line["id"]))
+            elif isinstance(line, str) and (outcome := _ADDED_OUTCOME.match(line.strip())):
+                ids.add(outcome.group(1))
+    return ids
+
+
+async def resolve(
+    session: ClientSession,
+    items: list[str],
+    history: typing.Optional[PurchaseHistory] = None,
+    history_only: bool = False,
+) -> FastPathResult:
+    """
+    Resolve the unambiguous items of the list and add them to the cart in a single `add_items_to_cart` call,
+    the other items, and the items the cart update didn't add, are returned as leftovers for the LLM agent.
+    Items bought before are taken from the history without searching, the others from a single `search_many` call.
+    With `history_only` only the history is used, as when the user has preferences.
+    """
+    result = FastPathResult()
+    if not items:
+        return result
+    parsed = [parse_item(item) for item in items]
+    queries = list(dict.fromkeys(query for query, _ in parsed))
+
+    last_purchases: dict[str, dict] = {}
+    if history is not None:
+        try:
+            last_purchases = await history.last_purchases(queries)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning(f"Purchase history lookup failed: {e!r}")
+
+    products_by_query: dict[str, list[dict]] = {}
+    to_search = [query for query in queries if query not in last_purchases]
+    if to_search and not history_only:
+        search = await session.call_tool("search_many", {"items": to_search, "response_format": "full"})
+        if search.isError:
+            logger.warning(f"Fast path search failed: {search.content}")
+        else:
+            products_by_query = {
+                block["query"]: block.get("products") or [] for block in _payload(search) if isinstance(block, dict)
+            }
+
+    for item, (query, quantity) in zip(items, parsed):
+        if purchase := last_purchases.get(query):
+            product, reason = purchase["product"], "history"
+            quantity = quantity or purchase.get("quantity")
+        elif (product := match(query, products_by_query.get(query, []))) is not None:
+            reason = "match"
+        else:
+            result.leftovers.append(item)
+            continue
+        result.resolved.append(Resolution(item=item, product=product, quantity=quantity or DEFAULT_QUANTITY, reason=reason))
+
+    if result.resolved:
+        added = await session.call_tool(
+            "add_items_to_cart",
+            # the whole cart, a summary leaves out the lines that were already in the cart
+            {"items": [resolution.cart_item() for resolution in result.resolved], "response_format": "full"},
+        )
+        if added.isError:
+            logger.warning(f"Fast path cart update failed: {added.content}")
+            result.leftovers = list(items)
+            result.resolved = []
+            return result
+        in_cart = _cart_ids(added)
+        not_added = {resolution.item for resolution in result.resolved if str(resolution.product["id"]) not in in_cart}
+        if not_added:
+            logger.warning(f"Fast path cart update didn't add {sorted(not_added)}")
+            result.resolved = [resolution for resolution in result.resolved if resolution.item not in not_added]
+            result.leftovers = [item for item in items if item in not_added or item in result.leftovers]
+    return result
+
+
+def summarize(resolved: list[Resolution]) -> str:
+    """
+    The "Added Items" section of the agent conclusion for the resolved items
+    """
+    lines = ["#### Added Items", ""]
+    lines.extend(f"- {resolution.product.get('name')} ({resolution.product['id']}) x {resolution.quantity}" for resolution in resolved)
+    return "\n".join(lines)
@@ -1,18 +1,19 @@
  
 import asyncio
+import contextlib
+import json
 import os
+import typing
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_mcp_adapters.tools import load_mcp_tools
 from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
 from mcp import ClientSession
-from mcp.client.streamable_http import streamablehttp_client
 from rich.console import Console
 from google.api_core.exceptions import ResourceExhausted
 from logging import getLogger
-from mcp_groceries_server.agent import variables
+from mcp_groceries_server.agent import fast_path, session_pool, variables
 from langchain.callbacks.base import BaseCallbackHandler
 from langchain.schema import AgentAction, AgentFinish
+from langchain_core.messages import AIMessage
 
 logger = getLogger()
 
@@ -85,65 +86,247 @@ def create_llm_client(model_id: str):
     raise ValueError(f"Invalid llm model {model_id}")
 
 
+PROGRESS_TOOLS = ("search_many", "search", "add_items_to_cart", "remove_items_from_cart", "resolve_from_history", "compare_prices")
+
+
+def _tool_blocks(output: typing.Any) -> list[typing.Any]:
+    """
+    The blocks of a provider tool output, `{"content": [{"type": "text", "text": block}]}` serialized by the MCP server
+    """
+    content = getattr(output, "content", output)
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    try:
+        payload = json.loads(content) if isinstance(content, str) else content
+    except ValueError:
+        return []
+    if not isinstance(payload, dict):
+        return []
+    return [block.get("text") for block in payload.get("content", []) if isinstance(block, dict)]
+
+
+def _count_products(products: typing.Any) -> int:
+    if isinstance(products, dict):  # compact
+        return len(products.get("rows", []))
+    if isinstance(products, str):  # tsv, with a header line
+        return max(0, len(products.splitlines()) - 1)
+    return len(products or [])
+
+
+def progress_events(event: dict) -> list[dict]:
+    """
+    Translate a LangGraph `astream_events` (v2) event into the streamed progress events:
+    `searched` per search term, `added` / `removed` per cart update, `tool_start` / `tool_end` for the other tools
+    and `message_delta` for the model text
+    """
+    kind = event.get("event")
+    name = event.get("name", "")
+    data = event.get("data") or {}
+    if kind == "on_chat_model_stream":
+        text = getattr(data.get("chunk"), "content", "")
+        return [dict(event="message_delta", text=text)] if isinstance(text, str) and text else []
+    if kind not in ("on_tool_start", "on_tool_end"):
+        return []
+    # the tools of a vendor are prefixed with it in multi-vendor mode
+    tool = next((known for known in PROGRESS_TOOLS if name == known or name.endswith(f"_{known}")), name)
+    tool_input = data.get("input") or {}
+    if kind == "on_tool_start":
+        return [dict(event="tool_start", tool=name, input=tool_input)]
+    if tool in ("search", "search_many"):
+        events = []
+        for block in _tool_blocks(data.get("output")):
+            if isinstance(block, dict) and "query" in block:
+                events.append(dict(event="searched", tool=name, query=block["query"], products=_count_products(block.get("products")), error=block.get("error")))
+            elif tool == "search":
+                events.append(dict(event="searched", tool=name, query=tool_input.get("item"), products=_count_products(block)))
+        return events
+    if tool in ("add_items_to_cart", "remove_items_from_cart"):
+        event_name = "added" if tool == "add_items_to_cart" else "removed"
+        return [dict(event=event_name, tool=name, items=tool_input.get("items", []))]
+    return [dict(event="tool_end", tool=name)]
+
+
+async def _authorize(session: ClientSession) -> None:
+    """
+    Try to log the user in before each run, the server skips it while the login was validated recently
+    """
+    try:
+        async with asyncio.timeout(60):
+            logger.info("going to try to login")
+            await session.call_tool("user_authorization")
+    except Exception as e:
+        logger.warning(f"Authorization failed with an error: {e}")
+
+
+def format_shopping_list(items: list[str]) -> str:
+    return f"<shopping_list>{', '.join(items)}</shopping_list>"
+
+
 class GroceriesAgent:
-    def __init__(self):
+    def __init__(
+        self,
+        history: typing.Optional[fast_path.PurchaseHistory] = None,
+        pool: typing.Optional[session_pool.SessionPool] = None,
+    ):
         self._model = create_llm_client(variables.MODEL_ID) 
         self.console = Console()
+        # consulted by the fast path, the product bought last time for an item is added without the LLM.
+        # The server `resolve_from_history` tool is used when not given
+        self.history = history
+        self.pool = pool or session_pool.SessionPool(MCP_ENDPOINT)
+
+    @contextlib.asynccontextmanager
+    async def _session(self, debug: bool = False) -> typing.AsyncIterator[tuple[ClientSession, list, typing.Any]]:
+        """
+        A warm MCP session from the pool, with its tools and compiled agent graph
+        """
+        async with self.pool.session() as pooled:
+            # pooled sessions outlive the vendor login, so it is checked per run and not per connection
+            await _authorize(pooled.session)
+            if debug:
+                self.console.log(f"[bold yellow]Available tools:[/bold yellow] {len(pooled.tools)} tools loaded")
+                for tool in pooled.tools:
+                    self.console.log(f"  - [dim]{tool.name}[/dim]: {tool.description[:80]}...")
+            yield pooled.session, pooled.tools, pooled.graph(self._model)
+
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+
+    async def _prepare(
+        self,
+        session: ClientSession,
+        tools: list,
+        shopping_list: str,
+        preferences: str,
+        items: typing.Optional[list[str]],
+    ) -> tuple[fast_path.FastPathResult, typing.Optional[list[str]]]:
+        """
+        Run the fast path, then build the agent prompts for the leftovers. The prompts are None when nothing is left.
+        """
+        fast = fast_path.FastPathResult(leftovers=list(items or []))
+        tool_names = {tool.name for tool in tools}
+        if items and fast_path.FAST_PATH_ENABLED and {"search_many", "add_items_to_cart"} <= tool_names:
+            history = self.history
+            if history is None and "resolve_from_history" in tool_names:
+                history = fast_path.McpPurchaseHistory(session)
+            fast = await fast_path.resolve(
+                session, items, history=history, history_only=bool(preferences.strip())
+            )
+            self.console.log(f"GroceriesAgent: {len(fast.resolved)}/{len(items)} items added without the LLM")
+            if not fast.leftovers:
+                return fast, None
+            shopping_list = format_shopping_list(fast.leftovers)
+
+        prompts_result = await session.get_prompt(
+            "start_shopping",
+            arguments={
+                "shopping_list": shopping_list,
+                "preferences": preferences,
+                "already_in_cart": ", ".join(
+                    f"{resolution.product.get('name')} ({resolution.product['id']})" for resolution in fast.resolved
+                ),
+            },
+        )
+        return fast, [msg.content.text for msg in prompts_result.messages]
 
     async def invoke(
-        self, shopping_list: str, *, preferences: str = "", debug: bool = False
+        self,
+        shopping_list: str,
+        *,
+        preferences: str = "",
+        debug: bool = False,
+        items: typing.Optional[list[str]] = None,
     ) -> dict:
+        """
+        Shop the list. When the items are given, the unambiguous ones are resolved and added to the cart
+        without the LLM (see `fast_path`), which only gets the leftovers. The result has the agent messages
+        and the `resolved` items.
+        """
         self.console.log("GroceriesAgent: Starting shopping session...")
         with self.console.status("[bold green] Start shopping") as status:
-            # async with stdio_client(main_server_params) as (read, write), stdio_client(shufersal_server_params) as (sread, swrite) :
-            #     async with ClientSession(read, write) as session, ClientSession(sread, swrite) as shufersal_session:
-            async with streamablehttp_client(MCP_ENDPOINT, timeout=60 * 60) as (read, write, _):
-                async with ClientSession(read, write) as session:
-                    # sessions = [session, shufersal_session]
-                    # await asyncio.gather(*[session.initialize() for session in sessions])
-                    await session.initialize()
-
-                    # Get tools
-                    # tools_session = shufersal_session if vendor == "shufersal" else session
-                    tools_session = session
-                    tools = await load_mcp_tools(tools_session)
-                    
-                    if debug:
-                        self.console.log(f"[bold yellow]Available tools:[/bold yellow] {len(tools)} tools loaded")
-                        for tool in tools:
-                            self.console.log(f"  - [dim]{tool.name}[/dim]: {tool.description[:80]}...")
-                    
-                    try:
-                        async with asyncio.timeout(60):
-                            logger.info("going to try to login")
-                            await session.call_tool("user_authorization")
-                    except Exception as e:
-                        logger.warning(f"Authorization failed with an error: {e}")
-
-                    prompts_result = await session.get_prompt(
-                        "start_shopping",
-                        arguments={
-                            "shopping_list": shopping_list,
-                            "preferences": preferences,
-                        },
+            async with self._session(debug) as (session, tools, agent):
+                status.update(status="[bold green] Adding the unambiguous items...")
+                fast, prompts = await self._prepare(session, tools, shopping_list, preferences, items)
+                resolved = [resolution.as_dict() for resolution in fast.resolved]
+                if prompts is None:
+                    return {"messages": [AIMessage(content=fast_path.summarize(fast.resolved))], "resolved": resolved}
+
+                config = {"recursion_limit": 100}
+                
+                status.update(status="[bold green] Shopping for groceries...")
+                if debug:
+                    result = await agent.with_retry(
+                        retry_if_exception_type=(ResourceExhausted,)
+                    ).ainvoke(
+                        {"messages": prompts}, config, callbacks=[AgentDebugCallback(self.console)]
                     )
-                    prompts = [msg.content.text for msg in prompts_result.messages]
-                    agent = create_react_agent(self._model, tools) 
-                    
-                    config = {"recursion_limit": 100}
-                    
-                    status.update(status="[bold green] Shopping for groceries...")
-                    if debug:
-                        result = await agent.with_retry(
-                            retry_if_exception_type=(ResourceExhausted,)
-                        ).ainvoke(
-                            {"messages": prompts}, config, callbacks=[AgentDebugCallback(self.console)]
-                        )
-                    else:
-                        result = await agent.with_retry(
-                            retry_if_exception_type=(ResourceExhausted,)
-                        ).ainvoke(
-                            {"messages": prompts}, config
-                        )
-                    status.update(status="[bold green] Shopping completed!")
-                    return result
+                else:
+                    result = await agent.with_retry(
+                        retry_if_exception_type=(ResourceExhausted,)
+                    ).ainvoke(
+                        {"messages": prompts}, config
+                    )
+                status.update(status="[bold green] Shopping completed!")
+                result["resolved"] = resolved
+                return result
+
+    async def _run_streaming(
+        self,
+        shopping_list: str,
+        preferences: str,
+        items: typing.Optional[list[str]],
+        emit: typing.Callable[[dict], None],
+    ) -> None:
+        async with self._session() as (session, tools, agent):
+            fast, prompts = await self._prepare(session, tools, shopping_list, preferences, items)
+            resolved = [resolution.as_dict() for resolution in fast.resolved]
+            if items:
+                emit(dict(event="fast_path", resolved=resolved, leftovers=fast.leftovers))
+            if prompts is None:
+                emit(dict(event="result", result=fast_path.summarize(fast.resolved), resolved=resolved))
+                return
+
+            final: typing.Optional[dict] = None
+            async for event in agent.astream_events({"messages": prompts}, {"recursion_limit": 100}, version="v2"):
+                for progress in progress_events(event):
+                    emit(progress)
+                if event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                    final = event["data"].get("output")
+            messages = (final or {}).get("messages") or []
+            emit(dict(event="result", result=messages[-1].content if messages else "", resolved=resolved))
+
+    async def stream(
+        self,
+        shopping_list: str,
+        *,
+        preferences: str = "",
+        items: typing.Optional[list[str]] = None,
+    ) -> typing.AsyncIterator[dict]:
+        """
+        Shop the list like `invoke`, yielding progress events (see `progress_events`) as they happen and
+        the final `result` event, or an `error` event. The run is cancelled when the consumer stops iterating,
+        e.g. when the client disconnects, so abandoned runs stop calling the vendors.
+        Unlike `invoke`, the model call is not retried on `ResourceExhausted` since the events were already sent.
+        """
+        queue: asyncio.Queue[typing.Optional[dict]] = asyncio.Queue()
+
+        async def _produce() -> None:
+            try:
+                await self._run_streaming(shopping_list, preferences, items, queue.put_nowait)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning(f"Streamed shopping run failed: {e!r}")
+                queue.put_nowait(dict(event="error", error=str(e) or type(e).__name__))
+            finally:
+                queue.put_nowait(None)
+
+        # the run has its own task, so it is cancelled (and its MCP session closed) from where it was entered
+        task = asyncio.create_task(_produce())
+        queue.put_nowait(dict(event="start"))
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            if not task.done():
+                logger.info("Stream consumer went away, cancelling the shopping run")
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
@@ -0,0 +1,263 @@
+import asyncio
+import contextlib
+import dataclasses
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+import typing
+import uuid
+
+# concurrent shopping runs, each one drives an MCP session and an LLM loop
+AGENT_WORKERS = int(os.environ.get("AGENT_WORKERS", "2"))
+# runs waiting for a worker before new ones are refused with 429
+AGENT_QUEUE_SIZE = int(os.environ.get("AGENT_QUEUE_SIZE", "16"))
+# the MCP server shops with a single vendor account, so every run changes the same cart and runs are serialized.
+# Set it when each X-User-Id is served its own vendor account and cart, the runs of different users then overlap
+AGENT_CART_PER_USER = os.environ.get("AGENT_CART_PER_USER", "false").lower() == "true"
+# the cart of the single vendor account, and the user of requests without X-User-Id
+SHARED_CART = "default"
+# how long finished jobs (and their idempotency keys) are kept
+JOB_TTL = float(os.environ.get("JOB_TTL", "3600"))
+# expected run duration until one was measured, for the Retry-After estimate
+JOB_EXPECTED_DURATION = float(os.environ.get("JOB_EXPECTED_DURATION", "60"))
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many shopping runs in progress, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+class MissingUser(Exception):
+    pass
+
+
+def cart_of(user: typing.Optional[str]) -> str:
+    """
+    The vendor cart the runs of `user` change, the runs of a cart are serialized
+    """
+    if not AGENT_CART_PER_USER:
+        return SHARED_CART
+    if not user:
+        raise MissingUser("X-User-Id is required, each user has their own vendor cart (AGENT_CART_PER_USER)")
+    return user
+
+
+class Reservation:
+    """
+    A run admitted by `JobQueue.try_reserve`, counted as pending until released
+    """
+
+    def __init__(self, release: typing.Callable[[], None]):
+        self._release = release
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self._release()
+
+
+@dataclasses.dataclass
+class Job:
+    id: str
+    user: str
+    payload: dict
+    fingerprint: str
+    cart: str = SHARED_CART
+    idempotency_key: typing.Optional[str] = None
+    status: str = "queued"  # queued, running, succeeded, failed
+    created_at: float = dataclasses.field(default_factory=time.time)
+    started_at: typing.Optional[float] = None
+    finished_at: typing.Optional[float] = None
+    result: typing.Optional[dict] = None
+    error: typing.Optional[str] = None
+    finished: asyncio.Event = dataclasses.field(default_factory=asyncio.Event, repr=False, compare=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def as_dict(self, with_result: bool = False) -> dict:
+        job = dict(
+            id=self.id,
+            user=self.user,
+            status=self.status,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error=self.error,
+        )
+        if with_result:
+            job["result"] = self.result
+        return job
+
+
+def fingerprint(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class JobQueue:
+    """
+    Runs shopping jobs in the background on a bounded pool of `workers`.
+    Runs of the same vendor cart are serialized, FIFO. A job submitted again by a user with the same
+    idempotency key returns the first one. When `max_queued` runs are already waiting, `QueueFull` is raised
+    with a Retry-After estimate.
+    """
+
+    def __init__(
+        self,
+        run: typing.Callable[[dict], typing.Awaitable[dict]],
+        workers: int = AGENT_WORKERS,
+        max_queued: int = AGENT_QUEUE_SIZE,
+        ttl: float = JOB_TTL,
+        clock: typing.Callable[[], float] = time.time,
+    ):
+        self._run = run
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._clock = clock
+        self._slots = asyncio.Semaphore(workers)
+        self._cart_locks: dict[str, asyncio.Lock] = {}
+        self._cart_runs: dict[str, int] = {}
+        # admitted runs, waiting or running
+        self._pending = 0
+        self._durations: list[float] = []
+        self._jobs: dict[str, Job] = {}
+        self._keys: dict[tuple[str, str], str] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a worker is likely to be free for a new run
+        """
+        duration = sum(self._durations) / len(self._durations) if self._durations else JOB_EXPECTED_DURATION
+        waves = max(1, self._pending - self.workers + 1) / self.workers
+        return max(1, math.ceil(duration * waves))
+
+    def _unreserve(self) -> None:
+        self._pending -= 1
+
+    def try_reserve(self) -> Reservation:
+        """
+        Admit a run, or raise `QueueFull` when `max_queued` runs are already waiting. The check and the count
+        happen at once, so concurrent requests can't all pass the check before one of them is counted
+        """
+        if self._pending >= self.workers + self.max_queued:
+            raise QueueFull(self.retry_after())
+        self._pending += 1
+        return Reservation(self._unreserve)
+
+    @contextlib.asynccontextmanager
+    async def running(self, cart: str, reservation: typing.Optional[Reservation] = None) -> typing.AsyncIterator[None]:
+        """
+        Hold a worker for a run changing `cart`, after the previous runs of the cart. The cart lock is taken first
+        so a run waiting for the cart doesn't hold a worker. The run is counted under its `reservation`, released
+        when it ends, or admitted regardless of the capacity when not given.
+        """
+        if reservation is None:
+            self._pending += 1
+            reservation = Reservation(self._unreserve)
+        lock = self._cart_locks.setdefault(cart, asyncio.Lock())
+        self._cart_runs[cart] = self._cart_runs.get(cart, 0) + 1
+        try:
+            async with lock, self._slots:
+                started = time.monotonic()
+                try:
+                    yield
+                finally:
+                    self._durations = (self._durations + [time.monotonic() - started])[-20:]
+        finally:
+            reservation.release()
+            self._cart_runs[cart] -= 1
+            if not self._cart_runs[cart]:
+                del self._cart_runs[cart]
+                del self._cart_locks[cart]
+
+    def submit(
+        self,
+        user: str,
+        payload: dict,
+        idempotency_key: typing.Optional[str] = None,
+        cart: typing.Optional[str] = None,
+    ) -> tuple[Job, bool]:
+        """
+        Queue a job changing `cart` (`cart_of(user)` by default), returns it and whether it was created
+        (False when the idempotency key of the user is known)
+        """
+        self._prune()
+        payload_fingerprint = fingerprint(payload)
+        if idempotency_key and (job_id := self._keys.get((user, idempotency_key))):
+            job = self._jobs[job_id]
+            if job.fingerprint != payload_fingerprint:
+                raise IdempotencyConflict(f"Idempotency key {idempotency_key} was used for another request")
+            return job, False
+
+        reservation = self.try_reserve()
+        job = Job(
+            id=uuid.uuid4().hex,
+            user=user,
+            payload=payload,
+            fingerprint=payload_fingerprint,
+            cart=cart or cart_of(user),
+            idempotency_key=idempotency_key,
+            created_at=self._clock(),
+        )
+        self._jobs[job.id] = job
+        if idempotency_key:
+            self._keys[(user, idempotency_key)] = job.id
+        task = asyncio.create_task(self._execute(job, reservation))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job, True
+
+    async def _execute(self, job: Job, reservation: Reservation) -> None:
+        async with self.running(job.cart, reservation):
+            job.status, job.started_at = "running", self._clock()
+            try:
+                job.result = await self._run(job.payload)
+                job.status = "succeeded"
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "cancelled"
+                raise
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning(f"Job {job.id} failed: {e!r}")
+                job.status, job.error = "failed", str(e) or type(e).__name__
+            finally:
+                job.finished_at = self._clock()
+                job.finished.set()
+
+    def get(self, job_id: str) -> typing.Optional[Job]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job: Job) -> Job:
+        # the job keeps running when the waiter is cancelled, its result stays available
+        await job.finished.wait()
+        return job
+
+    def _prune(self) -> None:
+        oldest = self._clock() - self.ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished_at is not None and job.finished_at < oldest:
+                del self._jobs[job_id]
+                if job.idempotency_key:
+                    self._keys.pop((job.user, job.idempotency_key), None)
+
+    async def aclose(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
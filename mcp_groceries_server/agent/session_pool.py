@@ -0,0 +1,166 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import os
+import time
+import typing
+
+from langchain_mcp_adapters.tools import load_mcp_tools
+from langgraph.prebuilt import create_react_agent
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+# one warm session per concurrent run
+MCP_SESSION_POOL_SIZE = int(os.environ.get("MCP_SESSION_POOL_SIZE", os.environ.get("AGENT_WORKERS", "2")))
+# an idle session is pinged before being handed out again
+MCP_SESSION_PING_AFTER = float(os.environ.get("MCP_SESSION_PING_AFTER", "30"))
+MCP_SESSION_PING_TIMEOUT = float(os.environ.get("MCP_SESSION_PING_TIMEOUT", "5"))
+MCP_SESSION_CONNECT_TIMEOUT = float(os.environ.get("MCP_SESSION_CONNECT_TIMEOUT", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    """
+    An initialized MCP session with its tools, owned by a background task: the transport is entered and
+    exited in the same task, whichever run uses the session.
+    """
+
+    def __init__(self, endpoint: str, on_connect: typing.Optional[typing.Callable[[ClientSession], typing.Awaitable[None]]] = None):
+        self.endpoint = endpoint
+        self._on_connect = on_connect
+        self.session: typing.Optional[ClientSession] = None
+        self.tools: list = []
+        self.idle_since = time.monotonic()
+        self.closed = False
+        self._graphs: dict[int, typing.Any] = {}
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: typing.Optional[BaseException] = None
+        self._task: typing.Optional[asyncio.Task] = None
+
+    async def open(self) -> "PooledSession":
+        self._task = asyncio.create_task(self._own())
+        try:
+            async with asyncio.timeout(MCP_SESSION_CONNECT_TIMEOUT):
+                await self._ready.wait()
+        except BaseException:
+            self.close()
+            raise
+        if self._error is not None:
+            raise self._error
+        return self
+
+    async def _own(self) -> None:
+        try:
+            async with streamablehttp_client(self.endpoint, timeout=60 * 60) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.tools = await load_mcp_tools(session)
+                    if self._on_connect is not None:
+                        await self._on_connect(session)
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if not self._ready.is_set():
+                self._error = e
+            else:
+                logger.warning(f"MCP session to {self.endpoint} failed: {e!r}")
+        finally:
+            self.closed = True
+            self._ready.set()
+
+    def graph(self, model: typing.Any) -> typing.Any:
+        """
+        The ReAct graph of `model` over the session tools, compiled once per session
+        """
+        if id(model) not in self._graphs:
+            self._graphs[id(model)] = create_react_agent(model, self.tools)
+        return self._graphs[id(model)]
+
+    async def healthy(self) -> bool:
+        if self.closed or self.session is None:
+            return False
+        if time.monotonic() - self.idle_since < MCP_SESSION_PING_AFTER:
+            return True
+        try:
+            async with asyncio.timeout(MCP_SESSION_PING_TIMEOUT):
+                await self.session.send_ping()
+            return True
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.info(f"Dropping the MCP session, ping failed: {e!r}")
+            return False
+
+    def close(self) -> None:
+        self.closed = True
+        self._closing.set()
+        if self._task is not None and not self._ready.is_set():
+            self._task.cancel()
+
+    async def aclose(self) -> None:
+        self.close()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class SessionPool:
+    """
+    Warm MCP sessions to `endpoint`, at most `size`, one per run. A session is reconnected when its
+    ping fails and dropped when the run using it fails or is cancelled.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        size: int = MCP_SESSION_POOL_SIZE,
+        on_connect: typing.Optional[typing.Callable[[ClientSession], typing.Awaitable[None]]] = None,
+        session_factory: typing.Callable[..., PooledSession] = PooledSession,
+    ):
+        self.endpoint = endpoint
+        self.size = size
+        self._on_connect = on_connect
+        self._session_factory = session_factory
+        self._idle: collections.deque[PooledSession] = collections.deque()
+        self._sessions: set[PooledSession] = set()
+        self._slots = asyncio.Semaphore(size)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def _acquire(self) -> PooledSession:
+        while self._idle:
+            pooled = self._idle.pop()
+            if await pooled.healthy():
+                return pooled
+            await self._discard(pooled)
+        pooled = await self._session_factory(self.endpoint, self._on_connect).open()
+        self._sessions.add(pooled)
+        return pooled
+
+    async def _discard(self, pooled: PooledSession) -> None:
+        self._sessions.discard(pooled)
+        await pooled.aclose()
+
+    @contextlib.asynccontextmanager
+    async def session(self) -> typing.AsyncIterator[PooledSession]:
+        async with self._slots:
+            pooled = await self._acquire()
+            try:
+                yield pooled
+            except BaseException:
+                # the session may have requests in flight or a broken transport
+                self._sessions.discard(pooled)
+                pooled.close()
+                raise
+            if pooled.closed:
+                self._sessions.discard(pooled)
+            else:
+                pooled.idle_since = time.monotonic()
+                self._idle.append(pooled)
+
+    async def aclose(self) -> None:
+        sessions, self._sessions = list(self._sessions), set()
+        self._idle.clear()
+        await asyncio.gather(*[pooled.aclose() for pooled in sessions], return_exceptions=True)
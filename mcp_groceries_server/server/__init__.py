@@ -4,7 +4,7 @@ import os
 
 from mcp_groceries_server.server.prompts import shopping_prompts
 
-from mcp_groceries_server.server.mcp_server import server
+from mcp_groceries_server.server.mcp_server import run, server
 
 
 class Vendors(enum.Enum):
@@ -13,34 +13,45 @@ class Vendors(enum.Enum):
     Shufersal = "shufersal"
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Groceries MCP Server")
-    parser.add_argument("--vendor", help="The vendor to work against", default="")
-    parser.add_argument("--transport", help="the mcp transport protocol", choices=["streamable-http", "stdio", "sse"], default="streamable-http")
-    
-    args = parser.parse_args()
-    
-    vendor = args.vendor or os.environ.get("VENDOR")
-    transport = args.transport
+def load_provider(vendor: str, namespace: str = ""):
     match vendor:
         case Vendors.RamiLevy.value:
             from mcp_groceries_server.server.providers.rami_levy.tools import RamiLevyProvider  # pylint: disable=import-outside-toplevel
-            RamiLevyProvider()
+            return RamiLevyProvider(namespace)
         case Vendors.Keshet.value:
             from mcp_groceries_server.server.providers.keshet.tools import KeshetProvider  # pylint: disable=import-outside-toplevel
-            KeshetProvider()
+            return KeshetProvider(namespace)
         case Vendors.Shufersal.value:
             from mcp_groceries_server.server.providers.shufersal.tools import ShufersalProvider  # pylint: disable=import-outside-toplevel
-            ShufersalProvider()
+            return ShufersalProvider(namespace)
         case _:
             raise ValueError(f"Unsupported vendor: {vendor}")
-    
-    server.run(transport=transport)
-    # server.run(transport="stdio")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Groceries MCP Server")
+    parser.add_argument("--vendor", help="The vendor to work against, comma separated to serve several vendors", default="")
+    parser.add_argument("--transport", help="the mcp transport protocol", choices=["streamable-http", "stdio", "sse"], default="streamable-http")
+
+    args = parser.parse_args()
+    # loaded before the providers are imported, so their settings see the .env values
+    from dotenv import load_dotenv  # pylint: disable=import-outside-toplevel
+    load_dotenv()
+
+    vendors = [vendor.strip() for vendor in (args.vendor or os.environ.get("VENDOR", "")).split(",") if vendor.strip()]
+    transport = args.transport
+    if len(vendors) == 1:
+        load_provider(vendors[0])
+    elif vendors:
+        # namespaced tools (rami_levy_search, keshet_search, ...) sharing the connection pools and caches
+        from mcp_groceries_server.server.providers import compare  # pylint: disable=import-outside-toplevel
+        compare.register([load_provider(vendor, vendor.replace("-", "_")) for vendor in dict.fromkeys(vendors)])
+    else:
+        raise ValueError("No vendor, set --vendor or VENDOR")
+
+    run(transport=transport)
 
 
 
 if __name__ == "__main__":
-    from mcp_groceries_server.server.providers.shufersal.tools import ShufersalProvider  # pylint: disable=import-outside-toplevel
-    ShufersalProvider()
-    server.run(transport="streamable-http")
\ No newline at end of file
+    main()
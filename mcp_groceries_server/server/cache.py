@@ -0,0 +1,128 @@
+import asyncio
+import collections
+import os
+import time
+import typing
+
+from mcp_groceries_server.server import metrics
+
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "900"))
+
+T = typing.TypeVar("T")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search term so equivalent queries share a cache entry
+    """
+    query = query.replace("׳", "'").replace("’", "'")  # geresh / typographic apostrophe
+    return " ".join(query.casefold().split())
+
+
+class TTLCache(typing.Generic[T]):
+    """
+    Size bounded LRU cache with per entry time-to-live.
+    Concurrent loads of the same key are deduplicated so only one of them reaches the loader.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: collections.OrderedDict[typing.Hashable, tuple[float, T]] = collections.OrderedDict()
+        self._inflight: dict[typing.Hashable, asyncio.Future[T]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: typing.Hashable) -> typing.Optional[T]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: typing.Hashable, value: T) -> None:
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: typing.Optional[typing.Hashable] = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get_or_load(
+        self, key: typing.Hashable, loader: typing.Callable[[], typing.Awaitable[T]]
+    ) -> T:
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        while (inflight := self._inflight.get(key)) is not None:
+            try:
+                value = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # the loading caller was cancelled (its timeout, a client disconnect), not this one: load again
+                continue
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        future: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark the exception as retrieved when no other caller waits on it
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict[str, typing.Any]:
+        total = self.hits + self.misses
+        return dict(
+            size=len(self),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=self.hits / total if total else 0.0,
+        )
+
+
+search_cache: TTLCache[list[dict]] = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+metrics.callback(
+    "groceries_search_cache_lookups_total",
+    "Search cache lookups by result",
+    ("result",),
+    lambda: [(("hit",), search_cache.hits), (("miss",), search_cache.misses)],
+    kind="counter",
+)
+metrics.callback("groceries_search_cache_entries", "Search cache entries", (), lambda: [((), len(search_cache))])
@@ -0,0 +1,244 @@
+import asyncio
+import dataclasses
+import os
+import time
+import typing
+
+from mcp_groceries_server.server import types
+
+CART_MIRROR_TTL = float(os.environ.get("CART_MIRROR_TTL", "300"))
+# vendors writing the whole cart (Rami Levy) fetch it again before a write once the mirror is older, so changes made
+# on the website or the app in the meantime are not overwritten. Writes refresh the mirror, so the writes of a run
+# follow each other without a fetch
+CART_WRITE_MAX_AGE = float(os.environ.get("CART_WRITE_MAX_AGE", str(CART_MIRROR_TTL / 5)))
+# seconds a cart write waits for concurrent updates to merge them into a single vendor write
+CART_COALESCE_WINDOW = float(os.environ.get("CART_COALESCE_WINDOW", "0.01"))
+
+Desired = typing.Callable[[dict[str, str]], dict[str, str]]
+Write = typing.Callable[["CartDelta", dict[str, str]], typing.Awaitable[typing.Optional["CartSnapshot"]]]
+
+
+@dataclasses.dataclass
+class CartSnapshot:
+    """
+    The cart lines as reported by the vendor, mapping product id to quantity
+    """
+
+    lines: dict[str, str]
+    version: typing.Optional[str] = None
+
+
+@dataclasses.dataclass
+class CartDelta:
+    added: dict[str, str] = dataclasses.field(default_factory=dict)
+    changed: dict[str, str] = dataclasses.field(default_factory=dict)
+    removed: list[str] = dataclasses.field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+    @property
+    def upserts(self) -> dict[str, str]:
+        return {**self.added, **self.changed}
+
+    def as_lines(self) -> list[dict]:
+        """
+        The changed lines with their new quantity, "0" for the removed ones
+        """
+        return [dict(id=_id, quantity=quantity) for _id, quantity in self.upserts.items()] + [
+            dict(id=_id, quantity="0") for _id in self.removed
+        ]
+
+
+def diff(current: dict[str, str], desired: dict[str, str]) -> CartDelta:
+    """
+    Compute the minimal set of line changes that turns `current` into `desired`
+    """
+    delta = CartDelta()
+    for _id, quantity in desired.items():
+        if not _is_positive(quantity):
+            if _id in current:
+                delta.removed.append(_id)
+        elif _id not in current:
+            delta.added[_id] = quantity
+        elif _normalize_quantity(current[_id]) != _normalize_quantity(quantity):
+            delta.changed[_id] = quantity
+    delta.removed.extend(_id for _id in current if _id not in desired)
+    return delta
+
+
+def _normalize_quantity(quantity: str) -> float:
+    try:
+        return float(quantity)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _is_positive(quantity: str) -> bool:
+    return _normalize_quantity(quantity) > 0
+
+
+@dataclasses.dataclass
+class CartUpdate:
+    """
+    The cart after an update, and the lines the update changed in it
+    """
+
+    cart: list[dict]
+    changed: list[dict]
+
+
+@dataclasses.dataclass
+class _PendingUpdate:
+    desired: Desired
+    write: Write
+    result: asyncio.Future
+
+
+class CartMirror:
+    """
+    In-process mirror of a vendor cart.
+    Writes only send the delta between the mirror and the requested cart. The mirror is re-synced
+    from the vendor only when it expires or a write fails, and adopts the cart (and version) the vendor
+    reports in a write response.
+    Updates are serialized, so concurrent read-modify-write cycles don't lose each other's lines, and the
+    updates requested within `coalesce_window` seconds are merged into a single vendor write.
+    With `write_max_age`, writes re-sync a mirror older than that first (for vendors writing the whole cart).
+    """
+
+    def __init__(
+        self,
+        fetch: typing.Callable[[], typing.Awaitable[CartSnapshot]],
+        ttl: float = CART_MIRROR_TTL,
+        clock: typing.Callable[[], float] = time.monotonic,
+        coalesce_window: float = CART_COALESCE_WINDOW,
+        write_max_age: typing.Optional[float] = None,
+    ):
+        self._fetch = fetch
+        self._ttl = ttl
+        self._clock = clock
+        self._coalesce_window = coalesce_window
+        self._write_max_age = write_max_age
+        self._snapshot: typing.Optional[CartSnapshot] = None
+        self._synced_at = 0.0
+        self._lock = asyncio.Lock()
+        self._pending: list[_PendingUpdate] = []
+
+    @property
+    def is_stale(self) -> bool:
+        return self._is_older_than(self._ttl)
+
+    def _is_older_than(self, max_age: float) -> bool:
+        return self._snapshot is None or self._clock() - self._synced_at > max_age
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    async def sync(self) -> CartSnapshot:
+        self._adopt(await self._fetch())
+        return typing.cast(CartSnapshot, self._snapshot)
+
+    async def snapshot(self) -> CartSnapshot:
+        if self.is_stale:
+            return await self.sync()
+        return typing.cast(CartSnapshot, self._snapshot)
+
+    def _adopt(self, snapshot: CartSnapshot) -> None:
+        self._snapshot = snapshot
+        self._synced_at = self._clock()
+
+    async def update(self, desired: Desired, write: Write) -> list[dict]:
+        """
+        Apply a change to the cart, see `apply`. Returns the resulting cart
+        """
+        return (await self.apply(desired, write)).cart
+
+    async def apply(self, desired: Desired, write: Write) -> CartUpdate:
+        """
+        Apply a change to the cart.
+
+        `desired` receives the current lines and returns the requested lines.
+        `write` receives the delta and the full requested lines (for vendors that only accept the whole cart),
+        and may return the cart reported by the vendor in the write response.
+        Concurrent updates are applied in order on top of each other and sent in one write, every caller
+        gets the resulting cart and the lines its update changed (or the write error).
+        """
+        request = _PendingUpdate(desired, write, asyncio.get_running_loop().create_future())
+        self._pending.append(request)
+        try:
+            async with self._lock:
+                if not request.result.done():
+                    # the first waiter lets the concurrent updates join its batch
+                    if self._coalesce_window > 0:
+                        await asyncio.sleep(self._coalesce_window)
+                    batch, self._pending = self._pending, []
+                    try:
+                        await self._apply_batch(batch)
+                    except BaseException:
+                        # cancelled during the write: the cart is unknown, the other updates go to the next waiter
+                        self.invalidate()
+                        self._pending[:0] = [pending for pending in batch if pending is not request and not pending.result.done()]
+                        raise
+        except asyncio.CancelledError:
+            # a cancelled update is not applied unless its write was already sent
+            self._pending = [pending for pending in self._pending if pending is not request]
+            raise
+        return await request.result
+
+    async def _apply_batch(self, batch: list[_PendingUpdate]) -> None:
+        # updates written by another function (another endpoint) are not merged
+        start = 0
+        while start < len(batch):
+            end = start + 1
+            while end < len(batch) and batch[end].write == batch[start].write:
+                end += 1
+            await self._apply(batch[start:end])
+            start = end
+
+    async def _apply(self, updates: list[_PendingUpdate]) -> None:
+        try:
+            if self._write_max_age is not None and self._is_older_than(self._write_max_age):
+                current = await self.sync()
+            else:
+                current = await self.snapshot()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            for update in updates:
+                update.result.set_exception(e)
+            return
+
+        target = dict(current.lines)
+        applied: list[tuple[_PendingUpdate, CartDelta]] = []
+        for update in updates:
+            try:
+                requested = update.desired(dict(target))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                update.result.set_exception(e)
+                continue
+            requested = {_id: quantity for _id, quantity in requested.items() if _is_positive(quantity)}
+            applied.append((update, diff(target, requested)))
+            target = requested
+
+        delta = diff(current.lines, target)
+        if delta and applied:
+            try:
+                reported = await applied[-1][0].write(delta, target)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.invalidate()
+                for update, _ in applied:
+                    update.result.set_exception(e)
+                return
+            # the vendor's view wins, it also carries changes made outside of this mirror
+            self._adopt(reported or CartSnapshot(lines=target, version=current.version))
+
+        cart = self.as_list()
+        # a line changed back by a later update of the batch didn't change
+        written = {line["id"] for line in delta.as_lines()}
+        for update, update_delta in applied:
+            update.result.set_result(CartUpdate(cart, [line for line in update_delta.as_lines() if line["id"] in written]))
+
+    def as_list(self) -> list[dict]:
+        lines = self._snapshot.lines if self._snapshot else {}
+        return [
+            types.CartItemSchema(id=_id, quantity=quantity).model_dump()
+            for _id, quantity in lines.items()
+        ]
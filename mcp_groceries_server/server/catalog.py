@@ -0,0 +1,253 @@
+import bisect
+import collections
+import heapq
+import json
+import logging
+import os
+import re
+import time
+import typing
+
+CATALOG_LOCAL_SEARCH = os.environ.get("CATALOG_LOCAL_SEARCH", "true").lower() == "true"
+# minimal local matches for a search to be answered without the vendor
+CATALOG_MIN_RESULTS = int(os.environ.get("CATALOG_MIN_RESULTS", "5"))
+CATALOG_MAX_AGE = float(os.environ.get("CATALOG_MAX_AGE", str(24 * 60 * 60)))
+CATALOG_DIR = os.environ.get("CATALOG_DIR", "")
+
+INDEXED_FIELDS = ("name", "branding_name", "second_level_category")
+
+logger = logging.getLogger(__name__)
+
+# cantillation and vowel points, without the maqaf (a hyphen) and sof pasuq
+_NIQQUD = re.compile("[\u0591-\u05bd\u05bf\u05c1\u05c2\u05c4\u05c5\u05c7]")
+_TOKEN = re.compile(r"[\w%]+")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+_GERESH = str.maketrans("", "", "׳״'\"`’")
+# one letter prefixes (and, the, in) glued to Hebrew words
+_PREFIXES = ("ו", "ה", "ב")
+
+
+def normalize(text: str) -> str:
+    """
+    Strip niqqud and geresh/gershayim, unify final letters and case
+    """
+    text = _NIQQUD.sub("", text).translate(_GERESH).translate(_FINAL_LETTERS)
+    return text.casefold()
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(normalize(text))
+
+
+def _variants(token: str) -> set[str]:
+    """
+    The token and the token without its prefix letters, e.g. "והחלב" -> {"והחלב", "החלב", "חלב"}
+    """
+    variants = {token}
+    while len(token) > 2 and token[0] in _PREFIXES:
+        token = token[1:]
+        variants.add(token)
+    return variants
+
+
+def word_forms(text: str) -> set[str]:
+    """
+    The normalized words of the text, with and without their prefix letters
+    """
+    return {variant for token in tokenize(text) for variant in _variants(token)}
+
+
+class CatalogStore:
+    """
+    Local snapshot of a vendor catalog with an inverted index over the product text fields
+    """
+
+    def __init__(self, clock: typing.Callable[[], float] = time.time):
+        self._clock = clock
+        self.products: dict[str, dict] = {}
+        self.seen_at: dict[str, float] = {}
+        self._index: dict[str, set[str]] = collections.defaultdict(set)
+        # the words without their prefix letters, matched only as whole words
+        self._stems: dict[str, set[str]] = collections.defaultdict(set)
+        self._tokens_by_product: dict[str, tuple[set[str], set[str]]] = {}
+        self._sorted_tokens: typing.Optional[list[str]] = None
+        # incremented on every change, for the views derived from the store
+        self.version = 0
+        # the version each product last changed at, oldest first
+        self._changed_at: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def add_products(self, products: typing.Iterable[dict]) -> None:
+        now = self._clock()
+        for product in products:
+            if product.get("id") is None:
+                continue
+            _id = str(product["id"])
+            self._unindex(_id)
+            tokens = {token for field in INDEXED_FIELDS for token in tokenize(str(product.get(field) or ""))}
+            stems = {variant for token in tokens for variant in _variants(token)} - tokens
+            for token in tokens:
+                self._index[token].add(_id)
+            for stem in stems:
+                self._stems[stem].add(_id)
+            self._tokens_by_product[_id] = (tokens, stems)
+            self.products[_id] = product
+            self.seen_at[_id] = now
+            self._changed_at.pop(_id, None)
+            self._changed_at[_id] = self.version + 1
+        self._sorted_tokens = None
+        self.version += 1
+
+    def changed_since(self, version: int) -> list[dict]:
+        """
+        The products added or updated after `version`, so derived views don't rescan the whole store
+        """
+        changed = []
+        for _id in reversed(self._changed_at):
+            if self._changed_at[_id] <= version:
+                break
+            changed.append(self.products[_id])
+        return changed[::-1]
+
+    def age(self, _id: str) -> typing.Optional[float]:
+        """
+        Seconds since the vendor last returned the product
+        """
+        seen_at = self.seen_at.get(_id)
+        return None if seen_at is None else max(0.0, self._clock() - seen_at)
+
+    def _unindex(self, _id: str) -> None:
+        tokens, stems = self._tokens_by_product.pop(_id, ((), ()))
+        for index, keys in ((self._index, tokens), (self._stems, stems)):
+            for key in keys:
+                ids = index[key]
+                ids.discard(_id)
+                if not ids:
+                    del index[key]
+
+    def _matching_ids(self, token: str) -> set[str]:
+        """
+        Products with an indexed token starting with `token`
+        """
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._index)
+        ids: set[str] = set()
+        position = bisect.bisect_left(self._sorted_tokens, token)
+        while position < len(self._sorted_tokens) and self._sorted_tokens[position].startswith(token):
+            ids |= self._index[self._sorted_tokens[position]]
+            position += 1
+        return ids
+
+    def _whole_word_ids(self, word: str) -> set[str]:
+        """
+        Products with `word` as a whole word, either side ignoring its ו/ה/ב prefix letters
+        """
+        ids: set[str] = set()
+        for variant in _variants(word):
+            ids |= self._index.get(variant, set()) | self._stems.get(variant, set())
+        return ids
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        max_age: typing.Optional[float] = None,
+        whole_words: bool = False,
+    ) -> list[dict]:
+        """
+        Products matching every query word, as a whole word (ignoring ו/ה/ב prefixes) or by prefix of the word as typed,
+        fresh within `max_age` seconds. Products matching more whole words come first, `whole_words` returns only the
+        products matching all of them
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+
+        matches: typing.Optional[set[str]] = None
+        exact: collections.Counter[str] = collections.Counter()
+        for word in words:
+            word_exact = self._whole_word_ids(word)
+            exact.update(word_exact)
+            word_matches = word_exact if whole_words else word_exact | self._matching_ids(word)
+            matches = word_matches if matches is None else matches & word_matches
+            if not matches:
+                return []
+
+        if max_age is not None:
+            oldest = self._clock() - max_age
+            matches = {_id for _id in matches if self.seen_at[_id] >= oldest}
+
+        ranked = heapq.nsmallest(
+            limit,
+            matches,
+            key=lambda _id: (-exact[_id], len(str(self.products[_id].get("name") or ""))),
+        )
+        return [self.products[_id] for _id in ranked]
+
+    def dump(self) -> dict:
+        return dict(products=self.products, seen_at=self.seen_at)
+
+    @classmethod
+    def load(cls, data: dict, clock: typing.Callable[[], float] = time.time) -> "CatalogStore":
+        store = cls(clock)
+        store.add_products(data.get("products", {}).values())
+        store.seen_at.update(data.get("seen_at", {}))
+        return store
+
+
+class Catalog:
+    """
+    Catalog stores per (vendor, store id), optionally persisted under `directory`
+    """
+
+    def __init__(self, directory: str = CATALOG_DIR):
+        self.directory = directory
+        self._stores: dict[tuple[str, str], CatalogStore] = {}
+
+    def _path(self, vendor: str, store_id: str) -> str:
+        return os.path.join(self.directory, f"{vendor}-{store_id or 'default'}.json")
+
+    def store(self, vendor: str, store_id: str = "") -> CatalogStore:
+        key = (vendor, store_id)
+        if key not in self._stores:
+            self._stores[key] = self._load(vendor, store_id)
+        return self._stores[key]
+
+    def _load(self, vendor: str, store_id: str) -> CatalogStore:
+        if self.directory and os.path.exists(path := self._path(vendor, store_id)):
+            try:
+                with open(path, "r", encoding="utf-8") as catalog_file:
+                    return CatalogStore.load(json.load(catalog_file))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable catalog snapshot {path}: {e!r}")
+        return CatalogStore()
+
+    def save(self) -> None:
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for (vendor, store_id), store in self._stores.items():
+            path = self._path(vendor, store_id)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as catalog_file:
+                json.dump(store.dump(), catalog_file, ensure_ascii=False, separators=(",", ":"))
+            os.replace(f"{path}.tmp", path)
+
+
+catalog = Catalog()
+
+
+async def ingest(
+    search_products: typing.Callable[[str], typing.Awaitable[list[dict]]],
+    store: CatalogStore,
+    terms: typing.Iterable[str],
+) -> int:
+    """
+    Populate a store by running the vendor search over seed terms (e.g. the recurring shopping list).
+    Returns the number of products in the store.
+    """
+    for term in terms:
+        if term := term.strip().strip('",').strip():
+            store.add_products(await search_products(term))
+    return len(store)
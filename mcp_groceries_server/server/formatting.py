@@ -0,0 +1,129 @@
+import os
+import typing
+
+SearchFormat = typing.Literal["full", "compact", "tsv"]
+CartFormat = typing.Literal["full", "summary"]
+
+SEARCH_RESPONSE_FORMAT: SearchFormat = typing.cast(SearchFormat, os.environ.get("SEARCH_RESPONSE_FORMAT", "compact"))
+CART_RESPONSE_FORMAT: CartFormat = typing.cast(CartFormat, os.environ.get("CART_RESPONSE_FORMAT", "summary"))
+
+# product field -> short column name, fields not listed here are dropped from compact responses
+SHORT_KEYS = {
+    "id": "id",
+    "name": "n",
+    "price": "p",
+    "unit_price": "up",
+    "unit": "u",
+    "selling_method": "sm",
+    "discounts": "d",
+    "branding_name": "b",
+    "second_level_category": "c",
+    # only set when the vendor reports it
+    "out_of_stock": "oos",
+    # seconds since the vendor confirmed the price and stock
+    "freshness": "f",
+}
+# columns with repeated strings, sent once in a lookup table and referenced by index
+DEDUPLICATED_KEYS = ("b", "c")
+# product field -> what it holds, for the prompt
+_FIELD_DESCRIPTIONS = {
+    "name": "name",
+    "price": "price",
+    "unit_price": "unit price",
+    "unit": "unit",
+    "selling_method": "selling method",
+    "discounts": "discounts",
+    "branding_name": "brand",
+    "second_level_category": "category",
+    "out_of_stock": "true when out of stock",
+    "freshness": "seconds since the price and stock were confirmed by the provider",
+}
+
+
+def _columnar(products: list[dict]) -> dict[str, typing.Any]:
+    columns = [
+        short
+        for field, short in SHORT_KEYS.items()
+        if any(product.get(field) not in (None, "", {}, []) for product in products)
+    ]
+    fields = {short: field for field, short in SHORT_KEYS.items()}
+    lookups: dict[str, list[str]] = {}
+    rows = []
+    for product in products:
+        row = []
+        for column in columns:
+            value = product.get(fields[column])
+            if value in ("", {}, []):
+                value = None
+            if column in DEDUPLICATED_KEYS and value is not None:
+                table = lookups.setdefault(column, [])
+                if value not in table:
+                    table.append(value)
+                value = table.index(value)
+            row.append(value)
+        rows.append(row)
+    return dict(columns=columns, rows=rows, **({"lookups": lookups} if lookups else {}))
+
+
+def _tsv(products: list[dict]) -> str:
+    table = _columnar(products)
+    lines = [f"#{column}\t" + "\t".join(map(str, values)) for column, values in table.get("lookups", {}).items()]
+    lines.append("\t".join(table["columns"]))
+    lines.extend("\t".join("" if value is None else str(value) for value in row) for row in table["rows"])
+    return "\n".join(lines)
+
+
+def format_products(products: list[dict], response_format: SearchFormat = SEARCH_RESPONSE_FORMAT) -> typing.Any:
+    """
+    Encode search results for the LLM.
+
+    - full: the transformed products as is
+    - compact: {"columns": [...], "rows": [[...]], "lookups": {"b": [...], "c": [...]}}, without empty columns
+      and with brand/category values replaced by their index in `lookups`
+    - tsv: the compact table as tab separated lines, lookups first as `#<column>\\t<values>`
+    """
+    match response_format:
+        case "compact":
+            return _columnar(products)
+        case "tsv":
+            return _tsv(products)
+        case _:
+            return products
+
+
+def describe_products(response_format: SearchFormat = SEARCH_RESPONSE_FORMAT) -> str:
+    """
+    How `format_products` lays out the search results, for the prompt
+    """
+    if response_format == "full":
+        fields = ", ".join(f"`{field}` {_FIELD_DESCRIPTIONS[field]}" if field in _FIELD_DESCRIPTIONS else f"`{field}`" for field in SHORT_KEYS)
+        return f"Search results are lists of products. Fields: {fields}"
+    columns = ", ".join(f"`{short}` {_FIELD_DESCRIPTIONS[field]}" if field in _FIELD_DESCRIPTIONS else f"`{short}`" for field, short in SHORT_KEYS.items())
+    deduplicated = " and ".join(f"`{short}`" for short in DEDUPLICATED_KEYS)
+    if response_format == "tsv":
+        return (
+            "Search results are tab separated tables: a header line with the column names, then a line per product. "
+            f"Columns: {columns}. {deduplicated} hold an index into the values listed on the first lines, `#<column>` followed by the values"
+        )
+    return f"Search results are tables: `columns` name the values of each row in `rows`. Columns: {columns}. {deduplicated} hold an index into `lookups`"
+
+
+def format_cart(
+    cart: typing.Any,
+    changed: typing.Sequence[dict] = (),
+    response_format: CartFormat = CART_RESPONSE_FORMAT,
+) -> typing.Any:
+    """
+    Encode a cart update result for the LLM. `summary` returns the cart size and the lines the update changed
+    (`cart_state.CartUpdate.changed`, quantity "0" when removed) only.
+    """
+    if response_format != "summary":
+        return cart
+
+    if isinstance(cart, list) and all(isinstance(line, dict) for line in cart):
+        return dict(
+            lines=len(cart),
+            changed=[dict(id=line["id"], quantity=line["quantity"]) for line in changed],
+        )
+    # vendors reporting per item outcomes instead of the cart are already compact
+    return cart
@@ -0,0 +1,172 @@
+import dataclasses
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+from mcp_groceries_server.server import cache, types
+
+# SQLite file of the purchase history, kept in memory (for the process lifetime) when empty
+HISTORY_DB = os.environ.get("HISTORY_DB", "")
+# older entries have their price and availability refreshed before being trusted
+HISTORY_MAX_AGE = float(os.environ.get("HISTORY_MAX_AGE", str(24 * 60 * 60)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchases (
+    term TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    name TEXT,
+    selling_method TEXT,
+    quantity TEXT,
+    price REAL,
+    unit_price REAL,
+    unit TEXT,
+    bought_at REAL NOT NULL,
+    refreshed_at REAL NOT NULL,
+    available INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (term, vendor)
+)
+"""
+_COLUMNS = (
+    "term", "vendor", "product_id", "name", "selling_method", "quantity",
+    "price", "unit_price", "unit", "bought_at", "refreshed_at", "available",
+)
+
+
+@dataclasses.dataclass
+class Purchase:
+    """
+    The product last bought for a shopping list term at a vendor
+    """
+
+    term: str
+    vendor: str
+    product_id: str
+    name: typing.Optional[str]
+    selling_method: str
+    quantity: str
+    price: typing.Optional[float]
+    unit_price: typing.Optional[float]
+    unit: typing.Optional[str]
+    bought_at: float
+    refreshed_at: float
+    # whether the last refresh found the product at the vendor
+    available: bool = True
+
+    def is_fresh(self, now: float, max_age: float = HISTORY_MAX_AGE) -> bool:
+        return now - self.refreshed_at < max_age
+
+    def product(self) -> dict:
+        return dict(
+            id=self.product_id,
+            name=self.name,
+            price=self.price,
+            unit_price=self.unit_price,
+            unit=self.unit,
+            selling_method=self.selling_method,
+        )
+
+
+class PurchaseHistory:
+    """
+    (list term, vendor) -> last bought product, in SQLite. Terms are normalized like the search cache keys.
+    """
+
+    def __init__(self, path: str = HISTORY_DB, clock: typing.Callable[[], float] = time.time):
+        self.path = path
+        self._clock = clock
+        self._connection: typing.Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # opened on first use, importing the server doesn't touch the disk
+        if self._connection is None:
+            if self.path and (directory := os.path.dirname(self.path)):
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path or ":memory:", check_same_thread=False)
+            self._connection.execute(_SCHEMA)
+        return self._connection
+
+    def record(self, vendor: str, items: typing.Iterable[types.CartItemSchema], products: typing.Mapping[str, dict]) -> int:
+        """
+        Record the cart items bought at a vendor, with the details of their `products` (id -> catalog product).
+        Returns the number of recorded purchases, items without a term are skipped.
+        """
+        now = self._clock()
+        rows = []
+        for item in items:
+            if not (term := cache.normalize_query(item.term)):
+                continue
+            product = products.get(item.id) or {}
+            rows.append(
+                (
+                    term, vendor, item.id, product.get("name"), item.selling_method or product.get("selling_method") or "",
+                    item.quantity, _float(product.get("price")), _float(product.get("unit_price")), product.get("unit"),
+                    now, now, 1,
+                )
+            )
+        if rows:
+            with self._lock, self._connect() as connection:
+                connection.executemany(
+                    f"INSERT OR REPLACE INTO purchases ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    rows,
+                )
+        return len(rows)
+
+    def lookup(self, vendor: str, terms: typing.Iterable[str]) -> dict[str, Purchase]:
+        """
+        The last purchase of each term, keyed by the term as given
+        """
+        keys = {cache.normalize_query(term): term for term in terms}
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM purchases WHERE vendor = ? AND term IN ({', '.join('?' * len(keys))})",
+                (vendor, *keys),
+            ).fetchall()
+        purchases = {}
+        for row in rows:
+            purchase = Purchase(**dict(zip(_COLUMNS, row)))
+            purchase.available = bool(purchase.available)
+            purchases[keys[purchase.term]] = purchase
+        return purchases
+
+    def refresh(self, vendor: str, products: dict[str, typing.Optional[dict]]) -> None:
+        """
+        Update the price and availability of the purchases of products in one transaction,
+        product id -> the product as currently sold or None when the vendor no longer has it
+        """
+        now = self._clock()
+        with self._lock, self._connect() as connection:
+            connection.executemany(
+                "UPDATE purchases SET price = COALESCE(?, price), unit_price = COALESCE(?, unit_price), "
+                "refreshed_at = ?, available = ? WHERE vendor = ? AND product_id = ?",
+                [
+                    (
+                        _float((product or {}).get("price")), _float((product or {}).get("unit_price")),
+                        now, int(product is not None), vendor, product_id,
+                    )
+                    for product_id, product in products.items()
+                ],
+            )
+
+    def is_stale(self, purchase: Purchase) -> bool:
+        return not purchase.is_fresh(self._clock())
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _float(value: typing.Any) -> typing.Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+history = PurchaseHistory()
@@ -0,0 +1,54 @@
+import importlib.util
+import os
+import typing
+
+import httpx
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "30"))
+# HTTP/2 requires the optional `h2` package (`httpx[http2]`), fall back to HTTP/1.1 without it
+HTTP2_ENABLED = (
+    os.environ.get("HTTP2_ENABLED", "true").lower() == "true"
+    and importlib.util.find_spec("h2") is not None
+)
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def get_client(vendor: str) -> httpx.AsyncClient:
+    """
+    Return the long-lived client of a vendor, creating it on first use.
+    The client keeps its connections alive so the TCP+TLS handshake is paid once per vendor.
+    """
+    client = _clients.get(vendor)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=HTTP_TIMEOUT,
+        )
+        _clients[vendor] = client
+    return client
+
+
+async def connect(vendor: str, url: str) -> None:
+    """
+    Open a pooled connection to the host of `url` with a HEAD request, so the first call skips the handshake
+    """
+    await get_client(vendor).head(url)
+
+
+async def aclose(vendor: typing.Optional[str] = None) -> None:
+    """
+    Close the client of a vendor, or all clients when no vendor is given
+    """
+    vendors = [vendor] if vendor else list(_clients)
+    for name in vendors:
+        if client := _clients.pop(name, None):
+            await client.aclose()
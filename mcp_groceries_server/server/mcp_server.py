@@ -1,3 +1,108 @@
+import logging
+import os
+import typing
+
+import anyio
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import Response
+
+from mcp_groceries_server.server import metrics
+
+# pre-connect the vendors (HTTP pools, browser) in the background once the server runs
+WARM_UP = os.environ.get("WARM_UP", "true").lower() == "true"
 
 server = FastMCP("Groceries", host="0.0.0.0", port=8888)
+
+logger = logging.getLogger(__name__)
+
+
+@server.custom_route("/metrics", methods=["GET"])
+async def _metrics(request: Request) -> Response:
+    return Response(metrics.expose(), media_type=metrics.CONTENT_TYPE)
+
+
+_warm_up_callbacks: list[typing.Callable[[], typing.Awaitable[None]]] = []
+_shutdown_callbacks: list[typing.Callable[[], typing.Awaitable[None]]] = []
+_background_callbacks: list[typing.Callable[[], typing.Awaitable[None]]] = []
+
+
+def on_warm_up(callback: typing.Callable[[], typing.Awaitable[None]]) -> None:
+    """
+    Register a coroutine function to be awaited in the background after the server starts
+    """
+    _warm_up_callbacks.append(callback)
+
+
+async def warm_up() -> None:
+    """
+    Run the warm-up callbacks concurrently, a failing warm-up is logged and the work is done on first use instead
+    """
+
+    async def _warm_up(callback: typing.Callable[[], typing.Awaitable[None]]) -> None:
+        try:
+            await callback()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning(f"Warm-up {getattr(callback, '__qualname__', callback)} failed: {e!r}")
+
+    async with anyio.create_task_group() as task_group:
+        for callback in _warm_up_callbacks:
+            task_group.start_soon(_warm_up, callback)
+
+
+def on_background(callback: typing.Callable[[], typing.Awaitable[None]]) -> None:
+    """
+    Register a long running coroutine function, run while the server runs and cancelled when it exits
+    """
+    _background_callbacks.append(callback)
+
+
+async def _run_background(callback: typing.Callable[[], typing.Awaitable[None]]) -> None:
+    try:
+        await callback()
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logger.warning(f"Background task {getattr(callback, '__qualname__', callback)} failed: {e!r}")
+
+
+def on_shutdown(callback: typing.Callable[[], typing.Awaitable[None]]) -> None:
+    """
+    Register a coroutine function to be awaited when the server exits
+    """
+    _shutdown_callbacks.append(callback)
+
+
+async def shutdown() -> None:
+    while _shutdown_callbacks:
+        callback = _shutdown_callbacks.pop()
+        await callback()
+
+
+async def _serve(transport: str) -> None:
+    try:
+        async with anyio.create_task_group() as task_group:
+            if WARM_UP:
+                task_group.start_soon(warm_up)
+            for callback in _background_callbacks:
+                task_group.start_soon(_run_background, callback)
+            match transport:
+                case "stdio":
+                    await server.run_stdio_async()
+                case "sse":
+                    await server.run_sse_async()
+                case "streamable-http":
+                    await server.run_streamable_http_async()
+                case _:
+                    raise ValueError(f"Unknown transport: {transport}")
+            # the server exited, don't wait for a warm-up still in progress nor the background tasks
+            task_group.cancel_scope.cancel()
+    finally:
+        # shield the cleanup so pooled connections are closed even when the server is cancelled
+        with anyio.CancelScope(shield=True):
+            await shutdown()
+
+
+def run(transport: str) -> None:
+    """
+    Run the server on the given transport and release provider resources on exit
+    """
+    anyio.run(_serve, transport)
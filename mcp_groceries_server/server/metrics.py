@@ -0,0 +1,253 @@
+import bisect
+import contextlib
+import functools
+import math
+import time
+import typing
+
+# Prometheus text exposition format, understood by Prometheus and OpenMetrics scrapers
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: typing.Sequence[str], values: typing.Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, typing.Any]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> typing.Iterable[tuple[str, Labels, Labels, float]]:
+        """
+        (name suffix, extra label names, label values, value)
+        """
+        return ()
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, extra_names, values, value in self.samples():
+            labels = _format_labels(self.labelnames + extra_names, values)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: typing.Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: typing.Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: typing.Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> typing.Iterable[tuple[str, Labels, Labels, float]]:
+        for key, value in self._values.items():
+            yield "", (), key, value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: typing.Sequence[str] = (),
+        buckets: typing.Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: count per bucket (not cumulative), the last one is +Inf, and the sum
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: typing.Any) -> None:
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] = self._sums.get(key, 0) + value
+
+    def count(self, **labels: typing.Any) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    @contextlib.contextmanager
+    def time(self, **labels: typing.Any) -> typing.Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> typing.Iterable[tuple[str, Labels, Labels, float]]:
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", ("le",), key + (_format_value(bound),), cumulative
+            yield "_sum", (), key, self._sums[key]
+            yield "_count", (), key, cumulative
+
+
+class Callback(Metric):
+    """
+    A gauge or counter read from its owner at scrape time, `collect` returns (label values, value) pairs
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: typing.Sequence[str],
+        collect: typing.Callable[[], typing.Iterable[tuple[typing.Sequence[str], float]]],
+        kind: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._collect = collect
+
+    def samples(self) -> typing.Iterable[tuple[str, Labels, Labels, float]]:
+        for values, value in self._collect():
+            yield "", (), tuple(map(str, values)), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        # re-registering replaces, so a reloaded module doesn't expose a metric twice
+        self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: typing.Sequence[str] = ()) -> Counter:
+    return typing.cast(Counter, registry.register(Counter(name, documentation, labelnames)))
+
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: typing.Sequence[str] = (),
+    buckets: typing.Sequence[float] = LATENCY_BUCKETS,
+) -> Histogram:
+    return typing.cast(Histogram, registry.register(Histogram(name, documentation, labelnames, buckets)))
+
+
+def callback(
+    name: str,
+    documentation: str,
+    labelnames: typing.Sequence[str],
+    collect: typing.Callable[[], typing.Iterable[tuple[typing.Sequence[str], float]]],
+    kind: str = "gauge",
+) -> Callback:
+    return typing.cast(Callback, registry.register(Callback(name, documentation, labelnames, collect, kind)))
+
+
+TOOL_SECONDS = histogram(
+    "groceries_tool_duration_seconds", "MCP tool call latency", ("vendor", "tool", "outcome")
+)
+VENDOR_REQUEST_SECONDS = histogram(
+    "groceries_vendor_request_duration_seconds", "Vendor API request latency", ("vendor", "step")
+)
+VENDOR_RESPONSES = counter(
+    "groceries_vendor_responses_total", "Vendor API responses by status code, error when no response", ("vendor", "step", "status")
+)
+VENDOR_RESPONSE_BYTES = histogram(
+    "groceries_vendor_response_bytes", "Vendor API response body size", ("vendor", "step"), BYTES_BUCKETS
+)
+VENDOR_RETRIES = counter("groceries_vendor_retries_total", "Vendor API calls retried", ("vendor", "step"))
+BROWSER_SCRIPT_SECONDS = histogram(
+    "groceries_browser_script_duration_seconds", "In-page script (page.evaluate) latency", ("vendor", "step", "outcome")
+)
+CATALOG_SEARCHES = counter(
+    "groceries_catalog_searches_total", "Searches by where they were answered, the local catalog or the vendor", ("vendor", "source")
+)
+CATALOG_REFRESHES = counter(
+    "groceries_catalog_refreshes_total", "Hot products refreshed in the background, by whether the vendor still returned them", ("vendor", "outcome")
+)
+
+
+def instrument_tool(vendor: str, tool: str, function: typing.Callable[..., typing.Awaitable[typing.Any]]) -> typing.Callable[..., typing.Awaitable[typing.Any]]:
+    """
+    Time a tool. The wrapper keeps the signature of `function`, which FastMCP derives the tool schema from.
+    """
+
+    @functools.wraps(function)
+    async def _instrumented(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await function(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            TOOL_SECONDS.observe(time.perf_counter() - started, vendor=vendor, tool=tool, outcome=outcome)
+
+    return _instrumented
+
+
+@contextlib.contextmanager
+def vendor_request(vendor: str, step: str) -> typing.Iterator[typing.Callable[[typing.Any], None]]:
+    """
+    Time a vendor request, the yielded function records the response status and size:
+
+        with metrics.vendor_request(VENDOR, "search") as record:
+            record(await client.request(...))
+    """
+    started = time.perf_counter()
+    status = "error"
+
+    def _record(response: typing.Any) -> None:
+        nonlocal status
+        status = str(response.status_code)
+        VENDOR_RESPONSE_BYTES.observe(len(response.content), vendor=vendor, step=step)
+
+    try:
+        yield _record
+    finally:
+        VENDOR_REQUEST_SECONDS.observe(time.perf_counter() - started, vendor=vendor, step=step)
+        VENDOR_RESPONSES.inc(vendor=vendor, step=step, status=status)
+
+
+def expose() -> str:
+    return registry.expose()
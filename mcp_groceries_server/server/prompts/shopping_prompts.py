@@ -1,5 +1,6 @@
 import dataclasses
 
+from mcp_groceries_server.server import formatting
 from mcp_groceries_server.server.mcp_server import server
 
 
@@ -8,8 +9,18 @@ class UserMessage:
     content: str
 
 
+def _already_in_cart(already_in_cart: str) -> str:
+    if not already_in_cart:
+        return ""
+    return f"""
+            #### Already in the cart:
+            These list items were resolved and added before you started, keep them in the cart and don't search them again:
+                {already_in_cart}
+"""
+
+
 @server.prompt()
-def start_shopping(shopping_list: str, preferences: str) -> list[UserMessage]:
+def start_shopping(shopping_list: str, preferences: str, already_in_cart: str = "") -> list[UserMessage]:
     """Use this prompt to determain how to start the shopping process"""
     return [
         UserMessage(
@@ -21,11 +32,11 @@ def start_shopping(shopping_list: str, preferences: str) -> list[UserMessage]:
             **Important:**
             - Make sure that you don't buy more than it's needed for each article.
             - If quantity not defined use the default of 1
-            - Be frugal, for each item in the list evaluate price and quantity_evaluation and choose the most cost efficient item
+            - Be frugal, for each item in the list choose the most cost efficient item. Search results are in the provider relevance order, except that the results priced in the most common `unit` (kg, l or unit) are sorted by `unit_price` (price per `unit`) among themselves, cheapest first. Compare `unit_price` only between items of the same `unit`
             - Remove items from the existing basket if not found in the new list
-            - Evaluate the best grocery from the search based on text similarity and price per gram
+            - Evaluate the best grocery from the search based on text similarity and `unit_price`
             - Translate the groceries to Hebrew before search
-            - If an item is **out of stock**, find the best alternative. Notice the user cannot answer your questions, you should decide on your own
+            - If an item is **out of stock**, find the best alternative with `suggest_substitutes` for its product id instead of searching. Notice the user cannot answer your questions, you should decide on your own
             - Example substitutions:
                 - If Gruyère cheese is unavailable, select another semi-hard cheese.
                 - If Tahini is unavailable, a sesame-based alternative may work.
@@ -36,10 +47,16 @@ def start_shopping(shopping_list: str, preferences: str) -> list[UserMessage]:
 
             ### Step 1: Search for items
             - Search each item in the list while considering the user preferences.
+            - Start with `resolve_from_history` for all the list items: an `available` product bought before is added as is (with the last quantity unless the list says otherwise), without searching it
+            - Then `semantic_search` the remaining list items as written (any language, typos allowed), a product with a high score that fits the item can be used without searching
+            - Prefer the `search_many` tool with the remaining list items in a single call over calling `search` item by item
             - Collect the IDs and selling method as you will need them for the next step to update the cart
+            - When several vendors are available the tools are prefixed with the vendor (`rami_levy_search`, `keshet_search`), use `compare_prices` to choose the vendor and shop with its tools only
+            - {formatting.describe_products()}
             
             #### Shopping List:
                 {shopping_list}
+            {_already_in_cart(already_in_cart)}
 
             **Important:**
             - If item is not found try to find an alternative
@@ -49,6 +66,7 @@ def start_shopping(shopping_list: str, preferences: str) -> list[UserMessage]:
             - Use `add_items_to_cart` tool to add items from previous step into the ordering cart based on the findings from previous step
             - Assume authotization already took place
             - Provide the quantity from the user shopping list. If quantity not provided, use quantity of 1
+            - Set the `term` of each item to the shopping list item it was chosen for, so it is found in the history next time
             
             **Important:**
             - You must follow the list by adding only items found in the list and by the user preferences, nothing more
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import typing
+
+from mcp_groceries_server.server import catalog, metrics, server, units
+from mcp_groceries_server.server.providers.interface import provider
+from mcp_groceries_server.server.providers.interface.provider import Provider
+
+OFFER_FIELDS = ("id", "name", "price", "unit_price", "unit", "freshness")
+
+logger = logging.getLogger(__name__)
+
+
+def matches(item: str, products: list[dict]) -> list[dict]:
+    """
+    The products whose name has every word of the item, so a cheap unrelated result of a broad search isn't an offer
+    """
+    words = catalog.word_forms(item)
+    return [product for product in products if words and words <= catalog.word_forms(product.get("name") or "")]
+
+
+def best_offer(item: str, products: list[dict]) -> typing.Optional[dict]:
+    """
+    The offer of a vendor for a search: the cheapest by unit price among the results matching the item
+    """
+    return cheapest(matches(item, products))
+
+
+def cheapest(offers: list[dict]) -> typing.Optional[dict]:
+    """
+    Cheapest offer by unit price, among the offers in the most common unit so kg are not compared with units.
+    Falls back to the price when no offer has a unit price.
+    """
+    priced = [offer for offer in offers if offer.get("unit_price") is not None]
+    if priced:
+        unit = units.dominant_unit(priced)
+        return min((offer for offer in priced if offer.get("unit") == unit), key=lambda offer: offer["unit_price"])
+    with_price = [offer for offer in offers if offer.get("price") is not None]
+    return min(with_price, key=lambda offer: float(offer["price"])) if with_price else None
+
+
+async def compare_prices(providers: typing.Sequence[Provider], items: list[str]) -> list[dict]:
+    """
+    Search every item on every vendor concurrently, one block per item with each vendor offer and the cheapest one
+    """
+    semaphores = {p.vendor: asyncio.Semaphore(provider.SEARCH_MANY_CONCURRENCY) for p in providers}
+
+    async def _offer(vendor_provider: Provider, item: str) -> dict:
+        async with semaphores[vendor_provider.vendor]:
+            try:
+                async with asyncio.timeout(provider.SEARCH_MANY_TIMEOUT):
+                    products = await vendor_provider.cached_search(item)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning(f"{vendor_provider.vendor} search for {item} failed: {e!r}")
+                return dict(vendor=vendor_provider.vendor, error=str(e) or type(e).__name__)
+        if (offer := best_offer(item, products)) is None:
+            return dict(vendor=vendor_provider.vendor, error="not found")
+        return dict(vendor=vendor_provider.vendor, **{field: offer.get(field) for field in OFFER_FIELDS})
+
+    offers = await asyncio.gather(*[_offer(p, item) for item in items for p in providers])
+    blocks = []
+    for index, item in enumerate(items):
+        item_offers = offers[index * len(providers):(index + 1) * len(providers)]
+        blocks.append(
+            dict(
+                query=item,
+                cheapest=cheapest([offer for offer in item_offers if "error" not in offer]),
+                offers=item_offers,
+            )
+        )
+    return blocks
+
+
+def register(providers: typing.Sequence[Provider]) -> None:
+    """
+    Add the `compare_prices` tool over the loaded providers
+    """
+
+    async def _compare_prices(items: list[str]) -> dict[str, list[dict]]:
+        blocks = await compare_prices(providers, items)
+        return {"content": [{"type": "text", "text": block} for block in blocks]}
+
+    server.add_tool(
+        metrics.instrument_tool("all", "compare_prices", _compare_prices),
+        name="compare_prices",
+        description="Search the items on every vendor, search terms should be in hebrew. Result has one block per item with the offer of each vendor and the cheapest one by unit price",
+    )
@@ -1,17 +1,40 @@
 import abc
+import asyncio
+import datetime
+import logging
+import os
+import time
+import typing
 
 
-from mcp_groceries_server.server import server, types
+from mcp_groceries_server.server import cache, catalog, formatting, history, http_client, mcp_server, metrics, refresh, semantic, server, substitutes, types, units
+
+SEARCH_MANY_CONCURRENCY = int(os.environ.get("SEARCH_MANY_CONCURRENCY", "5"))
+SEARCH_MANY_TIMEOUT = float(os.environ.get("SEARCH_MANY_TIMEOUT", "20"))
+
+logger = logging.getLogger(__name__)
 
 
 class Provider(abc.ABC):
-    def __init__(self):
-        server.add_tool(
+    vendor: str = ""
+    store_id: str = ""
+    # hosts connected by `warm_up`, the ones the warm-up requests of the vendor don't reach already
+    warm_up_urls: tuple[str, ...] = ()
+
+    def __init__(self, namespace: str = ""):
+        # tools are prefixed with the namespace when several vendors are served by one process
+        self.namespace = namespace
+        mcp_server.on_warm_up(self.warm_up)
+        mcp_server.on_shutdown(self.aclose)
+        if refresh.REFRESH_ENABLED:
+            mcp_server.on_background(self.refresh_hot_products)
+
+        self._add_tool(
             self.add_items_to_cart,
             name="add_items_to_cart",
             description="Add groceries to basket. Result is updated cart",
         )
-        server.add_tool(
+        self._add_tool(
             self.remove_items_from_cart,
             name="remove_items_from_cart",
             description="Remove groceries from basket. Result is updated cart",
@@ -26,30 +49,289 @@ class Provider(abc.ABC):
         #     )
         # )
 
-        server.add_tool(
+        self._add_tool(
             self.search,
             name="search",
             description="Lookup for item on the provider site, search should be in hebrew",
         )
-        
-        server.add_tool(
+
+        self._add_tool(
+            self.search_many,
+            name="search_many",
+            description="Lookup for several items at once on the provider site, search terms should be in hebrew. Result has one block per search term",
+        )
+
+        self._add_tool(
+            self.semantic_search,
+            name="semantic_search",
+            description="Lookup several items by meaning in the products seen before, in any language and with typos, without calling the provider site. Result has one block per item with the closest products and their `scores`, search the items without products with `search_many` in hebrew",
+        )
+
+        self._add_tool(
+            self.suggest_substitutes,
+            name="suggest_substitutes",
+            description="Alternatives to an out of stock or unsuitable product from the same category, best first by name similarity, unit price and brand. Use it instead of searching for a substitute",
+        )
+
+        self._add_tool(
+            self.resolve_from_history,
+            name="resolve_from_history",
+            description="Lookup the products bought before for shopping list items, call it before searching. Result has one block per item with the product, the last quantity and whether it is still available. Search only the items missing from the history",
+        )
+
+        self._add_tool(
             self.authorize,
             name="user_authorization",
             description="Allow the user to authorize - this should be done manually by the user",
         )
 
+    def _add_tool(self, function: typing.Callable[..., typing.Awaitable[typing.Any]], name: str, description: str) -> None:
+        server.add_tool(
+            metrics.instrument_tool(self.vendor, name, function),
+            name=f"{self.namespace}_{name}" if self.namespace else name,
+            description=f"{self.vendor}: {description}" if self.namespace else description,
+        )
+
     @abc.abstractmethod
     async def add_items_to_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]: ...
 
     @abc.abstractmethod
     async def remove_items_from_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]: ...
 
     @abc.abstractmethod
-    async def search(self, item: str) -> dict[str, list[dict]]: ...
+    async def search_products(self, item: str) -> list[dict]:
+        """
+        Query the vendor catalog and return the transformed products
+        """
+
+    def catalog_store(self) -> catalog.CatalogStore:
+        return catalog.catalog.store(self.vendor, self.store_id)
+
+    async def _catalog_search(self, item: str) -> list[dict]:
+        """
+        Answer from the local catalog when it has enough fresh whole word matches, otherwise ask the vendor
+        and keep every product seen. The results priced in the dominant unit are sorted by unit price, cheapest first
+        """
+        store = self.catalog_store()
+        if catalog.CATALOG_LOCAL_SEARCH:
+            local = store.search(item, max_age=catalog.CATALOG_MAX_AGE, whole_words=True)
+            if len(local) >= catalog.CATALOG_MIN_RESULTS:
+                metrics.CATALOG_SEARCHES.inc(vendor=self.vendor, source="local")
+                return units.sort_by_unit_price(local)
+        metrics.CATALOG_SEARCHES.inc(vendor=self.vendor, source="vendor")
+        products = await self.search_products(item)
+        store.add_products(products)
+        return units.sort_by_unit_price(products)
+
+    async def cached_search(self, item: str) -> list[dict]:
+        """
+        The products of a search, from the search cache, the local catalog or the vendor, with their `freshness`
+        """
+        products = await cache.search_cache.get_or_load(
+            (self.vendor, self.store_id, cache.normalize_query(item)),
+            lambda: self._catalog_search(item),
+        )
+        return self._fresh(products)
+
+    def refresh_scheduler(self) -> refresh.RefreshScheduler:
+        return refresh.scheduler(self.vendor, self.catalog_store(), self.search_products)
+
+    def _fresh(self, products: list[dict]) -> list[dict]:
+        """
+        The products as last refreshed, with their `freshness`. Counted as accesses for the refresh of hot products
+        """
+        self.refresh_scheduler().touch(products)
+        return refresh.with_freshness(self.catalog_store(), products)
+
+    async def refresh_hot_products(self) -> None:
+        """
+        Refresh the most accessed products in the background while the server runs
+        """
+        await self.refresh_scheduler().run()
+
+    async def search(
+        self,
+        item: str,
+        response_format: formatting.SearchFormat = formatting.SEARCH_RESPONSE_FORMAT,
+    ) -> dict[str, list[dict]]:
+        items = await self.cached_search(item)
+        return {"content": [{"type": "text", "text": formatting.format_products(items, response_format)}]}
+
+    async def search_many(
+        self,
+        items: list[str],
+        response_format: formatting.SearchFormat = formatting.SEARCH_RESPONSE_FORMAT,
+    ) -> dict[str, list[dict]]:
+        semaphore = asyncio.Semaphore(SEARCH_MANY_CONCURRENCY)
+
+        async def _search_one(item: str) -> dict:
+            async with semaphore:
+                try:
+                    async with asyncio.timeout(SEARCH_MANY_TIMEOUT):
+                        products = await self.cached_search(item)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logger.warning(f"Search for {item} failed: {e!r}")
+                    return dict(query=item, error=str(e) or type(e).__name__)
+            return dict(query=item, products=formatting.format_products(products, response_format))
+
+        blocks = await asyncio.gather(*[_search_one(item) for item in items])
+        return {"content": [{"type": "text", "text": block} for block in blocks]}
+
+    async def semantic_search(
+        self,
+        items: list[str],
+        limit: int = 5,
+        response_format: formatting.SearchFormat = formatting.SEARCH_RESPONSE_FORMAT,
+    ) -> dict[str, list[dict]]:
+        store = self.catalog_store()
+        index = semantic.semantic_index.index(self.vendor, self.store_id)
+        # products new to the catalog since the last lookup are embedded in batches first
+        index.sync(store)
+        matches = await index.search(items, limit=limit)
+
+        blocks = []
+        for item, item_matches in zip(items, matches):
+            products = self._fresh([store.products[_id] for _id, _ in item_matches if _id in store.products])
+            blocks.append(
+                dict(
+                    query=item,
+                    products=formatting.format_products(products, response_format),
+                    scores=[round(score, 3) for _id, score in item_matches if _id in store.products],
+                )
+            )
+        return {"content": [{"type": "text", "text": block} for block in blocks]}
+
+    async def suggest_substitutes(
+        self,
+        product_id: str,
+        limit: int = substitutes.SUBSTITUTES_LIMIT,
+        response_format: formatting.SearchFormat = formatting.SEARCH_RESPONSE_FORMAT,
+    ) -> dict[str, list[dict]]:
+        store = self.catalog_store()
+        if (product := store.products.get(str(product_id))) is None:
+            return {"content": [{"type": "text", "text": dict(product_id=product_id, error="unknown product, search it first")}]}
+
+        engine = substitutes.for_store(store)
+        suggestions = engine.suggest(product_id, limit)
+        if len(suggestions) < limit and (term := substitutes.search_term(product)):
+            # the catalog only has the products seen so far, bring the rest of the group once
+            try:
+                await self.cached_search(term)
+                suggestions = engine.suggest(product_id, limit)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning(f"Searching substitutes of {product_id} failed: {e!r}")
+
+        return {
+            "content": [
+                {
+                    "type": "text",
+                    "text": dict(
+                        product_id=product_id,
+                        products=formatting.format_products(self._fresh([candidate for candidate, _ in suggestions]), response_format),
+                        scores=[value for _, value in suggestions],
+                    ),
+                }
+            ]
+        }
+
+    def record_purchases(self, items: list[types.CartItemSchema]) -> None:
+        """
+        Remember the products added for shopping list terms, with their details from the catalog
+        """
+        try:
+            history.history.record(self.vendor, items, self.catalog_store().products)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # the cart is updated already, a history failure only costs a search next time
+            logger.warning(f"Recording the purchases failed: {e!r}")
+
+    async def _refresh_purchases(self, purchases: list[history.Purchase]) -> None:
+        """
+        Refresh the price and availability of stale purchases in bulk: from the local catalog when it saw
+        the product recently, otherwise one concurrent batch of searches by product name. A product is marked
+        unavailable only when its name finds nothing, missing from the first results of a broad name keeps its
+        last known price and availability
+        """
+        store = self.catalog_store()
+        oldest = time.time() - catalog.CATALOG_MAX_AGE
+        refreshed: dict[str, typing.Optional[dict]] = {}
+        names: dict[str, list[history.Purchase]] = {}
+        for purchase in purchases:
+            if store.seen_at.get(purchase.product_id, 0) >= oldest:
+                refreshed[purchase.product_id] = store.products[purchase.product_id]
+            elif purchase.name:
+                names.setdefault(purchase.name, []).append(purchase)
+
+        semaphore = asyncio.Semaphore(SEARCH_MANY_CONCURRENCY)
+
+        async def _refresh_name(name: str, name_purchases: list[history.Purchase]) -> None:
+            async with semaphore:
+                try:
+                    async with asyncio.timeout(SEARCH_MANY_TIMEOUT):
+                        products = await self.cached_search(name)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    # unknown, the purchase stays stale and is refreshed next time
+                    logger.warning(f"Refreshing {name} failed: {e!r}")
+                    return
+            by_id = {str(product.get("id")): product for product in products}
+            for purchase in name_purchases:
+                if purchase.product_id in by_id:
+                    refreshed[purchase.product_id] = by_id[purchase.product_id]
+                elif not products:
+                    # an explicit miss, the vendor sells nothing under this name anymore
+                    refreshed[purchase.product_id] = None
+                else:
+                    # only the top results are returned, a broad name can push the product out of them
+                    refreshed[purchase.product_id] = purchase.product() if purchase.available else None
+
+        await asyncio.gather(*[_refresh_name(name, name_purchases) for name, name_purchases in names.items()])
+        if refreshed:
+            await asyncio.to_thread(history.history.refresh, self.vendor, refreshed)
+
+    async def resolve_from_history(self, items: list[str]) -> dict[str, list[dict]]:
+        # the sqlite calls don't block the event loop
+        purchases = await asyncio.to_thread(history.history.lookup, self.vendor, items)
+        if stale := [purchase for purchase in purchases.values() if history.history.is_stale(purchase)]:
+            await self._refresh_purchases(stale)
+            purchases = await asyncio.to_thread(history.history.lookup, self.vendor, items)
+
+        blocks = []
+        for item in items:
+            if (purchase := purchases.get(item)) is None:
+                blocks.append(dict(query=item, error="not in history"))
+                continue
+            blocks.append(
+                dict(
+                    query=item,
+                    product=purchase.product(),
+                    quantity=purchase.quantity,
+                    bought_at=datetime.datetime.fromtimestamp(purchase.bought_at, datetime.timezone.utc).isoformat(timespec="seconds"),
+                    # False when the last refresh didn't find the product, search the item instead
+                    available=purchase.available and not history.history.is_stale(purchase),
+                )
+            )
+        return {"content": [{"type": "text", "text": block} for block in blocks]}
 
     async def authorize(self) -> None:
-        pass
\ No newline at end of file
+        pass
+
+    async def warm_up(self) -> None:
+        """
+        Connect to the vendor in the background after the server starts, so the first tool call doesn't pay for it
+        """
+        await asyncio.gather(*[http_client.connect(self.vendor, url) for url in self.warm_up_urls])
+
+    async def aclose(self) -> None:
+        """
+        Release the vendor resources (pooled connections) when the server exits
+        """
+        await http_client.aclose(self.vendor)
+        catalog.catalog.save()
+        semantic.semantic_index.save()
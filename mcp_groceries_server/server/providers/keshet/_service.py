@@ -1,18 +1,78 @@
+import asyncio
+import collections
+import dataclasses
+import functools
+import json
+import logging
 import os
 import typing
+import urllib.parse
 
-from httpx import AsyncClient
+import httpx
 
-from mcp_groceries_server.server import types
+from mcp_groceries_server.server import cart_state, http_client, metrics, resilience, types
 
-CART_QUERY_ENDPOINT = f"https://www-api.rami-levy.co.il/api/v2/site/clubs/customer/{os.environ['VENDOR_ACCOUNT_ID']}"
+logger = logging.getLogger(__name__)
+
+VENDOR = "keshet"
 STORE_ID = "1219"  # ONLINE STORE ID
 BRANCH_ID = "2725"
-BASE_URL = (
-    f"https://www.keshet-teamim.co.il/v2/retailers/{STORE_ID}/branches/{BRANCH_ID}"
-)
-CART_UPDATE_ENDPOINT = f"{BASE_URL}/carts/{os.environ['CART_ID']}?appId=4"
-CATALOG_ENDPOINT = f"{BASE_URL}/products/autocomplete?appId=4&filters=%7B%22must%22:%7B%22exists%22:%5B%22family.id%22,%22family.categoriesPaths.id%22,%22branch.regularPrice%22%5D,%22term%22:%7B%22branch.isActive%22:true,%22branch.isVisible%22:true%7D%7D,%22mustNot%22:%7B%22term%22:%7B%22branch.regularPrice%22:0%7D%7D,%22bool%22:%7B%22should%22:%5B%7B%22bool%22:%7B%22must_not%22:%7B%22exists%22:%7B%22field%22:%22branch.outOfStockShowUntilDate%22%7D%7D%7D%7D,%7B%22bool%22:%7B%22must%22:%5B%7B%22range%22:%7B%22branch.outOfStockShowUntilDate%22:%7B%22gt%22:%22now%22%7D%7D%7D,%7B%22term%22:%7B%22branch.isOutOfStock%22:true%7D%7D%5D%7D%7D,%7B%22bool%22:%7B%22must%22:%5B%7B%22term%22:%7B%22branch.isOutOfStock%22:false%7D%7D%5D%7D%7D%5D%7D%7D&from=0&isSearch=true&languageId=1&size=10"
+# overridable to run against a local stand-in (see benchmarks/)
+KESHET_URL = os.environ.get("KESHET_URL", "https://www.keshet-teamim.co.il")
+BASE_URL = f"{KESHET_URL}/v2/retailers/{STORE_ID}/branches/{BRANCH_ID}"
+CATALOG_ENDPOINT = f"{BASE_URL}/products/autocomplete"
+KESHET_PAGE_SIZE = int(os.environ.get("KESHET_PAGE_SIZE", "10"))
+# once `search_more` was asked for a page, the next one is fetched in the background when this one is full
+KESHET_PREFETCH = os.environ.get("KESHET_PREFETCH", "false").lower() == "true"
+# prefetched pages kept until they are asked for, the oldest are dropped
+KESHET_PREFETCH_PAGES = int(os.environ.get("KESHET_PREFETCH_PAGES", "32"))
+
+
+def catalog_filters(in_stock_only: bool = False) -> dict:
+    """
+    The Elasticsearch filters of the catalog search: active, visible and priced products. Out of stock products
+    are kept while the vendor still shows them, unless `in_stock_only`
+    """
+    in_stock = {"bool": {"must": [{"term": {"branch.isOutOfStock": False}}]}}
+    shown_out_of_stock = [
+        {"bool": {"must_not": {"exists": {"field": "branch.outOfStockShowUntilDate"}}}},
+        {"bool": {"must": [{"range": {"branch.outOfStockShowUntilDate": {"gt": "now"}}}, {"term": {"branch.isOutOfStock": True}}]}},
+    ]
+    return {
+        "must": {
+            "exists": ["family.id", "family.categoriesPaths.id", "branch.regularPrice"],
+            "term": {"branch.isActive": True, "branch.isVisible": True},
+        },
+        "mustNot": {"term": {"branch.regularPrice": 0}},
+        "bool": {"should": [in_stock] if in_stock_only else [*shown_out_of_stock, in_stock]},
+    }
+
+
+@functools.lru_cache(maxsize=8)
+def _static_params(filters: str) -> str:
+    # the filters don't change between searches, they are encoded once
+    return urllib.parse.urlencode(dict(appId=4, filters=filters, isSearch="true", languageId=1))
+
+
+@dataclasses.dataclass(frozen=True)
+class CatalogQuery:
+    query: str
+    page: int = 0
+    size: int = KESHET_PAGE_SIZE
+    # JSON of `catalog_filters`, a string so queries are hashable
+    filters: str = json.dumps(catalog_filters(), separators=(",", ":"))
+
+    def url(self) -> str:
+        page = urllib.parse.urlencode({"from": self.page * self.size, "size": self.size, "query": self.query})
+        return f"{CATALOG_ENDPOINT}?{_static_params(self.filters)}&{page}"
+
+    def next_page(self) -> "CatalogQuery":
+        return dataclasses.replace(self, page=self.page + 1)
+
+
+def _cart_update_endpoint() -> str:
+    # the cart is resolved on first use, importing the provider doesn't need the credentials
+    return f"{BASE_URL}/carts/{os.environ['CART_ID']}?appId=4"
 
 
 class KeshetError(Exception):
@@ -22,91 +82,165 @@ class KeshetError(Exception):
 
 
 async def _request(
-    url: str, method: str = "POST", headers: dict = {}, body: dict = {}
+    url: str,
+    method: str = "POST",
+    headers: dict = {},
+    body: dict = {},
+    step: str = "request",
+    idempotent: typing.Optional[bool] = None,
 ) -> typing.Coroutine[typing.Any, None, None]:
     """
-    Generate request to RamiLevy
+    Generate request to Keshet
     """
 
+    # the vendor specific key allows serving several vendors from one process
+    api_key = os.environ.get("KESHET_API_KEY") or os.environ["VENDOR_API_KEY"]
     DEFAULT_HEADERS = {
         "accept": "*/*",
         "content-type": "application/json;charset=UTF-8",
-        "Authorization": f"Bearer {os.environ['VENDOR_API_KEY']}",
+        "Authorization": f"Bearer {api_key}",
     }
-    async with AsyncClient() as client:
-        response = await client.request(
-            method,
-            url,
-            headers={
-                **DEFAULT_HEADERS,
-                **headers,
-            },
-            **(dict(json=body if body else {})),
-            timeout=30.0,
-        )
 
-        if (response.status_code // 100) != 2:
-            raise KeshetError(
-                f"Request failed with message {response}, {response.status_code}",
-                response.status_code,
+    async def _send() -> httpx.Response:
+        with metrics.vendor_request(VENDOR, step) as record:
+            response = await http_client.get_client(VENDOR).request(
+                method,
+                url,
+                headers={
+                    **DEFAULT_HEADERS,
+                    **headers,
+                },
+                **(dict(json=body if body else {})),
             )
-        return response.json()
+            record(response)
+        return response
 
+    # only reads are retried on a failure after the request was sent, a write may have been applied
+    response = await resilience.call(
+        VENDOR, _send, step, idempotent=method == "GET" if idempotent is None else idempotent
+    )
 
-async def search(item: str) -> dict:
-    return await _request(url=f"{CATALOG_ENDPOINT}&query={item}", method="GET")
+    if (response.status_code // 100) != 2:
+        raise KeshetError(
+            f"Request failed with message {response}, {response.status_code}",
+            response.status_code,
+        )
+    return response.json()
 
 
-async def get_cart() -> list[dict]:
-    response = await _trigger_update({})
-    cart = response.get("cart", {}) or {}
-    cart_items = cart.get("lines", []) or {}
-    return [
-        types.CartItemSchema(
-            id=str(item["id"]), quantity=str(item["quantity"])
-        ).model_dump()
-        for item in cart_items
-    ]
+_prefetched: collections.OrderedDict[CatalogQuery, asyncio.Task] = collections.OrderedDict()
 
 
-async def _get_cart_as_map() -> dict[str, int]:
-    cart = await get_cart()
-    return {item["id"]: item["quantity"] for item in cart}
+def products_of(response: dict) -> list[dict]:
+    return response.get("suggestions", {}).get("suggestProducts", {}).get("products", []) or []
 
 
-async def _trigger_update(items: dict[str, int]) -> typing.Coroutine[None, None, None]:
-    formatted_items = [
-        {
-            "quantity": int(quantity),
-            "soldBy": None,
-            "retailerProductId": int(_id),
-            "type": 1,
-            **(dict(delete=True, isCase=False) if not quantity else {}),
-        }
-        for _id, quantity in items.items()
-    ]
-    result = await _request(
-        url=CART_UPDATE_ENDPOINT,
+def _prefetch(query: CatalogQuery) -> None:
+    if query in _prefetched:
+        return
+    task = asyncio.create_task(_request(url=query.url(), method="GET", step="search_prefetch"))
+    # the failure is raised to the search asking for the page
+    task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    _prefetched[query] = task
+    while len(_prefetched) > KESHET_PREFETCH_PAGES:
+        _, dropped = _prefetched.popitem(last=False)
+        dropped.cancel()
+
+
+async def search(item: typing.Union[str, CatalogQuery]) -> dict:
+    """
+    A page of the catalog search, the prefetched one when available. The next page is prefetched when this one
+    is a full `search_more` page: the first page of every search (compare_prices, refreshes) doesn't double the load
+    """
+    query = item if isinstance(item, CatalogQuery) else CatalogQuery(item)
+    if (prefetched := _prefetched.pop(query, None)) is not None:
+        try:
+            response = await prefetched
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.info(f"Prefetching {query} failed, searching again: {e!r}")
+            response = await _request(url=query.url(), method="GET", step="search")
+    else:
+        response = await _request(url=query.url(), method="GET", step="search")
+    if KESHET_PREFETCH and query.page > 0 and len(products_of(response)) >= query.size:
+        _prefetch(query.next_page())
+    return response
+
+
+def clear_prefetched() -> None:
+    while _prefetched:
+        _prefetched.popitem()[1].cancel()
+
+
+def _parse_cart(response: dict) -> cart_state.CartSnapshot:
+    cart = response.get("cart", {}) or {}
+    cart_items = cart.get("lines", []) or []
+    return cart_state.CartSnapshot(
+        lines={str(item["id"]): str(item["quantity"]) for item in cart_items}
+    )
+
+
+async def _patch_lines(lines: list[dict], step: str) -> dict:
+    return await _request(
+        url=_cart_update_endpoint(),
         body={
-            "lines": formatted_items,
+            "lines": lines,
             "deliveryProduct_Id": 3766099,
             "deliveryType": 1,
             "source": "Autocomplete Results",
         },
         headers={"x-http-method-override": "PATCH"},
+        step=step,
+        # without lines the PATCH only reads the cart
+        idempotent=not lines,
     )
-    return result
 
 
-async def remove_from_cart(items_to_remove: list[types.CartItemSchema]) -> list[dict]:
-    cart = await get_cart()
-    for item in items_to_remove:
-        cart[item["id"]] = 0
-    return await _trigger_update(cart)
+async def _fetch_cart() -> cart_state.CartSnapshot:
+    return _parse_cart(await _patch_lines([], step="get_cart"))
+
+
+_cart = cart_state.CartMirror(_fetch_cart)
+
+
+async def get_cart() -> list[dict]:
+    await _cart.sync()
+    return _cart.as_list()
+
+
+def _format_line(_id: str, quantity: typing.Optional[str]) -> dict:
+    return {
+        "quantity": int(quantity or 0),
+        "soldBy": None,
+        "retailerProductId": int(_id),
+        "type": 1,
+        **(dict(delete=True, isCase=False) if quantity is None else {}),
+    }
+
+
+async def _trigger_update(
+    delta: cart_state.CartDelta, _items: dict[str, str]
+) -> cart_state.CartSnapshot:
+    # the cart is PATCHed, so only the changed lines are sent
+    formatted_items = [
+        _format_line(_id, quantity) for _id, quantity in delta.upserts.items()
+    ] + [_format_line(_id, None) for _id in delta.removed]
+    return _parse_cart(await _patch_lines(formatted_items, step="update_cart"))
+
+
+async def remove_from_cart(items_to_remove: list[types.CartItemSchema]) -> cart_state.CartUpdate:
+    ids_to_remove = {item.id for item in items_to_remove}
+    return await _cart.apply(
+        lambda cart: {
+            _id: quantity for _id, quantity in cart.items() if _id not in ids_to_remove
+        },
+        _trigger_update,
+    )
+
 
+async def update_cart(items: list[types.CartItemSchema]) -> cart_state.CartUpdate:
+    def _desired(cart: dict[str, str]) -> dict[str, str]:
+        for item in items:
+            cart[item.id] = item.quantity
+        return cart
 
-async def update_cart(items: list[types.CartItemSchema]) -> list[dict]:
-    cart = await _get_cart_as_map()
-    for item in items:
-        cart[item.id] = item.quantity
-    return await _trigger_update(cart)
+    return await _cart.apply(_desired, _trigger_update)
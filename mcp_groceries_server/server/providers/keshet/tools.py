@@ -1,7 +1,7 @@
 import json
 import logging
 
-from mcp_groceries_server.server import types
+from mcp_groceries_server.server import formatting, types, units
 from mcp_groceries_server.server.providers.interface.provider import Provider
 
 from . import _service as service
@@ -10,37 +10,82 @@ logger = logging.getLogger(__name__)
 
 
 class KeshetProvider(Provider):
+    vendor = service.VENDOR
+    store_id = service.BRANCH_ID
+
+    def __init__(self, namespace: str = ""):
+        super().__init__(namespace)
+        self._add_tool(
+            self.search_more,
+            name="search_more",
+            description="More results for a search term when the first results had no good match, page 1 follows the first search results",
+        )
+
     async def add_items_to_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]:
         result = await service.update_cart(items)
+        self.record_purchases(items)
         return {
-            "content": [{"type": "text", "text": json.dumps(result)}],
+            "content": [{"type": "text", "text": json.dumps(formatting.format_cart(result.cart, result.changed, response_format))}],
         }
 
     async def remove_items_from_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]:
         result = await service.remove_from_cart(items)
         return {
-            "content": [{"type": "text", "text": json.dumps(result)}],
+            "content": [{"type": "text", "text": json.dumps(formatting.format_cart(result.cart, result.changed, response_format))}],
         }
 
-    async def search(self, item: str) -> dict[str, list[dict]]:
+    async def warm_up(self) -> None:
+        # opens the pooled connection and fills the cart mirror the first cart update would fetch
+        await super().warm_up()
+        await service.get_cart()
+
+    async def search_products(self, item: str) -> list[dict]:
         result = await service.search(item)
-        products = (
-            result.get("suggestions", {}).get("suggestProducts", {}).get("products", [])
-        )
-        items = [transform_product(item) for item in products]
+        items = [transform_product(item) for item in service.products_of(result)]
         logger.info(f"Found {len(items)} items for {item}: {items}")
-        return {"content": [{"type": "text", "text": items}]}
+        return items
+
+    async def search_more(
+        self,
+        item: str,
+        page: int = 1,
+        response_format: formatting.SearchFormat = formatting.SEARCH_RESPONSE_FORMAT,
+    ) -> dict[str, list[dict]]:
+        # prefetched when the previous `search_more` page was full and KESHET_PREFETCH is on
+        result = await service.search(service.CatalogQuery(item, page=page))
+        items = [transform_product(product) for product in service.products_of(result)]
+        self.catalog_store().add_products(items)
+        return {"content": [{"type": "text", "text": formatting.format_products(self._fresh(units.sort_by_unit_price(items)), response_format)}]}
+
+    async def aclose(self) -> None:
+        service.clear_prefetched()
+        await super().aclose()
 
 
 def transform_product(product: dict):
     quantity_object = product.get("original", {}).get("unitOfMeasure", {}) or {}
-    return dict(
-        id=product.get("id"),
-        name=product.get("localName"),
-        price=product.get("branch", {}).get("regularPrice"),
-        quantity_evaluation=quantity_object,
+    package_size = (
+        f"{product['weight']} {quantity_object.get('defaultName', '')}"
+        if product.get("weight")
+        else None
+    )
+    return units.annotate(
+        dict(
+            id=product.get("id"),
+            name=product.get("localName"),
+            price=product.get("branch", {}).get("regularPrice"),
+            quantity_evaluation=quantity_object,
+            out_of_stock=bool(product.get("branch", {}).get("isOutOfStock")) or None,
+        ),
+        package_size,
+        product.get("localName"),
+        sold_by_weight=bool(product.get("isWeighable")),
     )
@@ -2,17 +2,25 @@ import datetime
 import os
 import typing
 
-from httpx import AsyncClient
+import httpx
 
-from mcp_groceries_server.server import types
+from mcp_groceries_server.server import cart_state, http_client, metrics, resilience, types
 
-BASE_URL = "https://www.rami-levy.co.il/api"
+VENDOR = "rami-levy"
+# site and customer API hosts, overridable to run against local stand-ins (see benchmarks/)
+RAMI_LEVY_URL = os.environ.get("RAMI_LEVY_URL", "https://www.rami-levy.co.il")
+RAMI_LEVY_API_URL = os.environ.get("RAMI_LEVY_API_URL", "https://www-api.rami-levy.co.il")
+BASE_URL = f"{RAMI_LEVY_URL}/api"
 CATALOG_ENDPOINT = f"{BASE_URL}/catalog"
 CART_UPDATE_ENDPOINT = f"{BASE_URL}/v2/cart"
-CART_QUERY_ENDPOINT = f"https://www-api.rami-levy.co.il/api/v2/site/clubs/customer/{os.environ['VENDOR_ACCOUNT_ID']}"
 STORE_ID = "331"  # ONLINE STORE ID
 
 
+def _cart_query_endpoint() -> str:
+    # the account is resolved on first use, importing the provider doesn't need the credentials
+    return f"{RAMI_LEVY_API_URL}/api/v2/site/clubs/customer/{os.environ['VENDOR_ACCOUNT_ID']}"
+
+
 class RamiLevyError(Exception):
     def __init__(self, message: str, status: typing.Optional[int] = None):
         super().__init__(message)
@@ -20,37 +28,53 @@ class RamiLevyError(Exception):
 
 
 async def _request(
-    url: str, method: str = "POST", headers: dict = {}, body: dict = {}
+    url: str,
+    method: str = "POST",
+    headers: dict = {},
+    body: dict = {},
+    step: str = "request",
+    idempotent: typing.Optional[bool] = None,
 ) -> typing.Coroutine[typing.Any, None, None]:
     """
     Generate request to RamiLevy
     """
 
+    # the vendor specific key allows serving several vendors from one process
+    api_key = os.environ.get("RAMI_LEVY_API_KEY") or os.environ["VENDOR_API_KEY"]
     DEFAULT_HEADERS = {
         "accept": "application/json, text/plain, */*",
         "content-type": "application/json;charset=UTF-8",
-        "Authorization": f"Bearer {os.environ['VENDOR_API_KEY']}",
-        "ecomtoken": os.environ["VENDOR_API_KEY"],
+        "Authorization": f"Bearer {api_key}",
+        "ecomtoken": api_key,
         "locale": "he",
     }
-    async with AsyncClient() as client:
-        response = await client.request(
-            method,
-            url,
-            headers={
-                **DEFAULT_HEADERS,
-                **headers,
-            },
-            **(dict(json=body if body else {})),
-        )
 
-        if (response.status_code // 100) != 2:
-            raise RamiLevyError(
-                f"Request failed with message {response}, {response.status_code}",
-                response.status_code,
+    async def _send() -> httpx.Response:
+        with metrics.vendor_request(VENDOR, step) as record:
+            response = await http_client.get_client(VENDOR).request(
+                method,
+                url,
+                headers={
+                    **DEFAULT_HEADERS,
+                    **headers,
+                },
+                **(dict(json=body if body else {})),
             )
+            record(response)
+        return response
+
+    # only reads are retried on a failure after the request was sent, a write may have been applied
+    response = await resilience.call(
+        VENDOR, _send, step, idempotent=method == "GET" if idempotent is None else idempotent
+    )
+
+    if (response.status_code // 100) != 2:
+        raise RamiLevyError(
+            f"Request failed with message {response}, {response.status_code}",
+            response.status_code,
+        )
 
-        return response.json()
+    return response.json()
 
 
 async def search(item: str) -> dict:
@@ -61,25 +85,34 @@ async def search(item: str) -> dict:
             store=STORE_ID,
             aggs=1,
         ),
+        step="search",
+        # a POST, but only reads the catalog
+        idempotent=True,
     )
 
 
-async def get_cart() -> list[dict]:
-    response = await _request(url=CART_QUERY_ENDPOINT, method="GET")
+async def _fetch_cart() -> cart_state.CartSnapshot:
+    response = await _request(url=_cart_query_endpoint(), method="GET", step="get_cart")
     cart = response.get("cart", {}) or {}
     cart_items = cart.get("items", {}) or {}
-    return [
-        types.CartItemSchema(id=str(_id), quantity=str(quantity)).model_dump()
-        for _id, quantity in cart_items.items()
-    ]
+    return cart_state.CartSnapshot(
+        lines={str(_id): str(quantity) for _id, quantity in cart_items.items()}
+    )
+
 
+# the whole cart is written, so a mirror older than CART_WRITE_MAX_AGE is fetched again before a write
+_cart = cart_state.CartMirror(_fetch_cart, write_max_age=cart_state.CART_WRITE_MAX_AGE)
 
-async def _get_cart_as_map() -> dict[str, int]:
-    cart = await get_cart()
-    return {item.get("id"): item.get("quantity") for item in cart}
+
+async def get_cart() -> list[dict]:
+    await _cart.sync()
+    return _cart.as_list()
 
 
-async def _trigger_update(items: dict[str, int]) -> typing.Coroutine[None, None, None]:
+async def _trigger_update(
+    _delta: cart_state.CartDelta, items: dict[str, str]
+) -> typing.Optional[cart_state.CartSnapshot]:
+    # the cart endpoint only accepts the whole cart, the mirror skips the no-op writes
     await _request(
         url=CART_UPDATE_ENDPOINT,
         body=dict(
@@ -91,27 +124,28 @@ async def _trigger_update(items: dict[str, int]) -> typing.Coroutine[None, None,
             items=items,
             meta=None,
         ),
+        step="update_cart",
     )
+    return None
 
 
-async def remove_from_cart(items_to_remove: list[types.CartItemSchema]) -> list[dict]:
-    cart = await _get_cart_as_map()
-    for item in items_to_remove:
-        del cart[item.id]
-
-    await update_cart(cart)
-    return await get_cart()
+async def remove_from_cart(items_to_remove: list[types.CartItemSchema]) -> cart_state.CartUpdate:
+    ids_to_remove = {item.id for item in items_to_remove}
+    return await _cart.apply(
+        lambda cart: {
+            _id: quantity for _id, quantity in cart.items() if _id not in ids_to_remove
+        },
+        _trigger_update,
+    )
 
 
 async def update_cart(
     items: list[types.CartItemSchema], reset: bool = False
-) -> list[dict]:
-    new_cart = {}
-    if not reset:
-        new_cart = await _get_cart_as_map()
-
-    for item in items:
-        new_cart[item.id] = item.quantity
-
-    await _trigger_update(new_cart)
-    return await get_cart()
+) -> cart_state.CartUpdate:
+    def _desired(cart: dict[str, str]) -> dict[str, str]:
+        new_cart = {} if reset else cart
+        for item in items:
+            new_cart[item.id] = item.quantity
+        return new_cart
+
+    return await _cart.apply(_desired, _trigger_update)
@@ -1,41 +1,61 @@
 import json
 
-from mcp_groceries_server.server import types
+from mcp_groceries_server.server import formatting, types, units
 from mcp_groceries_server.server.providers.interface.provider import Provider
 
 from . import _service as service
 
 
 class RamiLevyProvider(Provider):
+    vendor = service.VENDOR
+    store_id = service.STORE_ID
+    # the search and cart writes host, the cart is read from the API host
+    warm_up_urls = (service.RAMI_LEVY_URL,)
+
     async def add_items_to_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]:
         result = await service.update_cart(items)
+        self.record_purchases(items)
         return {
-            "content": [{"type": "text", "text": json.dumps(result)}],
+            "content": [{"type": "text", "text": json.dumps(formatting.format_cart(result.cart, result.changed, response_format))}],
         }
 
     async def remove_items_from_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]:
         result = await service.remove_from_cart(items)
         return {
-            "content": [{"type": "text", "text": json.dumps(result)}],
+            "content": [{"type": "text", "text": json.dumps(formatting.format_cart(result.cart, result.changed, response_format))}],
         }
 
-    async def search(self, item: str) -> dict[str, list[dict]]:
+    async def warm_up(self) -> None:
+        # connects both hosts and fills the cart mirror the first cart update would fetch
+        await super().warm_up()
+        await service.get_cart()
+
+    async def search_products(self, item: str) -> list[dict]:
         result = await service.search(item)
-        items = [transform_product(item) for item in result.get("data", [])]
-        return {"content": [{"type": "text", "text": items}]}
+        return [transform_product(item) for item in result.get("data", [])]
 
 
 def transform_product(product: dict):
     quantity_object = product.get("gs", {}) or {}
     quantity_object = quantity_object.get("Product_Dimensions", {}) or {}
     quantity_object = quantity_object.get("Net_Weight")
-    return dict(
-        id=product.get("id"),
-        name=product.get("name"),
-        price=product.get("price", {}).get("price"),
-        quantity_evaluation=quantity_object,
+    return units.annotate(
+        dict(
+            id=product.get("id"),
+            name=product.get("name"),
+            price=product.get("price", {}).get("price"),
+            quantity_evaluation=quantity_object,
+        ),
+        quantity_object,
+        product.get("name"),
+        # weighted products are priced per kg, their net weight is a sample package
+        sold_by_weight=bool(product.get("is_weighted")),
     )
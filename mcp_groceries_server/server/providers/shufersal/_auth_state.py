@@ -0,0 +1,79 @@
+import base64
+import functools
+import hashlib
+import json
+import logging
+import os
+import typing
+
+AUTH_STATE_DIR = os.environ.get("AUTH_STATE_DIR", "/var/lib/groceries_mcp_data/auth_state")
+AUTH_STATE_KEY = os.environ.get("AUTH_STATE_KEY", "")
+_KEY_SALT = b"groceries-mcp-auth-state"
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def _fernet(secret: str) -> typing.Any:
+    # `cryptography` is optional, without it the auth state is not persisted
+    try:
+        from cryptography.fernet import Fernet  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    key = hashlib.pbkdf2_hmac("sha256", secret.encode(), _KEY_SALT, 200_000)
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+class AuthStateStore:
+    """
+    Browser storage state (cookies and local storage) per user, encrypted at rest.
+    Persisting is disabled when no secret is configured or `cryptography` is not installed.
+    """
+
+    def __init__(self, directory: str = AUTH_STATE_DIR, secret: str = AUTH_STATE_KEY):
+        self.directory = directory
+        self._secret = secret
+
+    @functools.cached_property
+    def _fernet(self) -> typing.Any:
+        # derived on first use, the key derivation and `cryptography` import are too slow for the server startup
+        fernet = _fernet(self._secret) if self._secret else None
+        if not fernet:
+            logger.warning("Auth state persistence is disabled, set AUTH_STATE_KEY and install cryptography to enable it")
+        return fernet
+
+    @property
+    def enabled(self) -> bool:
+        return self._fernet is not None
+
+    def _path(self, user: str) -> str:
+        # the user name is not written to disk in clear
+        digest = hashlib.sha256(user.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}.state")
+
+    def load(self, user: str) -> typing.Optional[dict]:
+        if not self._fernet or not os.path.exists(path := self._path(user)):
+            return None
+        try:
+            with open(path, "rb") as state_file:
+                return json.loads(self._fernet.decrypt(state_file.read()))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.warning(f"Dropping unreadable auth state of {path}: {e!r}")
+            self.delete(user)
+            return None
+
+    def save(self, user: str, state: dict) -> None:
+        if not self._fernet:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(user)
+        temp_path = f"{path}.tmp"
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as state_file:
+            state_file.write(self._fernet.encrypt(json.dumps(state).encode()))
+        os.replace(temp_path, path)
+
+    def delete(self, user: str) -> None:
+        try:
+            os.remove(self._path(user))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import dataclasses
+import logging
+import os
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from playwright.async_api import Browser, BrowserContext, Page
+
+logger = logging.getLogger(__name__)
+
+POOL_MAX_CONTEXTS = int(os.environ.get("SHUFERSAL_POOL_MAX_CONTEXTS", "4"))
+POOL_MAX_PAGES = int(os.environ.get("SHUFERSAL_POOL_MAX_PAGES", "3"))
+POOL_IDLE_TIMEOUT = float(os.environ.get("SHUFERSAL_POOL_IDLE_TIMEOUT", "600"))
+
+
+@dataclasses.dataclass(eq=False)
+class _PooledContext:
+    session: str
+    # None while the context is being created
+    context: typing.Optional[BrowserContext] = None
+    idle_pages: list[Page] = dataclasses.field(default_factory=list)
+    busy_pages: set[Page] = dataclasses.field(default_factory=set)
+    reserved: int = 0
+    last_used: float = 0.0
+    # set once the context was created, or failed to be (context left None)
+    ready: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.idle_pages) + len(self.busy_pages) + self.reserved
+
+    @property
+    def in_use(self) -> bool:
+        return bool(self.busy_pages) or self.reserved > 0
+
+
+class BrowserPool:
+    """
+    Pool of browser contexts, one per auth session, each holding up to `max_pages` pages.
+    A page is checked out by a single caller at a time, so concurrent sessions never share a page.
+    The browser launch, context creation and page navigation run outside of the pool lock, so the sessions
+    are set up in parallel.
+    """
+
+    def __init__(
+        self,
+        launch: typing.Callable[[], typing.Awaitable[Browser]],
+        create_context: typing.Callable[[Browser, str], typing.Awaitable[BrowserContext]],
+        prepare_page: typing.Callable[[Page], typing.Awaitable[None]],
+        max_contexts: int = POOL_MAX_CONTEXTS,
+        max_pages: int = POOL_MAX_PAGES,
+        idle_timeout: float = POOL_IDLE_TIMEOUT,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        self._launch = launch
+        self._create_context = create_context
+        self._prepare_page = prepare_page
+        self.max_contexts = max_contexts
+        self.max_pages = max_pages
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._browser: typing.Optional[Browser] = None
+        self._contexts: dict[str, _PooledContext] = {}
+        self._condition = asyncio.Condition()
+        self._launch_lock = asyncio.Lock()
+        self._reaper: typing.Optional[asyncio.Task] = None
+
+    def occupancy(self) -> dict[str, int]:
+        return dict(
+            contexts=len(self._contexts),
+            busy_pages=sum(len(pooled.busy_pages) for pooled in self._contexts.values()),
+            idle_pages=sum(len(pooled.idle_pages) for pooled in self._contexts.values()),
+        )
+
+    async def _ensure_browser(self) -> Browser:
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                # contexts of a disconnected browser are gone with it
+                self._contexts.clear()
+                self._browser = await self._launch()
+            return self._browser
+
+    async def _close_contexts(self, contexts: list[_PooledContext]) -> None:
+        for pooled in contexts:
+            if pooled.context is None:
+                continue
+            try:
+                await pooled.context.close()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning(f"Failed closing browser context of {pooled.session}: {e}")
+
+    def _pop_idle(self) -> list[_PooledContext]:
+        """
+        Remove the contexts idle for more than `idle_timeout`, they are closed by the caller outside of the lock
+        """
+        now = self._clock()
+        expired = [
+            pooled for pooled in self._contexts.values()
+            if not pooled.in_use and pooled.context is not None and now - pooled.last_used > self.idle_timeout
+        ]
+        for pooled in expired:
+            self._contexts.pop(pooled.session, None)
+        return expired
+
+    async def evict_idle(self) -> None:
+        """
+        Close the contexts idle for more than `idle_timeout`
+        """
+        async with self._condition:
+            expired = self._pop_idle()
+        await self._close_contexts(expired)
+
+    async def _reap(self) -> None:
+        # an idle pool frees its contexts without waiting for the next checkout
+        while self._contexts:
+            await asyncio.sleep(self.idle_timeout / 2)
+            await self.evict_idle()
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    def _reserve(self, session: str) -> tuple[typing.Optional[_PooledContext], bool, list[_PooledContext]]:
+        """
+        Reserve a page slot of the session context under the lock: the context, whether the caller creates it
+        and the contexts to close. The context is None when the pool is full of busy contexts.
+        """
+        evicted = self._pop_idle()
+        pooled = self._contexts.get(session)
+        create = pooled is None
+        if create:
+            if len(self._contexts) >= self.max_contexts:
+                idle = [pooled for pooled in self._contexts.values() if not pooled.in_use and pooled.context is not None]
+                if not idle:
+                    return None, False, evicted
+                least_recent = min(idle, key=lambda pooled: pooled.last_used)
+                self._contexts.pop(least_recent.session, None)
+                evicted.append(least_recent)
+            pooled = _PooledContext(session=session, last_used=self._clock())
+            self._contexts[session] = pooled
+        return pooled, create, evicted
+
+    async def checkout(self, session: str) -> Page:
+        browser = await self._ensure_browser()
+        evicted: list[_PooledContext] = []
+        page = None
+        async with self._condition:
+            while True:
+                pooled, create, closing = self._reserve(session)
+                evicted.extend(closing)
+                if pooled is not None:
+                    while pooled.idle_pages:
+                        idle_page = pooled.idle_pages.pop()
+                        if not idle_page.is_closed():
+                            pooled.busy_pages.add(idle_page)
+                            pooled.last_used = self._clock()
+                            page = idle_page
+                            break
+                    if page is not None:
+                        break
+                    if pooled.page_count < self.max_pages:
+                        pooled.reserved += 1
+                        break
+                await self._condition.wait()
+        self._start_reaper()
+        await self._close_contexts(evicted)
+        if page is not None:
+            return page
+
+        # the context and pages are created outside of the lock, they are slow
+        try:
+            if create:
+                pooled.context = await self._create_context(browser, session)
+                pooled.ready.set()
+            else:
+                await pooled.ready.wait()
+                if pooled.context is None:
+                    raise RuntimeError(f"Creating the browser context of {session} failed")
+            page = await pooled.context.new_page()
+            await self._prepare_page(page)
+        except BaseException:
+            async with self._condition:
+                pooled.reserved -= 1
+                if pooled.context is None:
+                    # the waiting checkouts of the session fail too, the next ones create it again
+                    if self._contexts.get(session) is pooled:
+                        self._contexts.pop(session)
+                    pooled.ready.set()
+                self._condition.notify_all()
+            raise
+
+        async with self._condition:
+            pooled.reserved -= 1
+            pooled.busy_pages.add(page)
+            pooled.last_used = self._clock()
+        return page
+
+    async def checkin(self, page: Page, discard: bool = False) -> None:
+        async with self._condition:
+            for pooled in self._contexts.values():
+                if page in pooled.busy_pages:
+                    pooled.busy_pages.discard(page)
+                    pooled.last_used = self._clock()
+                    if not discard and not page.is_closed():
+                        pooled.idle_pages.append(page)
+                        break
+                    with contextlib.suppress(Exception):
+                        await page.close()
+                    break
+            expired = self._pop_idle()
+            self._condition.notify_all()
+        await self._close_contexts(expired)
+
+    @contextlib.asynccontextmanager
+    async def page(self, session: str) -> typing.AsyncIterator[Page]:
+        """
+        Check out a page of the session for the duration of the block.
+        A page that failed the block is discarded, it may be left mid navigation.
+        """
+        page = await self.checkout(session)
+        try:
+            yield page
+        except BaseException:
+            await self.checkin(page, discard=True)
+            raise
+        await self.checkin(page)
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        async with self._condition:
+            contexts, self._contexts = list(self._contexts.values()), {}
+            self._condition.notify_all()
+        await self._close_contexts(contexts)
+        async with self._launch_lock:
+            if self._browser is not None:
+                with contextlib.suppress(Exception):
+                    await self._browser.close()
+            self._browser = None
@@ -1,25 +1,38 @@
+from __future__ import annotations
+
 import asyncio
+import logging
 import os
 import typing
-import sys
+import time
+import weakref
 from typing import Optional, Any
 
-from playwright.async_api import Playwright, Browser, async_playwright, Page, BrowserContext
-from httpx import AsyncClient
-from mcp_groceries_server.server import types
-from dotenv import load_dotenv
+import httpx
+
+from mcp_groceries_server.server.providers.shufersal._auth_state import AuthStateStore
+from mcp_groceries_server.server.providers.shufersal._browser_pool import BrowserPool
+from mcp_groceries_server.server import http_client, metrics, resilience, types
+
+if typing.TYPE_CHECKING:
+    from playwright.async_api import Playwright, Browser, Page, BrowserContext, PlaywrightContextManager
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-BASE_URL = "https://www.shufersal.co.il/online/he"
-AUTH_URL = "https://www.shufersal.co.il/online/he/login"
+VENDOR = "shufersal"
+# overridable to run against a local stand-in (see benchmarks/)
+SHUFERSAL_URL = os.environ.get("SHUFERSAL_URL", "https://www.shufersal.co.il")
+BASE_URL = f"{SHUFERSAL_URL}/online/he"
+AUTH_URL = f"{BASE_URL}/login"
 CATALOG_ENDPOINT = f"{BASE_URL}/search/results?limit=10"
 CART_ENDPOINT = f"{BASE_URL}/cart"
-STORAGE_STATE = "auth_state.json"
+# Requires a logged in user, anonymous requests are redirected to the login page
+AUTH_CHECK_URL = f"{BASE_URL}/my-account/personal-area/club"
+# 1 sends the cart updates sequentially from the in-page loop
+CART_UPDATE_CONCURRENCY = int(os.environ.get("SHUFERSAL_CART_UPDATE_CONCURRENCY", "4"))
+
+DEFAULT_SESSION = "default"
 
-_browser: Optional[Browser | Playwright] = None
-_page: Optional[Page] = None
-_context: Optional[BrowserContext] = None
 _playwright_instance: Optional[Playwright] = None # Added for global playwright instance management
 
 # Default headers for Playwright requests to mimic a real browser
@@ -28,7 +41,7 @@ PLAYWRIGHT_HEADERS = {
     "accept-language": "en-US,en;q=0.9,he-IL;q=0.8,he;q=0.7",
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "Cache-Control": "no-cache",
-    "Referer": "https://www.shufersal.co.il/online/he/",
+    "Referer": f"{BASE_URL}/",
     "Sec-Ch-Ua": '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
     "Sec-Ch-Ua-Mobile": '?0',
     "Sec-Ch-Ua-Platform": "macOS",
@@ -82,31 +95,36 @@ class ShufersalError(Exception):
 # The _request function will now only be used for the search method as per the plan.
 # Other methods will use Playwright.
 async def _request(
-    url: str, method: str, headers: typing.Dict[str, str] = PLAYWRIGHT_HEADERS, body: typing.Optional[typing.Dict[str, typing.Any]] = None
+    url: str, method: str, headers: typing.Dict[str, str] = PLAYWRIGHT_HEADERS, body: typing.Optional[typing.Dict[str, typing.Any]] = None, step: str = "request"
 ) -> typing.Any:
     """
     Generate request to Shufersal
     """
     response = None
-    async with AsyncClient() as client:
-        try:
-            response = await client.request(
-                method,
-                url,
-                headers=headers, # Use the passed headers
-                json=body if body else None, # Use json parameter for dict body
-            )
-            if (response.status_code // 100) != 2:
-                raise ShufersalError(
-                    f"Request failed with message {response}, {response.status_code}",
-                    response.status_code,
+    try:
+        async def _send() -> httpx.Response:
+            with metrics.vendor_request(VENDOR, step) as record:
+                response = await http_client.get_client(VENDOR).request(
+                    method,
+                    url,
+                    headers=headers, # Use the passed headers
+                    json=body if body else None, # Use json parameter for dict body
                 )
-            return response.json()
-        except Exception as e:
-            print(f"ERR+++ {str(body)} >>>", method, url, type(e), e, file=sys.stderr)
-            if response:
-                print("ERR RESP+++ >>>", response.text,file=sys.stderr)
-            raise
+                record(response)
+            return response
+
+        response = await resilience.call(VENDOR, _send, step, idempotent=method == "GET")
+        if (response.status_code // 100) != 2:
+            raise ShufersalError(
+                f"Request failed with message {response}, {response.status_code}",
+                response.status_code,
+            )
+        return response.json()
+    except Exception as e:
+        logger.warning(f"Shufersal {method} {url} with {body!r} failed: {e!r}")
+        if response:
+            logger.warning(f"Shufersal response: {response.text}")
+        raise
 
 
 async def take_screenshot(page: Page, name: str):
@@ -115,111 +133,160 @@ async def take_screenshot(page: Page, name: str):
     os.makedirs(screenshot_dir, exist_ok=True)
     path = os.path.join(screenshot_dir, f"{name}.png")
     await page.screenshot(path=path)
-    print(f"Screenshot saved to: {path}", file=sys.stderr)
-
-
-async def launch_local_browser(headless: bool = True) -> Page:
-    global _browser, _page, _playwright_instance
-    if not _browser or not _page:
-        _playwright_instance = await async_playwright().start() # Start Playwright instance
-        _browser = await _playwright_instance.chromium.launch_persistent_context(
-            user_data_dir=os.environ.get("USER_DATA_PATH", "/var/lib/groceries_mcp_data/"),
-            headless=headless
-        )
-        _page = await _browser.new_page()
-        await _page.goto(BASE_URL)
-    return _page
-
-async def launch_browser() -> Page:
-    # return await launch_local_browser()
-    global _browser, _page, _context, _playwright_instance
-    if not _browser or not _page:
+    logger.debug(f"Screenshot saved to: {path}")
+
+
+def async_playwright() -> PlaywrightContextManager:
+    # Playwright is the heaviest import of the server, it is loaded when the browser is first needed
+    from playwright.async_api import async_playwright as _async_playwright  # pylint: disable=import-outside-toplevel
+    return _async_playwright()
+
+
+async def launch_browser() -> Browser:
+    global _playwright_instance
+    if not _playwright_instance:
         _playwright_instance = await async_playwright().start()
-        _browser = await _playwright_instance.chromium.connect(
-            os.environ.get("PLAYWRIGHT_WS_URL", "ws://127.0.0.1:3031/"),
-            slow_mo=500,
-        )
-        _context = await _browser.new_context(
-            user_agent=PLAYWRIGHT_HEADERS["User-Agent"],
-            viewport={'width': 1920, 'height': 1080},
-            extra_http_headers={"Accept-Language": PLAYWRIGHT_HEADERS["accept-language"]}
-        )
-        # Apply stealth script to all pages in this context
-        await _context.add_init_script(STEALTH_JS)
-        _page = await _context.new_page()
-        await _page.goto(BASE_URL)
-    return _page
+    return await _playwright_instance.chromium.connect(
+        os.environ.get("PLAYWRIGHT_WS_URL", "ws://127.0.0.1:3031/"),
+        slow_mo=500,
+    )
+
+
+_auth_states = AuthStateStore()
+# sessions validated recently skip even the validation fetch
+AUTH_VALIDATION_TTL = float(os.environ.get("SHUFERSAL_AUTH_VALIDATION_TTL", "300"))
+_validated_at: dict[str, float] = {}
+
+
+async def _create_context(browser: Browser, session: str) -> BrowserContext:
+    context = await browser.new_context(
+        # pre-authenticated from the persisted state of the user, if any
+        storage_state=_auth_states.load(session),
+        user_agent=PLAYWRIGHT_HEADERS["User-Agent"],
+        viewport={'width': 1920, 'height': 1080},
+        extra_http_headers={"Accept-Language": PLAYWRIGHT_HEADERS["accept-language"]}
+    )
+    # Apply stealth script to all pages in this context
+    await context.add_init_script(STEALTH_JS)
+    return context
+
+
+async def _prepare_page(page: Page) -> None:
+    await page.goto(BASE_URL)
+
+
+_pool = BrowserPool(launch_browser, _create_context, _prepare_page)
+metrics.callback(
+    "groceries_browser_pool_occupancy",
+    "Shufersal browser pool contexts and pages",
+    ("vendor", "state"),
+    lambda: [((VENDOR, state), count) for state, count in _pool.occupancy().items()],
+)
+
+
+def _session_key() -> str:
+    """
+    The auth session the browser context is bound to, one per Shufersal user
+    """
+    return os.environ.get("USERNAME") or DEFAULT_SESSION
+
+
+async def warm_up(session: Optional[str] = None) -> None:
+    """
+    Launch the browser and open a page of the session (pre-authenticated from its stored state) ahead of the first cart call
+    """
+    async with _pool.page(session or _session_key()):
+        pass
+
 
 async def close_browser() -> None:
-    global _browser, _page, _context, _playwright_instance
-    
-    if _page:
-        await _page.reload()
-    if _context:
-        await _context.close()
-    if isinstance(_browser, Browser):
-        await _browser.close()    
+    global _playwright_instance
+
+    await _pool.close()
     if _playwright_instance:
         await _playwright_instance.stop()
-    
-    _context = None
-    _browser = None
-    _page = None
+
     _playwright_instance = None
 
-async def _execute_browser_script(page: Page, script: str, args: Optional[typing.Dict[str, typing.Any]] = None) -> Any:
+CONSOLE_LOGGER_JS = """
+(() => {
+    if (window.mcpHelper) {
+        return;
+    }
+    window.mcpHelper = {
+        logs: [],
+        originalConsole: {
+            log: console.log,
+            info: console.info,
+            warn: console.warn,
+            error: console.error,
+        },
+    };
+
+    (["log", "info", "warn", "error"]).forEach(method => {
+        console[method] = (...args) => {
+            window.mcpHelper?.logs.push(`[${method}] ${JSON.stringify(args)}`);
+            window.mcpHelper?.originalConsole[method](...args);
+        };
+    });
+})();
+"""
+
+_logged_pages: "weakref.WeakSet[Page]" = weakref.WeakSet()
+
+
+async def _install_console_logger(page: Page) -> None:
+    """
+    Install the console capture shim once per page, it survives reloads as an init script
+    """
+    if page in _logged_pages:
+        return
+    await page.add_init_script(CONSOLE_LOGGER_JS)
+    await page.evaluate(CONSOLE_LOGGER_JS)
+    _logged_pages.add(page)
+
+
+async def _execute_browser_script(page: Page, script: str, args: Optional[typing.Dict[str, typing.Any]] = None, step: str = "script") -> Any:
     """
     Executes JavaScript in the browser context with console logging.
     """
     if args is None:
         args = {}
-    
-    # Inject a console logger into the page context
-    await page.evaluate('''() => {
-        window.mcpHelper = {
-            logs: [],
-            originalConsole: {
-                log: console.log,
-                info: console.info,
-                warn: console.warn,
-                error: console.error,
-            },
-        };
 
-        (["log", "info", "warn", "error"]).forEach(method => {
-            console[method] = (...args) => {
-                window.mcpHelper?.logs.push(`[${method}] ${JSON.stringify(args)}`);
-                window.mcpHelper?.originalConsole[method](...args);
-            };
-        });
-    }''')
+    await _install_console_logger(page)
 
     # Execute the script
-    result = await page.evaluate(script, args)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await page.evaluate(script, args)
+        outcome = "ok"
+    finally:
+        metrics.BROWSER_SCRIPT_SECONDS.observe(time.perf_counter() - started, vendor=VENDOR, step=step, outcome=outcome)
 
-    # Retrieve logs and restore console
+    # Drain the captured logs, the logger stays installed for the next script
     logs = await page.evaluate('''() => {
-        Object.assign(console, window.mcpHelper?.originalConsole);
         const logs = window.mcpHelper?.logs || [];
-        delete window.mcpHelper;
+        if (window.mcpHelper) {
+            window.mcpHelper.logs = [];
+        }
         return logs;
     }''')
-    
+
     for log in logs:
-        print(f"[Browser Console] {log}", file=sys.stderr)
+        logger.debug(f"[Browser Console] {log}")
 
     return result
 
 async def search(item: str) -> typing.Dict[str, typing.Any]:
     return await _request(
         url=f"{CATALOG_ENDPOINT}&q={item}:relevance",
-        method="GET"
+        method="GET",
+        step="search",
     )
 
-async def clear_cart() -> typing.Dict[str, typing.Any]:
-    page = await launch_browser()
-    script = """
-        async () => { # No args needed for clear_cart
+CLEAR_CART_SCRIPT = """
+        async () => { // No args needed for clear_cart
             const response = await fetch('/cart/remove', {
                 method: 'POST',
                 headers: {
@@ -232,117 +299,197 @@ async def clear_cart() -> typing.Dict[str, typing.Any]:
             return result;
         }
     """
-    result = await _execute_browser_script(page, script)
+
+
+async def clear_cart(session: Optional[str] = None) -> typing.Dict[str, typing.Any]:
+    async with _pool.page(session or _session_key()) as page:
+        result = await _execute_browser_script(page, CLEAR_CART_SCRIPT, step="clear_cart")
     return typing.cast(typing.Dict[str, typing.Any], result) # Cast result to dict
 
+UPDATE_CART_SCRIPT = """
+    async ({ items, concurrency }) => {
+        // kept on the page, so the outcomes of the processed items can be read when the script fails
+        const results = window.mcpCartUpdate = new Array(items.length).fill(null);
+        let next = 0;
+        const worker = async () => {
+            while (next < items.length) {
+                const index = next++;
+                const item = items[index];
+                try {
+                    const response = await window.ajaxCall("/cart/add", JSON.stringify({
+                        productCodePost: item.product_id,
+                        productCode: item.product_id,
+                        sellingMethod: item.sellingMethod,
+                        qty: item.qty,
+                        frontQuantity: item.qty,
+                        comment: "",
+                        affiliateCode: ""
+                    }), () => { }, null, {
+                        openFrom: "SEARCH",
+                        recommendationType: "AUTOCOMPLETE_LIST"
+                    });
+                    console.log('update_cart ajaxCall response:', item.product_id, response);
+                    results[index] = { ok: true };
+                } catch (error) {
+                    const message = error?.statusText || error?.message || String(error);
+                    console.error('update_cart ajaxCall failed:', item.product_id, message);
+                    results[index] = { ok: false, error: message };
+                }
+            }
+        };
+        await Promise.all(Array.from({ length: Math.min(concurrency, items.length) }, worker));
+        return results;
+    }
+"""
+
+
+async def _processed_outcomes(page: Page) -> list[typing.Optional[typing.Dict[str, typing.Any]]]:
+    """
+    The outcomes the update script recorded before it failed, none when the page is gone
+    """
+    try:
+        return list(await page.evaluate("() => window.mcpCartUpdate || []"))
+    except Exception:  # pylint: disable=broad-exception-caught
+        return []
+
+
 async def update_cart(
-    items: list[types.CartItemSchema], reset: bool = False
+    items: list[types.CartItemSchema], reset: bool = False, session: Optional[str] = None
 ) -> list[typing.Dict[str, typing.Any]]:
-    page = await launch_browser()
-    results = []
-    for item in items:
-        selling_method = item.selling_method
-        if item.selling_method.lower() == "weight":
-            selling_method = "BY_WEIGHT"
-
-        script = """
-            async (args) => {
-                const response = await window.ajaxCall("/cart/add", JSON.stringify({
-                    productCodePost: args.product_id,
-                    productCode: args.product_id,
-                    sellingMethod: args.sellingMethod,
-                    qty: args.qty,
-                    frontQuantity: args.qty,
-                    comment: "",
-                    affiliateCode: ""
-                }), (rsltScript) => {   
-                    miglog.cart.cartRefresh(rsltScript);
-                    miglog.eventEmitter.emit("cart:addtocartcallback");
-                }, null, {
-                    openFrom: "SEARCH",
-                    recommendationType: "AUTOCOMPLETE_LIST"
-                });
-                console.log('update_cart ajaxCall response:', response);
-                return response;
+    """
+    Send all the cart updates from a single in-page script and reload the page once at the end.
+    With `reset` the cart is emptied first. When the script fails, the items it processed keep their outcome.
+    """
+    args = {
+        "items": [
+            {
+                "product_id": str(item.id),
+                "sellingMethod": "BY_WEIGHT" if item.selling_method.lower() == "weight" else item.selling_method,
+                "qty": int(item.quantity),
             }
-        """
-
-        args = {
-            "product_id": str(item.id),
-            "sellingMethod": selling_method,
-            "qty": int(item.quantity),
-        }
+            for item in items
+        ],
+        "concurrency": max(CART_UPDATE_CONCURRENCY, 1),
+    }
+    async with _pool.page(session or _session_key()) as page:
+        if reset:
+            await _execute_browser_script(page, CLEAR_CART_SCRIPT, step="clear_cart")
         try:
-            await _execute_browser_script(page, script, args)
-            await _page.reload()
-            results.append(f"{item.quantity} of {item.id} added")
+            outcomes = await _execute_browser_script(page, UPDATE_CART_SCRIPT, args, step="update_cart")
         except Exception as e:
-            print(e)
+            logger.warning(f"Shufersal cart update failed: {e!r}")
+            outcomes = await _processed_outcomes(page)
+            outcomes = [outcome or {"ok": False, "error": str(e)} for outcome in outcomes]
+            outcomes += [{"ok": False, "error": str(e)}] * (len(items) - len(outcomes))
+
+        if any(outcome.get("ok") for outcome in outcomes):
+            # refresh the site state (mini cart etc.) once for the whole batch
+            await page.reload()
+
+    results = []
+    for item, outcome in zip(items, outcomes):
+        if outcome.get("ok"):
+            results.append(f"{item.quantity} of {item.id} added")
+        else:
             results.append(f"{item.quantity} of {item.id} failed to add")
     return results
 
 
-async def authorize():
-    page = await launch_browser()
+async def _is_authenticated(context: BrowserContext) -> bool:
+    """
+    Cheap session validation, a single authenticated fetch instead of a login page navigation
+    """
     try:
-        print(f"Navigating to {AUTH_URL}", file=sys.stderr)
-        await page.goto(AUTH_URL, wait_until="load")
-        
-        # Wait for login form to be visible instead of fixed sleep
-        try:
-            await page.wait_for_selector("#j_username", timeout=10000)
-        except Exception:
-            print(f"Login form not found, might already be logged in or blocked. {page.url}", file=sys.stderr)
-            # await take_screenshot(page, "login_form_not_found")
-            if page.url == AUTH_URL:
-                raise
-            else:
-                # If we are not on AUTH_URL, we might be logged in
-                await page.reload()
-                return
-
-        if (password := os.environ.get("PASSWORD")) and (username := os.environ.get("USERNAME")):
-            print("Filling login credentials", file=sys.stderr)
-            await page.fill("#j_username", username)
-            await page.fill("#j_password", password)
-            
-            login_btn = await page.query_selector(".btn-login")
-            if login_btn:
-                await login_btn.click()
-                print("Login button clicked", file=sys.stderr)
-            else:
-                print("Login button not found", file=sys.stderr)
-                # await take_screenshot(page, "login_button_missing")
-
-        urls = [
-            # "https://www.shufersal.co.il/online/he/my-account/personal-area/club",
-            # BASE_URL,
-            BASE_URL + "/A"
-        ]
-
-        print("Waiting for redirection after login...", file=sys.stderr)
-        tasks = [
-            asyncio.create_task(page.wait_for_url(url, timeout=30000))
-            for url in urls
-        ]
-        
+        response = await context.request.get(AUTH_CHECK_URL, timeout=10000)
+    except Exception as e:
+        logger.warning(f"Session validation failed: {e}")
+        return False
+    return response.ok and "/login" not in response.url
+
+
+async def _confirm_login(session: str, page: Page) -> bool:
+    """
+    Persist the auth state of the session once a fetch confirms the login, drop it otherwise
+    """
+    if not await _is_authenticated(page.context):
+        logger.warning(f"Login was not confirmed, current URL: {page.url}")
+        _auth_states.delete(session)
+        return False
+    logger.info(f"Logged in successfully, current URL: {page.url}")
+    _auth_states.save(session, await page.context.storage_state())
+    _validated_at[session] = time.monotonic()
+    return True
+
+
+async def authorize(session: Optional[str] = None):
+    session = session or _session_key()
+    validated_at = _validated_at.get(session)
+    if validated_at is not None and time.monotonic() - validated_at < AUTH_VALIDATION_TTL:
+        return
+
+    async with _pool.page(session) as page:
+        if await _is_authenticated(page.context):
+            logger.debug("Session is still valid, skipping login")
+            _validated_at[session] = time.monotonic()
+            return
+        _validated_at.pop(session, None)
+
         try:
-            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-            for task in pending:
-                task.cancel()
-            
-            if not done:
-                print("Timed out waiting for login redirection", file=sys.stderr)
-                # await take_screenshot(page, "login_timeout")
-            else:
-                print(f"Logged in successfully, current URL: {page.url}", file=sys.stderr)
-        except Exception as e:
-            print(f"Error during login redirection: {e}", file=sys.stderr)
-            # await take_screenshot(page, "login_error")
+            logger.debug(f"Navigating to {AUTH_URL}")
+            await page.goto(AUTH_URL, wait_until="load")
+
+            # Wait for login form to be visible instead of fixed sleep
+            try:
+                await page.wait_for_selector("#j_username", timeout=10000)
+            except Exception:
+                logger.warning(f"Login form not found, might already be logged in or blocked. {page.url}")
+                if page.url == AUTH_URL:
+                    raise
+                else:
+                    # If we are not on AUTH_URL, we might be logged in
+                    await page.reload()
+                    await _confirm_login(session, page)
+                    return
+
+            if (password := os.environ.get("PASSWORD")) and (username := os.environ.get("USERNAME")):
+                logger.debug("Filling login credentials")
+                await page.fill("#j_username", username)
+                await page.fill("#j_password", password)
+
+                login_btn = await page.query_selector(".btn-login")
+                if login_btn:
+                    await login_btn.click()
+                    logger.debug("Login button clicked")
+                else:
+                    logger.warning("Login button not found")
+
+            urls = [
+                # "https://www.shufersal.co.il/online/he/my-account/personal-area/club",
+                # BASE_URL,
+                BASE_URL + "/A"
+            ]
+
+            logger.debug("Waiting for redirection after login...")
+            tasks = [
+                asyncio.create_task(page.wait_for_url(url, timeout=30000))
+                for url in urls
+            ]
+
+            try:
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:
+                    task.cancel()
+
+                # a timed out wait is done too, with the TimeoutError as its exception
+                if not any(task.exception() is None for task in done):
+                    logger.warning("Timed out waiting for login redirection")
+                    _auth_states.delete(session)
+                else:
+                    await _confirm_login(session, page)
+            except Exception as e:
+                logger.warning(f"Error during login redirection: {e}")
+                _auth_states.delete(session)
 
-    except Exception as e:
-        print(f"Authorization failed: {e}", file=sys.stderr)
-        # await take_screenshot(page, "auth_failed_exception")
-    #     await page.context.storage_state(path=STORAGE_STATE)
-    # finally:
-    #     await close_browser()
+        except Exception as e:
+            logger.error(f"Authorization failed: {e}")
+            _auth_states.delete(session)
@@ -1,22 +1,30 @@
 import json
 
-from mcp_groceries_server.server import types
+from mcp_groceries_server.server import formatting, types, units
 from mcp_groceries_server.server.providers.interface.provider import Provider
 
 from . import _service as service
 
 
 class ShufersalProvider(Provider):
+    vendor = service.VENDOR
+
     async def add_items_to_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]:
         result = await service.update_cart(items)
+        # the outcomes are in the order of the items, only the added ones were bought
+        self.record_purchases([item for item, outcome in zip(items, result) if outcome.endswith(" added")])
         return {
-            "content": [{"type": "text", "text": json.dumps(result)}],
+            "content": [{"type": "text", "text": json.dumps(formatting.format_cart(result, response_format=response_format))}],
         }
 
     async def remove_items_from_cart(
-        self, items: list[types.CartItemSchema]
+        self,
+        items: list[types.CartItemSchema],
+        response_format: formatting.CartFormat = formatting.CART_RESPONSE_FORMAT,
     ) -> dict[str, list[dict]]:
         if not items:
             result = await service.clear_cart()
@@ -26,27 +34,40 @@ class ShufersalProvider(Provider):
                 item.quantity = "0"
             result = await service.update_cart(items)
         return {
-            "content": [{"type": "text", "text": json.dumps(result)}],
+            "content": [{"type": "text", "text": json.dumps(formatting.format_cart(result, response_format=response_format))}],
         }
 
 
-    async def search(self, item: str) -> dict[str, list[dict]]:
+    async def search_products(self, item: str) -> list[dict]:
         result = await service.search(item)
-        items = map(transform_product, result.get("results", []))
-        return {"content": [{"type": "text", "text": list(items)}]}
-    
+        return list(map(transform_product, result.get("results", [])))
+
     async def authorize(self) -> None:
         await service.authorize()
 
+    async def warm_up(self) -> None:
+        await super().warm_up()
+        await service.warm_up()
+
+    async def aclose(self) -> None:
+        await super().aclose()
+        await service.close_browser()
+
 
 def transform_product(product: dict):
-    return dict(
-        id=product.get("baseProduct"),
-        name=product.get("baseProductDescription"),
-        price=product.get("price", {}).get("value"),
-        quantity_evaluation=product.get("pricePerUnit", {}),
-        selling_method=product.get("sellingMethod"),
-        discounts=product.get("promotionMsg"),
-        branding_name=product.get("brandName"),
-        second_level_category=product.get("secondLevelCategory"),
+    return units.annotate(
+        dict(
+            id=product.get("baseProduct"),
+            name=product.get("baseProductDescription"),
+            price=product.get("price", {}).get("value"),
+            quantity_evaluation=product.get("pricePerUnit", {}),
+            selling_method=product.get("sellingMethod"),
+            discounts=product.get("promotionMsg"),
+            branding_name=product.get("brandName"),
+            second_level_category=product.get("secondLevelCategory"),
+            out_of_stock=(product.get("stock") or {}).get("stockLevelStatus") == "outOfStock" or None,
+        ),
+        product.get("unitDescription"),
+        product.get("baseProductDescription"),
+        sold_by_weight=product.get("sellingMethod") == "BY_WEIGHT",
     )
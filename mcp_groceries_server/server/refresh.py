@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import time
+import typing
+import weakref
+
+from mcp_groceries_server.server import catalog, metrics
+
+REFRESH_ENABLED = os.environ.get("REFRESH_ENABLED", "true").lower() == "true"
+# seconds between two refresh rounds of a vendor
+REFRESH_INTERVAL = float(os.environ.get("REFRESH_INTERVAL", "60"))
+# products refreshed per round, the most accessed first
+REFRESH_BATCH_SIZE = int(os.environ.get("REFRESH_BATCH_SIZE", "20"))
+# vendor searches per second spent on refreshing, per vendor
+REFRESH_RATE = float(os.environ.get("REFRESH_RATE", "1"))
+# products confirmed by the vendor more recently are not refreshed
+REFRESH_AFTER = float(os.environ.get("REFRESH_AFTER", "900"))
+REFRESH_TRACKED_PRODUCTS = int(os.environ.get("REFRESH_TRACKED_PRODUCTS", "500"))
+
+logger = logging.getLogger(__name__)
+
+
+class AccessTracker:
+    """
+    Access counts of the returned products, halved every round so recent accesses weigh more
+    """
+
+    def __init__(self, max_size: int = REFRESH_TRACKED_PRODUCTS):
+        self.max_size = max_size
+        self.counts: dict[str, float] = {}
+
+    def touch(self, product_ids: typing.Iterable[str]) -> None:
+        for _id in product_ids:
+            self.counts[_id] = self.counts.get(_id, 0.0) + 1.0
+        if len(self.counts) > self.max_size:
+            hottest = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[: self.max_size]
+            self.counts = dict(hottest)
+
+    def hottest(self) -> list[str]:
+        return sorted(self.counts, key=self.counts.__getitem__, reverse=True)
+
+    def decay(self) -> None:
+        self.counts = {_id: count / 2 for _id, count in self.counts.items() if count / 2 >= 0.1}
+
+
+class RefreshScheduler:
+    """
+    Refreshes the price, promotions and stock of the hot products of a catalog store in the background, by searching
+    their names on the vendor at most `rate` times per second
+    """
+
+    def __init__(
+        self,
+        vendor: str,
+        store: catalog.CatalogStore,
+        search: typing.Callable[[str], typing.Awaitable[list[dict]]],
+        interval: float = REFRESH_INTERVAL,
+        batch_size: int = REFRESH_BATCH_SIZE,
+        rate: float = REFRESH_RATE,
+        refresh_after: float = REFRESH_AFTER,
+    ):
+        self.vendor = vendor
+        self.store = store
+        self._search = search
+        self.interval = interval
+        self.batch_size = batch_size
+        self.rate = rate
+        self.refresh_after = refresh_after
+        self.accesses = AccessTracker()
+        self._last_search = 0.0
+
+    def touch(self, products: typing.Iterable[dict]) -> None:
+        self.accesses.touch(str(product["id"]) for product in products if product.get("id") is not None)
+
+    def due(self) -> list[str]:
+        """
+        The hot products not confirmed by the vendor for `refresh_after` seconds, hottest first
+        """
+        due = []
+        for _id in self.accesses.hottest():
+            age = self.store.age(_id)
+            if age is not None and age >= self.refresh_after:
+                due.append(_id)
+                if len(due) == self.batch_size:
+                    break
+        return due
+
+    async def _throttle(self) -> None:
+        if self.rate <= 0:
+            return
+        wait = self._last_search + 1 / self.rate - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self._last_search = time.monotonic()
+
+    async def refresh_once(self) -> int:
+        """
+        Refresh a batch of due products, returns how many the vendor returned again
+        """
+        names: dict[str, set[str]] = {}
+        for _id in self.due():
+            if name := self.store.products[_id].get("name"):
+                names.setdefault(str(name), set()).add(_id)
+
+        refreshed = 0
+        for name, product_ids in names.items():
+            await self._throttle()
+            try:
+                products = await self._search(name)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning(f"Refreshing {name} on {self.vendor} failed: {e!r}")
+                metrics.CATALOG_REFRESHES.inc(len(product_ids), vendor=self.vendor, outcome="error")
+                continue
+            # every product of the results is fresh now, not only the hot ones
+            self.store.add_products(products)
+            found = product_ids & {str(product.get("id")) for product in products}
+            refreshed += len(found)
+            metrics.CATALOG_REFRESHES.inc(len(found), vendor=self.vendor, outcome="refreshed")
+            metrics.CATALOG_REFRESHES.inc(len(product_ids - found), vendor=self.vendor, outcome="missing")
+        self.accesses.decay()
+        return refreshed
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh_once()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.warning(f"Refresh round of {self.vendor} failed: {e!r}")
+
+
+_schedulers: "weakref.WeakKeyDictionary[catalog.CatalogStore, RefreshScheduler]" = weakref.WeakKeyDictionary()
+
+
+def scheduler(
+    vendor: str,
+    store: catalog.CatalogStore,
+    search: typing.Callable[[str], typing.Awaitable[list[dict]]],
+) -> RefreshScheduler:
+    """
+    The refresh scheduler of a catalog store, searching the vendor with `search`
+    """
+    if store not in _schedulers:
+        _schedulers[store] = RefreshScheduler(vendor, store, search)
+    return _schedulers[store]
+
+
+def with_freshness(store: catalog.CatalogStore, products: typing.Iterable[dict]) -> list[dict]:
+    """
+    The latest catalog version of the products, with `freshness`: the seconds since the vendor returned them
+    """
+    fresh = []
+    for product in products:
+        _id = str(product.get("id"))
+        if (age := store.age(_id)) is None:
+            fresh.append(product)
+        else:
+            fresh.append(dict(store.products[_id], freshness=int(age)))
+    return fresh
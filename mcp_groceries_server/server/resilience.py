@@ -0,0 +1,220 @@
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import time
+import typing
+
+import httpx
+
+from mcp_groceries_server.server import metrics
+
+VENDOR_RETRY_ATTEMPTS = int(os.environ.get("VENDOR_RETRY_ATTEMPTS", "3"))
+VENDOR_RETRY_BASE_DELAY = float(os.environ.get("VENDOR_RETRY_BASE_DELAY", "0.05"))
+VENDOR_RETRY_MAX_DELAY = float(os.environ.get("VENDOR_RETRY_MAX_DELAY", "2"))
+VENDOR_CONCURRENCY = int(os.environ.get("VENDOR_CONCURRENCY", "8"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# the vendor is overloaded or down, worth another attempt
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# rejected before being processed, so even a cart write can be sent again
+UNPROCESSED_STATUSES = frozenset({429})
+# raised before the request reached the vendor
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, vendor: str, retry_after: float):
+        super().__init__(f"{vendor} is unavailable, retry in {retry_after:.0f}s")
+        self.vendor = vendor
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `threshold` consecutive failures, for `reset_timeout` seconds.
+    Then a single trial call is let through, its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        vendor: str,
+        threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        self.vendor = vendor
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.failures = 0
+        self._opened_at: typing.Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._trial or self._clock() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "open":
+            retry_after = max(0.0, self._opened_at + self.reset_timeout - self._clock())
+            raise CircuitOpenError(self.vendor, retry_after)
+        if state == "half_open":
+            self._trial = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def release(self) -> None:
+        """
+        The call ended without telling whether the vendor is healthy, let another trial through
+        """
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial or self.failures >= self.threshold:
+            if self._opened_at is None or self._trial:
+                logger.warning(f"{self.vendor} circuit opened after {self.failures} failures")
+            self._opened_at = self._clock()
+            self._trial = False
+
+
+def _retry_after(response: httpx.Response) -> typing.Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class VendorPolicy:
+    """
+    Retries, concurrency limit and circuit breaker of the requests to a vendor.
+
+    Idempotent requests (searches, reading the cart) are retried on timeouts,
+    transport errors and 5xx. Cart writes are only retried when the vendor surely didn't process them:
+    the connection was never established or the vendor answered 429.
+    """
+
+    def __init__(
+        self,
+        vendor: str,
+        attempts: int = VENDOR_RETRY_ATTEMPTS,
+        base_delay: float = VENDOR_RETRY_BASE_DELAY,
+        max_delay: float = VENDOR_RETRY_MAX_DELAY,
+        concurrency: int = VENDOR_CONCURRENCY,
+        breaker: typing.Optional[CircuitBreaker] = None,
+    ):
+        self.vendor = vendor
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker(vendor)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._random = random.Random()
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Full jitter exponential backoff before retry number `attempt` (from 1)
+        """
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _should_retry(self, attempt: int, idempotent: bool, response: typing.Optional[httpx.Response], error: typing.Optional[Exception]) -> bool:
+        if attempt >= self.attempts:
+            return False
+        if error is not None:
+            return isinstance(error, UNSENT_ERRORS) or (idempotent and isinstance(error, httpx.TransportError))
+        if response.status_code in UNPROCESSED_STATUSES:
+            return True
+        return idempotent and response.status_code in RETRYABLE_STATUSES
+
+    async def call(
+        self,
+        send: typing.Callable[[], typing.Awaitable[httpx.Response]],
+        step: str,
+        idempotent: bool,
+    ) -> httpx.Response:
+        """
+        Send a request, retrying transient failures.
+        Returns the last response, even an error one, the caller turns it into its vendor error.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            response, error = None, None
+            async with self._semaphore:
+                try:
+                    response = await send()
+                except httpx.TransportError as e:
+                    error = e
+                except BaseException:
+                    # cancelled or a bug, says nothing about the vendor health
+                    self.breaker.release()
+                    raise
+
+            if error is not None or response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+            if not self._should_retry(attempt, idempotent, response, error):
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self.backoff(attempt)
+            if response is not None and (retry_after := _retry_after(response)) is not None:
+                if retry_after > self.max_delay:
+                    return response
+                delay = max(delay, retry_after)
+            metrics.VENDOR_RETRIES.inc(vendor=self.vendor, step=step)
+            logger.info(f"{self.vendor} {step} failed ({error!r} {response}), retry {attempt} in {delay:.3f}s")
+            await asyncio.sleep(delay)
+
+
+_policies: dict[str, VendorPolicy] = {}
+
+
+def get_policy(vendor: str) -> VendorPolicy:
+    """
+    Return the policy of a vendor, shared by all its requests
+    """
+    if vendor not in _policies:
+        _policies[vendor] = VendorPolicy(vendor)
+    return _policies[vendor]
+
+
+async def call(
+    vendor: str,
+    send: typing.Callable[[], typing.Awaitable[httpx.Response]],
+    step: str,
+    idempotent: bool,
+) -> httpx.Response:
+    return await get_policy(vendor).call(send, step, idempotent)
+
+
+metrics.callback(
+    "groceries_vendor_circuit_open",
+    "1 while the circuit breaker of a vendor fails its requests fast",
+    ("vendor",),
+    lambda: [((vendor,), int(policy.breaker.state == "open")) for vendor, policy in _policies.items()],
+)
@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import logging
+import os
+import typing
+
+from mcp_groceries_server.server import catalog
+
+# "" embeds character trigrams locally (typos and word forms, not other languages),
+# "google:<model>" or "ollama:<model>" use a multilingual embedding model, e.g. "google:models/text-embedding-004"
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "64"))
+# cosine similarity below which a product is not considered a match
+SEMANTIC_MIN_SCORE = float(os.environ.get("SEMANTIC_MIN_SCORE", "0.35"))
+SEMANTIC_INDEX_DIR = os.environ.get("SEMANTIC_INDEX_DIR", catalog.CATALOG_DIR)
+
+HASHING_DIMENSIONS = 1024
+
+logger = logging.getLogger(__name__)
+
+
+class Embeddings(typing.Protocol):
+    """
+    The LangChain embeddings interface
+    """
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]: ...
+
+    async def aembed_query(self, text: str) -> list[float]: ...
+
+
+def document_text(product: dict) -> str:
+    return " | ".join(str(product[field]) for field in catalog.INDEXED_FIELDS if product.get(field))
+
+
+class HashingEmbeddings:
+    """
+    Character trigrams of the normalized words hashed into a fixed size vector, no model needed.
+    Close spellings share most trigrams.
+    """
+
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for word in catalog.tokenize(text):
+            padded = f" {word} "
+            for position in range(len(padded) - 2):
+                digest = hashlib.blake2b(padded[position:position + 3].encode(), digest_size=4).digest()
+                vector[int.from_bytes(digest, "little") % self.dimensions] += 1.0
+        return vector
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def get_embeddings(model: str = EMBEDDING_MODEL) -> tuple[str, Embeddings]:
+    """
+    The embeddings of `model` and its name, stored with the index so vectors of another model are not mixed
+    """
+    provider, _, name = model.partition(":")
+    match provider:
+        case "":
+            return f"hashing-{HASHING_DIMENSIONS}", HashingEmbeddings()
+        case "google":
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings  # pylint: disable=import-outside-toplevel
+
+            return model, GoogleGenerativeAIEmbeddings(model=name)
+        case "ollama":
+            from langchain_ollama import OllamaEmbeddings  # pylint: disable=import-outside-toplevel
+
+            return model, OllamaEmbeddings(model=name)
+        case _:
+            raise ValueError(f"Unknown embedding model {model}, expected google:<model> or ollama:<model>")
+
+
+class VectorIndex:
+    """
+    Flat cosine similarity index over the products of a catalog store. Products are queued by `add_products`
+    (or `sync` with the store) and embedded in batches on the next search, only when their text changed.
+    """
+
+    def __init__(self, model: str, embeddings: Embeddings, batch_size: int = EMBEDDING_BATCH_SIZE):
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        self._np = numpy
+        self.model = model
+        self._embeddings = embeddings
+        self.batch_size = batch_size
+        self.ids: list[str] = []
+        self.texts: dict[str, str] = {}
+        self._positions: dict[str, int] = {}
+        self._vectors = numpy.zeros((0, 0), dtype=numpy.float32)
+        self._pending: dict[str, str] = {}
+        self._lock: typing.Optional[asyncio.Lock] = None
+        # the catalog store and version last synced
+        self._catalog: typing.Optional[catalog.CatalogStore] = None
+        self._catalog_version = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add_products(self, products: typing.Iterable[dict]) -> None:
+        for product in products:
+            if product.get("id") is None:
+                continue
+            _id, text = str(product["id"]), document_text(product)
+            if text and self.texts.get(_id) != text:
+                self._pending[_id] = text
+
+    def sync(self, store: catalog.CatalogStore) -> None:
+        """
+        Queue the products of the store changed since the last sync, nothing when its version didn't change
+        """
+        if store is not self._catalog:
+            self._catalog, self._catalog_version = store, 0
+        if store.version == self._catalog_version:
+            return
+        self.add_products(store.changed_since(self._catalog_version))
+        self._catalog_version = store.version
+
+    def _normalized(self, vectors: list[list[float]]) -> typing.Any:
+        array = self._np.asarray(vectors, dtype=self._np.float32)
+        norms = self._np.linalg.norm(array, axis=1, keepdims=True)
+        return array / self._np.where(norms == 0, 1, norms)
+
+    async def _embed(self, texts: list[str]) -> typing.Any:
+        vectors: list[list[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(await self._embeddings.aembed_documents(texts[start:start + self.batch_size]))
+        return self._normalized(vectors)
+
+    async def _embed_queries(self, queries: list[str]) -> typing.Any:
+        # models embedding queries and documents differently (retrieval task types) get the query side
+        return self._normalized(await asyncio.gather(*[self._embeddings.aembed_query(query) for query in queries]))
+
+    async def flush(self) -> None:
+        """
+        Embed the queued products
+        """
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                vectors = await self._embed(list(pending.values()))
+            except BaseException:
+                self._pending = pending | self._pending
+                raise
+            if not len(self.ids):
+                self._vectors = self._np.zeros((0, vectors.shape[1]), dtype=self._np.float32)
+            new_rows = []
+            for (_id, text), vector in zip(pending.items(), vectors):
+                if (position := self._positions.get(_id)) is None:
+                    self._positions[_id] = len(self.ids)
+                    self.ids.append(_id)
+                    new_rows.append(vector)
+                else:
+                    self._vectors[position] = vector
+                self.texts[_id] = text
+            if new_rows:
+                self._vectors = self._np.vstack([self._vectors, self._np.asarray(new_rows)])
+
+    async def search(
+        self,
+        queries: list[str],
+        limit: int = 10,
+        min_score: float = SEMANTIC_MIN_SCORE,
+    ) -> list[list[tuple[str, float]]]:
+        """
+        The ids and scores of the products closest to each query, best first. Queries are embedded as queries
+        """
+        await self.flush()
+        if not queries or not self.ids:
+            return [[] for _ in queries]
+        scores = await self._embed_queries(queries) @ self._vectors.T
+        results = []
+        for row in scores:
+            top = self._np.argsort(-row)[:limit]
+            results.append([(self.ids[position], float(row[position])) for position in top if row[position] >= min_score])
+        return results
+
+    def dump(self) -> dict:
+        return dict(
+            model=self._np.asarray(self.model),
+            ids=self._np.asarray(self.ids, dtype=str),
+            texts=self._np.asarray([self.texts[_id] for _id in self.ids], dtype=str),
+            vectors=self._vectors,
+        )
+
+    def read(self, path: str) -> None:
+        with self._np.load(path, allow_pickle=False) as data:
+            self.load(data)
+
+    def write(self, index_file: typing.BinaryIO) -> None:
+        self._np.savez(index_file, **self.dump())
+
+    def load(self, data: typing.Mapping[str, typing.Any]) -> None:
+        if str(data["model"]) != self.model:
+            # another model, the vectors are not comparable
+            return
+        self.ids = [str(_id) for _id in data["ids"]]
+        self.texts = dict(zip(self.ids, (str(text) for text in data["texts"])))
+        self._positions = {_id: position for position, _id in enumerate(self.ids)}
+        self._vectors = self._np.asarray(data["vectors"], dtype=self._np.float32)
+
+
+class SemanticIndex:
+    """
+    Vector indexes per (vendor, store id), optionally persisted under `directory`
+    """
+
+    def __init__(self, directory: str = SEMANTIC_INDEX_DIR, model: str = EMBEDDING_MODEL):
+        self.directory = directory
+        self.model = model
+        self._embeddings: typing.Optional[tuple[str, Embeddings]] = None
+        self._indexes: dict[tuple[str, str], VectorIndex] = {}
+
+    def _path(self, vendor: str, store_id: str) -> str:
+        return os.path.join(self.directory, f"{vendor}-{store_id or 'default'}.vectors.npz")
+
+    def index(self, vendor: str, store_id: str = "") -> VectorIndex:
+        key = (vendor, store_id)
+        if key not in self._indexes:
+            # the embedding model client is created on first use
+            self._embeddings = self._embeddings or get_embeddings(self.model)
+            index = VectorIndex(*self._embeddings)
+            if self.directory and os.path.exists(path := self._path(vendor, store_id)):
+                try:
+                    index.read(path)
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Ignoring unreadable vector index {path}: {e!r}")
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def save(self) -> None:
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for (vendor, store_id), index in self._indexes.items():
+            if not len(index):
+                continue
+            path = self._path(vendor, store_id)
+            with open(f"{path}.tmp", "wb") as index_file:
+                index.write(index_file)
+            os.replace(f"{path}.tmp", path)
+
+
+semantic_index = SemanticIndex()
@@ -0,0 +1,118 @@
+import os
+import typing
+import weakref
+
+from mcp_groceries_server.server import catalog
+
+SUBSTITUTES_LIMIT = int(os.environ.get("SUBSTITUTES_LIMIT", "5"))
+
+# score weights: name similarity, unit price (cheaper or equal is best) and the same brand
+_NAME_WEIGHT, _PRICE_WEIGHT, _BRAND_WEIGHT = 0.5, 0.3, 0.2
+# around words, geresh and gershayim inside them (קוטג', ק"ג) are kept
+_PUNCTUATION = ",.;:!?()[]{}-–\"*/"
+
+
+def group(product: dict) -> typing.Optional[str]:
+    """
+    The products a product can be substituted with: its vendor category, or the products named
+    with the same first word (the product type in Hebrew names, e.g. "גבינה") when the vendor has no categories
+    """
+    if category := product.get("second_level_category"):
+        return f"category:{catalog.normalize(str(category))}"
+    if words := catalog.tokenize(str(product.get("name") or "")):
+        return f"name:{words[0]}"
+    return None
+
+
+def search_term(product: dict) -> typing.Optional[str]:
+    """
+    The vendor search term bringing more products of the product group
+    """
+    if category := product.get("second_level_category"):
+        return str(category)
+    # the word as named by the vendor, the normalized index token (final letters unified) is not a search term
+    words = [word.strip(_PUNCTUATION) for word in str(product.get("name") or "").split()]
+    return next((word for word in words if word), None)
+
+
+def _words(product: dict) -> set[str]:
+    return {word for word in catalog.tokenize(str(product.get("name") or "")) if not word.isdigit()}
+
+
+def score(product: dict, candidate: dict) -> float:
+    words, candidate_words = _words(product), _words(candidate)
+    name = len(words & candidate_words) / len(words | candidate_words) if words | candidate_words else 0.0
+    if product.get("unit_price") and candidate.get("unit_price"):
+        price = min(1.0, product["unit_price"] / candidate["unit_price"])
+    else:
+        price = 0.5
+    brand = float(bool(product.get("branding_name")) and product.get("branding_name") == candidate.get("branding_name"))
+    return _NAME_WEIGHT * name + _PRICE_WEIGHT * price + _BRAND_WEIGHT * brand
+
+
+def rank(product: dict, candidates: typing.Iterable[dict]) -> list[tuple[dict, float]]:
+    """
+    The candidates best first, the ones priced by another unit (kg vs unit) last
+    """
+    scored = [
+        (candidate, round(score(product, candidate), 3))
+        for candidate in candidates
+        if str(candidate.get("id")) != str(product.get("id"))
+    ]
+    return sorted(
+        scored,
+        key=lambda item: (bool(product.get("unit")) and item[0].get("unit") != product.get("unit"), -item[1]),
+    )
+
+
+class Substitutes:
+    """
+    Ranked substitutes of the products of a catalog store. A group is ranked for all its products at once,
+    and everything is recomputed once the store changes. Products known to be out of stock are not suggested.
+    """
+
+    def __init__(self, store: catalog.CatalogStore):
+        self.store = store
+        self._version = -1
+        self._groups: dict[str, list[str]] = {}
+        self._ranked: dict[str, list[tuple[str, float]]] = {}
+
+    def _sync(self) -> None:
+        if self._version == self.store.version:
+            return
+        self._groups = {}
+        for _id, product in self.store.products.items():
+            if (key := group(product)) is not None:
+                self._groups.setdefault(key, []).append(_id)
+        self._ranked = {}
+        self._version = self.store.version
+
+    def _rank_group(self, key: str) -> None:
+        members = [self.store.products[_id] for _id in self._groups.get(key, [])]
+        for product in members:
+            self._ranked[str(product["id"])] = [(str(candidate["id"]), value) for candidate, value in rank(product, members)]
+
+    def suggest(self, product_id: str, limit: int = SUBSTITUTES_LIMIT) -> list[tuple[dict, float]]:
+        self._sync()
+        product_id = str(product_id)
+        if (product := self.store.products.get(product_id)) is None:
+            return []
+        if product_id not in self._ranked:
+            if (key := group(product)) is None:
+                return []
+            self._rank_group(key)
+        available = [
+            (self.store.products[_id], value)
+            for _id, value in self._ranked[product_id]
+            if not self.store.products[_id].get("out_of_stock")
+        ]
+        return available[:limit]
+
+
+_substitutes: "weakref.WeakKeyDictionary[catalog.CatalogStore, Substitutes]" = weakref.WeakKeyDictionary()
+
+
+def for_store(store: catalog.CatalogStore) -> Substitutes:
+    if store not in _substitutes:
+        _substitutes[store] = Substitutes(store)
+    return _substitutes[store]
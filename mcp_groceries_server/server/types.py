@@ -7,6 +7,7 @@ class CartItemSchema(pydantic.BaseModel):
     id: str = pydantic.Field(description="The id of the item")
     quantity: str = pydantic.Field(description="Quantity of the product")
     selling_method: str = pydantic.Field(description="method of sell, values can be units or weight", default="")
+    term: str = pydantic.Field(description="The shopping list item the product was chosen for, remembered for the next purchases", default="")
 
     @pydantic.model_validator(mode="before")
     @classmethod
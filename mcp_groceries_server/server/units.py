@@ -0,0 +1,102 @@
+import collections
+import re
+import typing
+
+from mcp_groceries_server.server import catalog
+
+KILOGRAM = "kg"
+LITER = "l"
+UNIT = "unit"
+
+# normalized (see `catalog.normalize`) unit names to (canonical unit, factor)
+_UNITS: dict[str, tuple[str, float]] = {
+    **dict.fromkeys(["גרמ", "גר", "ג", "g", "gr", "gram", "grams"], (KILOGRAM, 0.001)),
+    **dict.fromkeys(["קג", "קילו", "קילוגרמ", "kg"], (KILOGRAM, 1.0)),
+    **dict.fromkeys(["מל", "ml"], (LITER, 0.001)),
+    **dict.fromkeys(["ליטר", "ליטרימ", "ל", "l", "liter", "litre"], (LITER, 1.0)),
+    **dict.fromkeys(["יח", "יחידות", "יחידה", "unit", "units", "pcs"], (UNIT, 1.0)),
+}
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_UNIT_NAMES = "|".join(sorted(map(re.escape, _UNITS), key=len, reverse=True))
+# "6 x 1 ליטר", "1.5 ליטר", "250 גרם"
+_QUANTITY = re.compile(
+    rf"(?:{_NUMBER}\s*[x×*]\s*)?{_NUMBER}\s*-?\s*({_UNIT_NAMES})(?![^\W\d_])"
+)
+
+
+def _to_float(value: typing.Any) -> typing.Optional[float]:
+    try:
+        return float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_quantity(text: typing.Any) -> typing.Optional[tuple[float, str]]:
+    """
+    Parse a package size ("500 גרם", "1.5 ל'", "6 x 1 ליטר") to (amount, canonical unit)
+    """
+    if text is None:
+        return None
+    match = _QUANTITY.search(catalog.normalize(str(text)))
+    if not match:
+        return None
+    count, amount, unit_name = match.groups()
+    unit, factor = _UNITS[unit_name]
+    quantity = float(amount.replace(",", ".")) * factor * (float(count.replace(",", ".")) if count else 1)
+    return (quantity, unit) if quantity > 0 else None
+
+
+def unit_price(
+    price: typing.Any,
+    *quantity_hints: typing.Any,
+    sold_by_weight: bool = False,
+) -> typing.Optional[tuple[float, str]]:
+    """
+    Price per kg / liter / unit, from the first quantity hint that parses (structured fields first, then the name)
+    """
+    price = _to_float(price)
+    if not price:
+        return None
+    if sold_by_weight:
+        # weighed products are priced per kg
+        return round(price, 2), KILOGRAM
+    for hint in quantity_hints:
+        if (quantity := parse_quantity(hint)) is not None:
+            amount, unit = quantity
+            return round(price / amount, 2), unit
+    return None
+
+
+def annotate(product: dict, *quantity_hints: typing.Any, sold_by_weight: bool = False) -> dict:
+    """
+    Add the canonical `unit_price` and `unit` fields to a transformed product
+    """
+    if (result := unit_price(product.get("price"), *quantity_hints, sold_by_weight=sold_by_weight)) is not None:
+        product["unit_price"], product["unit"] = result
+    return product
+
+
+def dominant_unit(products: typing.Iterable[dict]) -> typing.Optional[str]:
+    """
+    The most common unit of the products with a unit price
+    """
+    counts = collections.Counter(product.get("unit") for product in products if product.get("unit_price") is not None)
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def sort_by_unit_price(products: list[dict]) -> list[dict]:
+    """
+    The products priced in the dominant unit cheapest first, in the positions they had, so kg are not compared
+    with liters or units. The other products keep their (relevance) position
+    """
+    unit = dominant_unit(products)
+    positions = [
+        position
+        for position, product in enumerate(products)
+        if product.get("unit_price") is not None and product.get("unit") == unit
+    ]
+    cheapest_first = sorted((products[position] for position in positions), key=lambda product: product["unit_price"])
+    ordered = list(products)
+    for position, product in zip(positions, cheapest_first):
+        ordered[position] = product
+    return ordered
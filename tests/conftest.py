@@ -0,0 +1,47 @@
+import pytest
+
+from mcp_groceries_server.server.providers.interface import provider
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeProvider(provider.Provider):
+    """
+    A vendor answering every search with `products`, or with `products[item]` when a dict (other items fail).
+    Searched items are kept in `searched` and added items are recorded in the purchase history.
+    """
+
+    vendor = "fake"
+
+    def __init__(self, products: list[dict] | dict[str, list[dict]] = (), vendor: str = ""):
+        # skip the tools registration on the global server
+        if vendor:
+            self.vendor = vendor
+        self.products = products
+        self.searched = []
+
+    async def add_items_to_cart(self, items, response_format="full"):
+        self.record_purchases(items)
+        return {"content": []}
+
+    async def remove_items_from_cart(self, items, response_format="full"):
+        return {"content": []}
+
+    async def search_products(self, item: str) -> list[dict]:
+        self.searched.append(item)
+        if not isinstance(self.products, dict):
+            return list(self.products)
+        if item not in self.products:
+            raise RuntimeError("vendor error")
+        return self.products[item]
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from mcp_groceries_server.server.providers.shufersal._auth_state import AuthStateStore
+
+pytest.importorskip("cryptography")
+
+STATE = {"cookies": [{"name": "JSESSIONID", "value": "secret-session"}], "origins": []}
+
+
+def test_state_is_encrypted_at_rest(tmp_path):
+    store = AuthStateStore(str(tmp_path), secret="passphrase")
+    store.save("user@example.com", STATE)
+
+    [state_file] = os.listdir(tmp_path)
+    content = (tmp_path / state_file).read_bytes()
+    assert b"secret-session" not in content
+    assert b"user@example.com" not in state_file.encode()
+    assert store.load("user@example.com") == STATE
+
+
+def test_state_is_per_user(tmp_path):
+    store = AuthStateStore(str(tmp_path), secret="passphrase")
+    store.save("alice", STATE)
+
+    assert store.load("bob") is None
+
+
+def test_state_with_another_key_is_dropped(tmp_path):
+    AuthStateStore(str(tmp_path), secret="passphrase").save("alice", STATE)
+
+    store = AuthStateStore(str(tmp_path), secret="another passphrase")
+
+    assert store.load("alice") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_persistence_is_disabled_without_a_secret(tmp_path):
+    store = AuthStateStore(str(tmp_path), secret="")
+    store.save("alice", STATE)
+
+    assert not store.enabled
+    assert store.load("alice") is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,43 @@
+import httpx
+import pytest
+
+from benchmarks import runner, stub_servers
+
+
+def test_summarize_reports_nearest_rank_percentiles():
+    result = runner.summarize([i / 1000 for i in range(100, 0, -1)], errors=2, elapsed=2.0)
+
+    assert result["count"] == 100
+    assert result["errors"] == 2
+    assert (result["p50_ms"], result["p95_ms"], result["p99_ms"]) == (50, 95, 99)
+    assert result["throughput_rps"] == 50
+
+
+def test_compare_skips_scenarios_missing_from_the_baseline():
+    report = dict(scenarios=dict(search=dict(p50_ms=10, p95_ms=30), add=dict(skipped="")))
+    baseline = dict(scenarios=dict(search=dict(p50_ms=20, p95_ms=30)))
+
+    assert runner.compare(report, baseline) == ["search: p50_ms 20.0 -> 10.0 ms (-50.0%), p95_ms 30.0 -> 30.0 ms (+0.0%)"]
+
+
+def test_read_list(tmp_path):
+    shopping_list = tmp_path / "list.txt"
+    shopping_list.write_text(' "חלב",\n      "ביצים ",\n\n', encoding="utf-8")
+
+    assert runner.read_list(str(shopping_list)) == ["חלב", "ביצים"]
+
+
+@pytest.mark.asyncio
+async def test_rami_levy_stand_in_replays_the_catalog_and_keeps_the_cart():
+    app = stub_servers.rami_levy_app(stub_servers.Latency(0, 0), "account")
+    async with stub_servers.LocalServer(app) as local, httpx.AsyncClient(base_url=local.url) as client:
+        first = (await client.post("/api/catalog", json=dict(q="חלב"))).json()["data"]
+        again = (await client.post("/api/catalog", json=dict(q="חלב"))).json()["data"]
+        other = (await client.post("/api/catalog", json=dict(q="לחם"))).json()["data"]
+        await client.post("/api/v2/cart", json=dict(items={"1": "2"}))
+        cart = (await client.get("/api/v2/site/clubs/customer/account")).json()
+
+    assert [product["id"] for product in first] == [product["id"] for product in again]
+    assert not {product["id"] for product in first} & {product["id"] for product in other}
+    assert first[0]["name"].startswith("חלב ")
+    assert cart == {"cart": {"items": {"1": "2"}}}
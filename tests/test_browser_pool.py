@@ -0,0 +1,201 @@
+import asyncio
+
+import pytest
+
+from mcp_groceries_server.server.providers.shufersal._browser_pool import BrowserPool
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self, session):
+        self.session = session
+        self.pages = []
+        self.closed = False
+
+    async def new_page(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    async def close(self):
+        self.connected = False
+
+
+def make_pool(slow_sessions=(), **kwargs):
+    browsers = []
+
+    async def launch():
+        browsers.append(FakeBrowser())
+        return browsers[-1]
+
+    async def create_context(browser, session):
+        if session in slow_sessions:
+            await slow_sessions[session].wait()
+        context = FakeContext(session)
+        browser.contexts.append(context)
+        return context
+
+    async def prepare_page(page):
+        pass
+
+    return BrowserPool(launch, create_context, prepare_page, **kwargs), browsers
+
+
+@pytest.mark.asyncio
+async def test_sessions_get_their_own_context():
+    pool, browsers = make_pool()
+
+    async with pool.page("alice") as alice_page, pool.page("bob") as bob_page:
+        assert alice_page is not bob_page
+
+    assert [context.session for context in browsers[0].contexts] == ["alice", "bob"]
+    assert pool.occupancy() == dict(contexts=2, busy_pages=0, idle_pages=2)
+
+
+@pytest.mark.asyncio
+async def test_page_is_returned_and_reused():
+    pool, browsers = make_pool()
+
+    async with pool.page("alice") as first:
+        pass
+    async with pool.page("alice") as second:
+        assert second is first
+
+    assert len(browsers[0].contexts[0].pages) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_page_is_discarded():
+    pool, _ = make_pool()
+
+    with pytest.raises(RuntimeError):
+        async with pool.page("alice") as page:
+            raise RuntimeError("script failed")
+
+    assert page.closed
+    async with pool.page("alice") as new_page:
+        assert new_page is not page
+
+
+@pytest.mark.asyncio
+async def test_checkout_waits_when_max_pages_reached():
+    pool, _ = make_pool(max_pages=1)
+    first = await pool.checkout("alice")
+
+    waiter = asyncio.create_task(pool.checkout("alice"))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    await pool.checkin(first)
+    assert await asyncio.wait_for(waiter, 1) is first
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_idle_context_is_replaced_when_full(clock):
+    pool, browsers = make_pool(max_contexts=2, clock=clock)
+
+    for session in ["alice", "bob", "carol"]:
+        clock.now += 1
+        async with pool.page(session):
+            pass
+
+    alice_context, bob_context, _ = browsers[0].contexts
+    assert alice_context.closed
+    assert not bob_context.closed
+    assert pool.occupancy()["contexts"] == 2
+
+
+@pytest.mark.asyncio
+async def test_idle_contexts_are_evicted(clock):
+    pool, browsers = make_pool(idle_timeout=10, clock=clock)
+    async with pool.page("alice"):
+        pass
+
+    clock.now = 11
+    async with pool.page("bob"):
+        pass
+
+    assert browsers[0].contexts[0].closed
+    assert pool.occupancy()["contexts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_disconnected_browser_is_relaunched():
+    pool, browsers = make_pool()
+    async with pool.page("alice"):
+        pass
+
+    browsers[0].connected = False
+    async with pool.page("alice"):
+        pass
+
+    assert len(browsers) == 2
+
+
+@pytest.mark.asyncio
+async def test_a_slow_context_does_not_block_the_other_sessions():
+    alice_created = asyncio.Event()
+    pool, browsers = make_pool(slow_sessions={"alice": alice_created})
+
+    alice = asyncio.create_task(pool.checkout("alice"))
+    second_alice = asyncio.create_task(pool.checkout("alice"))
+    await asyncio.sleep(0.01)
+    async with asyncio.timeout(1):
+        async with pool.page("bob"):
+            pass
+    assert not alice.done()
+
+    alice_created.set()
+    first, second = await asyncio.wait_for(asyncio.gather(alice, second_alice), 1)
+
+    assert first is not second
+    assert [context.session for context in browsers[0].contexts] == ["bob", "alice"]
+
+
+@pytest.mark.asyncio
+async def test_idle_contexts_are_evicted_without_a_checkout(clock):
+    pool, browsers = make_pool(idle_timeout=10, clock=clock)
+    async with pool.page("alice"):
+        pass
+
+    clock.now = 11
+    await pool.evict_idle()
+
+    assert browsers[0].contexts[0].closed
+    assert pool.occupancy()["contexts"] == 0
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_an_idle_pool_frees_its_contexts_in_the_background():
+    pool, browsers = make_pool(idle_timeout=0.02)
+    async with pool.page("alice"):
+        pass
+
+    await asyncio.sleep(0.1)
+
+    assert browsers[0].contexts[0].closed
+    assert pool.occupancy()["contexts"] == 0
+    await pool.close()
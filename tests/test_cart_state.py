@@ -0,0 +1,191 @@
+import asyncio
+
+import pytest
+
+from mcp_groceries_server.server import cart_state
+
+
+def test_diff_computes_minimal_delta():
+    delta = cart_state.diff(
+        {"1": "1", "2": "2", "3": "1"},
+        {"1": "1.0", "2": "3", "4": "1", "5": "0"},
+    )
+
+    assert delta.added == {"4": "1"}
+    assert delta.changed == {"2": "3"}
+    assert delta.removed == ["3"]
+    assert not cart_state.diff({"1": "1"}, {"1": "1"})
+
+
+class FakeVendor:
+    def __init__(self, lines):
+        self.lines = dict(lines)
+        self.fetches = 0
+        self.writes = []
+
+    async def fetch(self):
+        self.fetches += 1
+        return cart_state.CartSnapshot(lines=dict(self.lines))
+
+    async def write(self, delta, items):
+        self.writes.append(delta)
+        self.lines = dict(items)
+        return None
+
+
+@pytest.mark.asyncio
+async def test_update_syncs_once_and_sends_only_the_delta():
+    vendor = FakeVendor({"1": "1", "2": "1"})
+    mirror = cart_state.CartMirror(vendor.fetch)
+
+    await mirror.update(lambda cart: {**cart, "3": "2"}, vendor.write)
+    cart = await mirror.update(lambda cart: {k: v for k, v in cart.items() if k != "1"}, vendor.write)
+
+    assert vendor.fetches == 1
+    assert [delta.upserts for delta in vendor.writes] == [{"3": "2"}, {}]
+    assert vendor.writes[1].removed == ["1"]
+    assert {item["id"]: item["quantity"] for item in cart} == {"2": "1", "3": "2"}
+
+
+@pytest.mark.asyncio
+async def test_noop_update_does_not_write():
+    vendor = FakeVendor({"1": "1"})
+    mirror = cart_state.CartMirror(vendor.fetch)
+
+    await mirror.update(lambda cart: {**cart, "1": "1"}, vendor.write)
+
+    assert vendor.writes == []
+
+
+@pytest.mark.asyncio
+async def test_failed_write_resyncs_from_vendor():
+    vendor = FakeVendor({"1": "1"})
+    mirror = cart_state.CartMirror(vendor.fetch)
+
+    async def failing_write(delta, items):
+        raise RuntimeError("write failed")
+
+    with pytest.raises(RuntimeError):
+        await mirror.update(lambda cart: {**cart, "2": "1"}, failing_write)
+    await mirror.update(lambda cart: {**cart, "3": "1"}, vendor.write)
+
+    assert vendor.fetches == 2
+
+
+@pytest.mark.asyncio
+async def test_vendor_reported_cart_is_adopted():
+    vendor = FakeVendor({"1": "1"})
+    mirror = cart_state.CartMirror(vendor.fetch)
+
+    async def write(delta, items):
+        # someone else added item 9 meanwhile
+        return cart_state.CartSnapshot(lines={**items, "9": "1"}, version="2")
+
+    cart = await mirror.update(lambda cart: {**cart, "2": "1"}, write)
+
+    assert {item["id"] for item in cart} == {"1", "2", "9"}
+    assert (await mirror.snapshot()).version == "2"
+
+
+class SlowVendor(FakeVendor):
+    async def write(self, delta, items):
+        await asyncio.sleep(0.01)
+        return await super().write(delta, items)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_are_merged_into_one_write():
+    vendor = SlowVendor({"1": "1"})
+    mirror = cart_state.CartMirror(vendor.fetch, coalesce_window=0.005)
+
+    carts = await asyncio.gather(
+        mirror.update(lambda cart: {**cart, "2": "1"}, vendor.write),
+        mirror.update(lambda cart: {**cart, "3": "2"}, vendor.write),
+        mirror.update(lambda cart: {k: v for k, v in cart.items() if k != "1"}, vendor.write),
+    )
+
+    assert len(vendor.writes) == 1
+    assert vendor.lines == {"2": "1", "3": "2"}
+    assert carts[0] == carts[1] == carts[2]
+
+
+@pytest.mark.asyncio
+async def test_updates_during_a_write_are_not_lost():
+    vendor = SlowVendor({})
+    mirror = cart_state.CartMirror(vendor.fetch, coalesce_window=0)
+
+    first = asyncio.create_task(mirror.update(lambda cart: {**cart, "1": "1"}, vendor.write))
+    await asyncio.sleep(0.002)
+    second = asyncio.create_task(mirror.update(lambda cart: {**cart, "2": "1"}, vendor.write))
+    third = asyncio.create_task(mirror.update(lambda cart: {**cart, "3": "1"}, vendor.write))
+    await asyncio.gather(first, second, third)
+
+    # the updates waiting for the first write share the second one
+    assert len(vendor.writes) == 2
+    assert vendor.lines == {"1": "1", "2": "1", "3": "1"}
+
+
+@pytest.mark.asyncio
+async def test_failed_merged_write_fails_every_update():
+    vendor = FakeVendor({})
+
+    async def write(delta, items):
+        raise RuntimeError("vendor error")
+
+    mirror = cart_state.CartMirror(vendor.fetch)
+    results = await asyncio.gather(
+        mirror.update(lambda cart: {**cart, "1": "1"}, write),
+        mirror.update(lambda cart: {**cart, "2": "1"}, write),
+        return_exceptions=True,
+    )
+
+    assert [str(result) for result in results] == ["vendor error", "vendor error"]
+    assert mirror.is_stale
+
+
+@pytest.mark.asyncio
+async def test_cancelled_update_is_not_applied():
+    vendor = SlowVendor({})
+    mirror = cart_state.CartMirror(vendor.fetch, coalesce_window=0)
+
+    first = asyncio.create_task(mirror.update(lambda cart: {**cart, "1": "1"}, vendor.write))
+    await asyncio.sleep(0.002)
+    cancelled = asyncio.create_task(mirror.update(lambda cart: {**cart, "2": "1"}, vendor.write))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await first
+    await mirror.update(lambda cart: {**cart, "3": "1"}, vendor.write)
+
+    assert vendor.lines == {"1": "1", "3": "1"}
+
+
+@pytest.mark.asyncio
+async def test_whole_cart_writes_resync_an_old_mirror_first(clock):
+    vendor = FakeVendor({"1": "1"})
+    mirror = cart_state.CartMirror(vendor.fetch, clock=clock, write_max_age=5)
+
+    await mirror.update(lambda cart: {**cart, "2": "1"}, vendor.write)
+    clock.now += 1
+    await mirror.update(lambda cart: {**cart, "3": "1"}, vendor.write)
+    assert vendor.fetches == 1
+
+    # a line added on the website meanwhile is kept
+    vendor.lines["9"] = "1"
+    clock.now += 10
+    cart = await mirror.update(lambda cart: {**cart, "4": "1"}, vendor.write)
+
+    assert vendor.fetches == 2
+    assert {item["id"] for item in cart} == {"1", "2", "3", "4", "9"}
+
+
+@pytest.mark.asyncio
+async def test_apply_reports_only_the_lines_that_changed():
+    vendor = FakeVendor({"1": "1", "2": "2"})
+    mirror = cart_state.CartMirror(vendor.fetch)
+
+    result = await mirror.apply(lambda cart: {**cart, "1": "1", "3": "1"}, vendor.write)
+    assert result.changed == [dict(id="3", quantity="1")]
+
+    result = await mirror.apply(lambda cart: {_id: q for _id, q in cart.items() if _id != "2"}, vendor.write)
+    assert result.changed == [dict(id="2", quantity="0")]
+    assert {item["id"] for item in result.cart} == {"1", "3"}
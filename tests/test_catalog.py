@@ -0,0 +1,102 @@
+import pytest
+
+from mcp_groceries_server.server import catalog
+
+PRODUCTS = [
+    dict(id=1, name="חָלָב תנובה 3%", branding_name="תנובה"),
+    dict(id=2, name="עגבניות שרי", second_level_category="ירקות"),
+    dict(id=3, name="קוטג' 5%", branding_name="תנובה"),
+    dict(id=4, name="לחם אחיד פרוס"),
+]
+
+
+def test_normalize_strips_niqqud_geresh_and_final_letters():
+    assert catalog.normalize("חָלָב") == "חלב"
+    assert catalog.normalize("קוטג׳") == catalog.normalize("קוטג'") == "קוטג"
+    assert catalog.normalize("לחם") == "לחמ"
+
+
+def test_search_matches_word_prefixes_and_hebrew_prefix_letters():
+    store = catalog.CatalogStore()
+    store.add_products(PRODUCTS)
+
+    assert [p["id"] for p in store.search("עגבני")] == [2]
+    assert [p["id"] for p in store.search("והעגבניות")] == [2]
+    assert [p["id"] for p in store.search("קוטג׳")] == [3]
+    assert [p["id"] for p in store.search("חלב")] == [1]
+    assert {p["id"] for p in store.search("תנובה")} == {1, 3}
+    assert store.search("תנובה לחם") == []
+
+
+def test_prefix_letters_are_stripped_only_for_whole_words():
+    store = catalog.CatalogStore()
+    store.add_products(
+        [
+            dict(id=1, name="בצל יבש"),
+            dict(id=2, name="צלופן לעטיפה"),
+            dict(id=3, name="צלי בקר"),
+            dict(id=4, name="צלעות עוף"),
+            dict(id=5, name="צלפים בחומץ"),
+            dict(id=6, name="צלחות חד פעמיות"),
+            dict(id=7, name="הדס מרכך כביסה"),
+            dict(id=8, name="וופל שוקולד"),
+            dict(id=9, name="ופל בטעם וניל"),
+        ]
+    )
+
+    assert [p["id"] for p in store.search("בצל")] == [1]
+    assert [p["id"] for p in store.search("והבצל")] == [1]
+    assert [p["id"] for p in store.search("הדס")] == [7]
+    assert [p["id"] for p in store.search("וופל")] == [8, 9]
+
+
+def test_whole_word_matches_rank_before_prefix_matches():
+    store = catalog.CatalogStore()
+    store.add_products([dict(id=1, name="חלבון מי גבינה"), dict(id=2, name="חלב 3% בקרטון גדול")])
+
+    assert [p["id"] for p in store.search("חלב")] == [2, 1]
+    assert [p["id"] for p in store.search("חלב", whole_words=True)] == [2]
+
+
+def test_products_are_reindexed_on_update():
+    store = catalog.CatalogStore()
+    store.add_products(PRODUCTS)
+    store.add_products([dict(id=4, name="לחם מלא")])
+
+    assert store.search("אחיד") == []
+    assert [p["name"] for p in store.search("לחם")] == ["לחם מלא"]
+
+
+def test_stale_products_are_not_returned(clock):
+    store = catalog.CatalogStore(clock)
+    store.add_products(PRODUCTS)
+
+    clock.now += 100
+    assert store.search("לחם", max_age=200)
+    assert store.search("לחם", max_age=50) == []
+
+
+def test_catalog_snapshot_is_persisted(tmp_path):
+    saved = catalog.Catalog(str(tmp_path))
+    saved.store("rami-levy", "331").add_products(PRODUCTS)
+    saved.save()
+
+    loaded = catalog.Catalog(str(tmp_path)).store("rami-levy", "331")
+
+    assert len(loaded) == len(PRODUCTS)
+    assert [p["id"] for p in loaded.search("שרי")] == [2]
+
+
+@pytest.mark.asyncio
+async def test_ingest_runs_the_vendor_search_over_seed_terms():
+    store = catalog.CatalogStore()
+    searched = []
+
+    async def search_products(term):
+        searched.append(term)
+        return [p for p in PRODUCTS if term in p["name"]]
+
+    count = await catalog.ingest(search_products, store, ['  "לחם ",', "עגבניות", ""])
+
+    assert searched == ["לחם", "עגבניות"]
+    assert count == 2
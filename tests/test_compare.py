@@ -0,0 +1,93 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from mcp_groceries_server.server import cache, catalog, mcp_server
+from mcp_groceries_server.server.providers import compare
+from mcp_groceries_server.server.providers.interface import provider
+
+from conftest import FakeProvider
+
+
+@pytest.fixture(autouse=True)
+def clear_search_cache(monkeypatch):
+    monkeypatch.setattr(catalog, "catalog", catalog.Catalog(""))
+    cache.search_cache.invalidate()
+    yield
+    cache.search_cache.invalidate()
+
+
+def test_cheapest_compares_offers_in_the_same_unit():
+    offers = [
+        dict(vendor="a", price=12, unit_price=12, unit="l"),
+        dict(vendor="b", price=5, unit_price=5, unit="unit"),
+        dict(vendor="c", price=9, unit_price=6, unit="l"),
+    ]
+
+    assert compare.cheapest(offers)["vendor"] == "c"
+
+
+def test_cheapest_falls_back_to_the_price():
+    assert compare.cheapest([dict(vendor="a", price="7.9"), dict(vendor="b", price=6)])["vendor"] == "b"
+    assert compare.cheapest([]) is None
+
+
+def test_best_offer_is_the_cheapest_result_matching_the_item():
+    products = [
+        dict(id="1", name="שוקולד חלב", price=4, unit_price=40, unit="kg"),
+        dict(id="2", name="חלב טרי 3%", price=7, unit_price=7, unit="l"),
+        dict(id="3", name="החלב של תנובה", price=6, unit_price=6, unit="l"),
+        dict(id="4", name="לחם", price=1, unit_price=1, unit="unit"),
+    ]
+
+    assert compare.best_offer("חלב טרי", products)["id"] == "2"
+    assert compare.best_offer("חלב", products[1:])["id"] == "3"
+    assert compare.best_offer("קוטג'", products) is None
+
+
+@pytest.mark.asyncio
+async def test_compare_prices_returns_the_offers_and_the_cheapest_per_item():
+    rami_levy = FakeProvider({"חלב": [dict(id="1", name="חלב 3%", price=7, unit_price=7, unit="l")]}, "rami-levy")
+    keshet = FakeProvider({"חלב": [dict(id="2", name="חלב 1%", price=6.5, unit_price=6.5, unit="l", discounts=None)]}, "keshet")
+
+    blocks = await compare.compare_prices([rami_levy, keshet], ["חלב", "לחם"])
+
+    assert blocks[0] == dict(
+        query="חלב",
+        cheapest=dict(vendor="keshet", id="2", name="חלב 1%", price=6.5, unit_price=6.5, unit="l", freshness=0),
+        offers=[
+            dict(vendor="rami-levy", id="1", name="חלב 3%", price=7, unit_price=7, unit="l", freshness=0),
+            dict(vendor="keshet", id="2", name="חלב 1%", price=6.5, unit_price=6.5, unit="l", freshness=0),
+        ],
+    )
+    assert blocks[1] == dict(
+        query="לחם",
+        cheapest=None,
+        offers=[dict(vendor="rami-levy", error="vendor error"), dict(vendor="keshet", error="vendor error")],
+    )
+
+
+def test_namespaced_provider_prefixes_its_tools(monkeypatch):
+    monkeypatch.setattr(mcp_server, "_shutdown_callbacks", [])
+    monkeypatch.setattr(mcp_server, "_background_callbacks", [])
+    monkeypatch.setattr(provider, "server", MagicMock())
+
+    class RamiLevy(FakeProvider):
+        vendor = "rami-levy"
+
+        def __init__(self):
+            provider.Provider.__init__(self, "rami_levy")
+
+    RamiLevy()
+
+    names = [call.kwargs["name"] for call in provider.server.add_tool.call_args_list]
+    assert names == [
+        "rami_levy_add_items_to_cart",
+        "rami_levy_remove_items_from_cart",
+        "rami_levy_search",
+        "rami_levy_search_many",
+        "rami_levy_semantic_search",
+        "rami_levy_suggest_substitutes",
+        "rami_levy_resolve_from_history",
+        "rami_levy_user_authorization",
+    ]
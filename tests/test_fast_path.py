@@ -0,0 +1,114 @@
+import json
+import types
+
+import pytest
+
+from mcp_groceries_server.agent import fast_path
+
+MILK = dict(id="1", name="חלב תנובה 3% 1 ליטר", price=6.9)
+GOAT_MILK = dict(id="2", name="חלב עיזים 1 ליטר", price=12.5)
+EGGS = dict(id="3", name="ביצים L 12 יח", price=13.9, selling_method="units")
+
+
+class FakeSession:
+    def __init__(self, results, add_error=False, cart=None):
+        self.results = results
+        self.add_error = add_error
+        # what add_items_to_cart reports, the requested lines by default
+        self.cart = cart
+        self.calls = []
+
+    async def call_tool(self, name, arguments):
+        self.calls.append((name, arguments))
+        if name == "search_many":
+            blocks = [dict(query=query, products=self.results.get(query, [])) for query in arguments["items"]]
+            return types.SimpleNamespace(isError=False, structuredContent={"content": [{"type": "text", "text": block} for block in blocks]})
+        cart = self.cart if self.cart is not None else [dict(id=line["id"], quantity=line["quantity"]) for line in arguments["items"]]
+        return types.SimpleNamespace(isError=self.add_error, structuredContent={"content": [{"type": "text", "text": json.dumps(cart)}]}, content=[])
+
+
+class FakeHistory:
+    def __init__(self, purchases):
+        self.purchases = purchases
+
+    async def last_purchases(self, items):
+        return {item: self.purchases[item] for item in items if item in self.purchases}
+
+
+def test_parse_item_reads_only_explicit_multipliers():
+    assert fast_path.parse_item("2 x חלב") == ("חלב", "2")
+    assert fast_path.parse_item("חלב ×3") == ("חלב", "3")
+    assert fast_path.parse_item("ביצים L 12") == ("ביצים L 12", None)
+    assert fast_path.parse_item("גבינה צהובה 28% ") == ("גבינה צהובה 28%", None)
+
+
+def test_split_items_handles_lines_commas_and_quotes():
+    assert fast_path.split_items(' "soy sauce",\n "בצל",\n\n') == ["soy sauce", "בצל"]
+
+
+def test_match_needs_a_single_candidate():
+    assert fast_path.match("ביצים", [MILK, EGGS]) == EGGS
+    assert fast_path.match("חלב", [MILK, GOAT_MILK]) is None
+    assert fast_path.match("קוטג'", [MILK, GOAT_MILK]) is None
+
+
+@pytest.mark.asyncio
+async def test_resolve_adds_unambiguous_items_in_one_call_and_leaves_the_rest():
+    session = FakeSession({"חלב": [MILK, GOAT_MILK], "ביצים": [MILK, EGGS], "קוטג'": []})
+
+    result = await fast_path.resolve(session, ["חלב", "2 x ביצים", "קוטג'"])
+
+    assert [(r.item, r.product["id"], r.quantity, r.reason) for r in result.resolved] == [("2 x ביצים", "3", "2", "match")]
+    assert result.leftovers == ["חלב", "קוטג'"]
+    assert [name for name, _ in session.calls] == ["search_many", "add_items_to_cart"]
+    assert session.calls[1][1]["items"] == [dict(id="3", quantity="2", selling_method="units", term="ביצים")]
+
+
+@pytest.mark.asyncio
+async def test_history_items_are_not_searched():
+    session = FakeSession({"חלב": [MILK, GOAT_MILK], "ביצים": [EGGS]})
+    history = FakeHistory({"חלב": dict(product=GOAT_MILK, quantity="2")})
+
+    result = await fast_path.resolve(session, ["חלב", "ביצים"], history=history)
+
+    assert [(r.product["id"], r.quantity, r.reason) for r in result.resolved] == [("2", "2", "history"), ("3", "1", "match")]
+    assert session.calls[0] == ("search_many", {"items": ["ביצים"], "response_format": "full"})
+
+
+@pytest.mark.asyncio
+async def test_history_only_does_not_search():
+    session = FakeSession({"ביצים": [EGGS]})
+
+    result = await fast_path.resolve(session, ["3 x חלב", "ביצים"], history=FakeHistory({"חלב": dict(product=MILK, quantity="1")}), history_only=True)
+
+    assert [(r.product["id"], r.quantity) for r in result.resolved] == [("1", "3")]
+    assert result.leftovers == ["ביצים"]
+    assert [name for name, _ in session.calls] == ["add_items_to_cart"]
+
+
+@pytest.mark.asyncio
+async def test_failed_cart_update_leaves_everything_to_the_agent():
+    session = FakeSession({"ביצים": [EGGS]}, add_error=True)
+
+    result = await fast_path.resolve(session, ["ביצים"])
+
+    assert result.resolved == []
+    assert result.leftovers == ["ביצים"]
+
+
+@pytest.mark.asyncio
+async def test_items_the_cart_update_did_not_add_are_left_to_the_agent():
+    session = FakeSession({"ביצים": [EGGS], "חלב": [MILK]}, cart=["1 of 1 added", "1 of 3 failed to add"])
+
+    result = await fast_path.resolve(session, ["ביצים", "חלב"])
+
+    assert [r.item for r in result.resolved] == ["חלב"]
+    assert result.leftovers == ["ביצים"]
+    assert session.calls[1][1]["response_format"] == "full"
+
+    session = FakeSession({"ביצים": [EGGS], "חלב": [MILK]}, cart=[dict(id="1", quantity="1"), dict(id="9", quantity="2")])
+
+    result = await fast_path.resolve(session, ["ביצים", "חלב"])
+
+    assert [r.item for r in result.resolved] == ["חלב"]
+    assert result.leftovers == ["ביצים"]
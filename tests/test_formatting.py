@@ -0,0 +1,55 @@
+from mcp_groceries_server.server import formatting
+
+PRODUCTS = [
+    dict(id="1", name="חלב 3%", price=6.9, unit_price=6.9, unit="l", branding_name="תנובה", second_level_category="חלב", quantity_evaluation="1 ליטר"),
+    dict(id="2", name="חלב 1%", price=7.2, unit_price=7.2, unit="l", branding_name="תנובה", second_level_category="חלב", discounts=[]),
+    dict(id="3", name="משקה שקדים", price=12.9, branding_name="אלפרו", second_level_category="חלב"),
+]
+
+
+def test_full_returns_the_products_as_is():
+    assert formatting.format_products(PRODUCTS, "full") is PRODUCTS
+
+
+def test_compact_drops_empty_columns_and_deduplicates_brand_and_category():
+    result = formatting.format_products(PRODUCTS, "compact")
+
+    assert result["columns"] == ["id", "n", "p", "up", "u", "b", "c"]
+    assert result["rows"] == [
+        ["1", "חלב 3%", 6.9, 6.9, "l", 0, 0],
+        ["2", "חלב 1%", 7.2, 7.2, "l", 0, 0],
+        ["3", "משקה שקדים", 12.9, None, None, 1, 0],
+    ]
+    assert result["lookups"] == {"b": ["תנובה", "אלפרו"], "c": ["חלב"]}
+
+
+def test_tsv_starts_with_the_lookups():
+    lines = formatting.format_products(PRODUCTS, "tsv").split("\n")
+
+    assert lines[:3] == ["#b\tתנובה\tאלפרו", "#c\tחלב", "id\tn\tp\tup\tu\tb\tc"]
+    assert lines[-1] == "3\tמשקה שקדים\t12.9\t\t\t1\t0"
+
+
+def test_compact_without_products():
+    assert formatting.format_products([], "compact") == dict(columns=[], rows=[])
+
+
+def test_cart_summary_returns_the_size_and_the_changed_lines():
+    cart = [dict(id="1", quantity=2), dict(id="2", quantity=1), dict(id="3", quantity=4)]
+    changed = [dict(id="2", quantity="1")]
+
+    assert formatting.format_cart(cart, changed, "summary") == dict(lines=3, changed=[dict(id="2", quantity="1")])
+    assert formatting.format_cart(cart, changed, "full") is cart
+
+
+def test_cart_summary_keeps_per_item_outcomes():
+    outcomes = ["2 of 123 added"]
+
+    assert formatting.format_cart(outcomes, [], "summary") is outcomes
+
+
+def test_describe_products_follows_the_format():
+    assert "`lookups`" in formatting.describe_products("compact")
+    assert "tab separated" in formatting.describe_products("tsv")
+    assert "`unit_price`" in formatting.describe_products("full")
+    assert "`up`" not in formatting.describe_products("full")
@@ -0,0 +1,91 @@
+import pytest
+
+from mcp_groceries_server.server import cache, history, types
+from mcp_groceries_server.server.providers.shufersal import _service as shufersal_service
+from mcp_groceries_server.server.providers.shufersal.tools import ShufersalProvider
+
+from conftest import FakeProvider
+
+
+MILK = dict(id="1", name="חלב תנובה 3%", price=6.9, unit_price=6.9, unit="l")
+
+
+def test_record_and_lookup_by_normalized_term(tmp_path):
+    store = history.PurchaseHistory(str(tmp_path / "history.sqlite"))
+    recorded = store.record(
+        "rami-levy",
+        [types.CartItemSchema(id=1, quantity=2, term="  חלב "), types.CartItemSchema(id=2, quantity=1)],
+        {"1": MILK},
+    )
+    store.close()
+
+    purchases = history.PurchaseHistory(str(tmp_path / "history.sqlite")).lookup("rami-levy", ["חלב", "ביצים"])
+
+    assert recorded == 1
+    assert list(purchases) == ["חלב"]
+    assert purchases["חלב"].product() == dict(id="1", name="חלב תנובה 3%", price=6.9, unit_price=6.9, unit="l", selling_method="")
+    assert purchases["חלב"].quantity == "2"
+    assert history.PurchaseHistory(str(tmp_path / "history.sqlite")).lookup("keshet", ["חלב"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_resolve_from_history_refreshes_stale_purchases_in_bulk(monkeypatch, clock):
+    monkeypatch.setattr(history, "history", history.PurchaseHistory(clock=clock))
+    provider = FakeProvider([MILK], "test-history")
+    await provider.search("חלב", response_format="full")
+    await provider.add_items_to_cart(
+        [types.CartItemSchema(id="1", quantity="1", term="חלב"), types.CartItemSchema(id="9", quantity="1", term="לחם")]
+    )
+
+    fresh = await provider.resolve_from_history(["חלב", "קוטג'"])
+    assert [block["text"].get("available", block["text"].get("error")) for block in fresh["content"]] == [True, "not in history"]
+    assert provider.searched == ["חלב"]
+
+    # the catalog hasn't seen the milk lately and its price went up
+    clock.now += history.HISTORY_MAX_AGE + 1
+    provider.catalog_store().seen_at["1"] = 0
+    provider.products = [dict(MILK, price=7.5, unit_price=7.5)]
+    blocks = [block["text"] for block in (await provider.resolve_from_history(["חלב", "לחם"]))["content"]]
+
+    assert blocks[0]["product"]["price"] == 7.5 and blocks[0]["available"]
+    # no name known for the bread (not in the catalog when bought), so it stays stale
+    assert blocks[1]["available"] is False
+    assert provider.searched == ["חלב", "חלב תנובה 3%"]
+
+
+@pytest.mark.asyncio
+async def test_only_an_explicit_miss_marks_a_purchase_unavailable(monkeypatch, clock):
+    monkeypatch.setattr(history, "history", history.PurchaseHistory(clock=clock))
+    provider = FakeProvider([MILK], "test-history-miss")
+    await provider.search("חלב", response_format="full")
+    await provider.add_items_to_cart([types.CartItemSchema(id="1", quantity="1", term="חלב")])
+    provider.catalog_store().seen_at["1"] = 0
+
+    # a broad name returns other products first, the milk keeps its last price and availability
+    clock.now += history.HISTORY_MAX_AGE + 1
+    provider.products = [dict(id="2", name="חלב תנובה 3% בקבוק", price=7.2)]
+    pushed_out = (await provider.resolve_from_history(["חלב"]))["content"][0]["text"]
+    assert pushed_out["available"] and pushed_out["product"]["price"] == 6.9
+
+    clock.now += history.HISTORY_MAX_AGE + 1
+    cache.search_cache.invalidate()
+    provider.products = []
+    assert (await provider.resolve_from_history(["חלב"]))["content"][0]["text"]["available"] is False
+
+
+@pytest.mark.asyncio
+async def test_shufersal_records_only_the_added_items(monkeypatch):
+    monkeypatch.setattr(history, "history", history.PurchaseHistory())
+
+    async def update_cart(items):
+        return [f"{items[0].quantity} of {items[0].id} added", f"{items[1].quantity} of {items[1].id} failed to add"]
+
+    monkeypatch.setattr(shufersal_service, "update_cart", update_cart)
+    # skip the tools registration on the global server
+    shufersal = ShufersalProvider.__new__(ShufersalProvider)
+
+    await shufersal.add_items_to_cart(
+        [types.CartItemSchema(id="P_1", quantity="1", term="חלב"), types.CartItemSchema(id="P_2", quantity="1", term="לחם")]
+    )
+
+    assert list(history.history.lookup(shufersal.vendor, ["חלב", "לחם"])) == ["חלב"]
@@ -0,0 +1,56 @@
+import httpx
+import pytest
+
+from mcp_groceries_server.server import http_client, mcp_server
+
+
+@pytest.mark.asyncio
+async def test_get_client_is_reused_per_vendor():
+    client = http_client.get_client("test-vendor")
+    try:
+        assert http_client.get_client("test-vendor") is client
+        assert http_client.get_client("other-vendor") is not client
+    finally:
+        await http_client.aclose()
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_closed_client_is_recreated():
+    client = http_client.get_client("test-vendor")
+    await http_client.aclose("test-vendor")
+    new_client = http_client.get_client("test-vendor")
+    try:
+        assert new_client is not client
+        assert not new_client.is_closed
+    finally:
+        await http_client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_shutdown_runs_registered_callbacks_in_reverse_order():
+    calls = []
+
+    async def first():
+        calls.append("first")
+
+    async def second():
+        calls.append("second")
+
+    mcp_server.on_shutdown(first)
+    mcp_server.on_shutdown(second)
+    await mcp_server.shutdown()
+
+    assert calls == ["second", "first"]
+
+
+@pytest.mark.asyncio
+async def test_connect_sends_a_head_request(monkeypatch):
+    requests = []
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: requests.append(request) or httpx.Response(200)))
+    monkeypatch.setitem(http_client._clients, "test-vendor", client)
+
+    await http_client.connect("test-vendor", "https://vendor.example")
+
+    assert [(request.method, str(request.url)) for request in requests] == [("HEAD", "https://vendor.example")]
+    await http_client.aclose("test-vendor")
@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from mcp_groceries_server.agent import api, jobs
+
+
+class Runs:
+    def __init__(self, duration=0.02):
+        self.duration = duration
+        self.active = []
+        self.max_active = 0
+        self.overlapping_users = False
+
+    async def __call__(self, payload):
+        if payload["user"] in self.active:
+            self.overlapping_users = True
+        self.active.append(payload["user"])
+        self.max_active = max(self.max_active, len(self.active))
+        await asyncio.sleep(self.duration)
+        self.active.remove(payload["user"])
+        if payload.get("fail"):
+            raise RuntimeError("vendor is down")
+        return {"result": payload["user"]}
+
+
+@pytest.mark.asyncio
+async def test_runs_share_the_single_vendor_cart_by_default():
+    runs = Runs()
+    queue = jobs.JobQueue(runs, workers=2, max_queued=10)
+
+    submitted = [queue.submit(user, {"user": user})[0] for user in ["a", "b", "default"]]
+    await asyncio.gather(*[queue.wait(job) for job in submitted])
+
+    assert {job.cart for job in submitted} == {jobs.SHARED_CART}
+    assert runs.max_active == 1
+
+
+@pytest.mark.asyncio
+async def test_runs_are_bounded_and_serialized_per_user(monkeypatch):
+    monkeypatch.setattr(jobs, "AGENT_CART_PER_USER", True)
+    runs = Runs()
+    queue = jobs.JobQueue(runs, workers=2, max_queued=10)
+
+    submitted = [queue.submit(user, {"user": user, "n": n})[0] for n, user in enumerate(["a", "a", "a", "b", "c"])]
+    await asyncio.gather(*[queue.wait(job) for job in submitted])
+
+    assert [job.status for job in submitted] == ["succeeded"] * 5
+    assert runs.max_active == 2
+    assert not runs.overlapping_users
+    assert queue.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_reservations_count_from_the_admission():
+    queue = jobs.JobQueue(Runs(), workers=1, max_queued=1)
+    first, second = queue.try_reserve(), queue.try_reserve()
+
+    with pytest.raises(jobs.QueueFull):
+        queue.try_reserve()
+    with pytest.raises(jobs.QueueFull):
+        queue.submit("a", {"user": "a"})
+
+    async with queue.running(jobs.SHARED_CART, first):
+        pass
+    second.release()
+    second.release()
+    assert queue.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_returns_the_first_job():
+    queue = jobs.JobQueue(Runs(), workers=1)
+
+    job, created = queue.submit("a", {"user": "a"}, idempotency_key="k")
+    again, created_again = queue.submit("a", {"user": "a"}, idempotency_key="k")
+
+    assert created and not created_again
+    assert again is job
+    with pytest.raises(jobs.IdempotencyConflict):
+        queue.submit("a", {"user": "a", "other": True}, idempotency_key="k")
+    # keys are per user
+    assert queue.submit("b", {"user": "b"}, idempotency_key="k")[1]
+    await queue.wait(job)
+
+
+@pytest.mark.asyncio
+async def test_saturated_queue_refuses_with_retry_after():
+    queue = jobs.JobQueue(Runs(duration=0.05), workers=1, max_queued=1)
+    queue.submit("a", {"user": "a"})
+    queue.submit("b", {"user": "b"})
+
+    with pytest.raises(jobs.QueueFull) as raised:
+        queue.submit("c", {"user": "c"})
+    assert raised.value.retry_after >= 1
+    await queue.aclose()
+
+
+@pytest.mark.asyncio
+async def test_failed_job_keeps_its_error():
+    queue = jobs.JobQueue(Runs(), workers=1)
+
+    job = await queue.wait(queue.submit("a", {"user": "a", "fail": True})[0])
+
+    assert job.status == "failed"
+    assert job.error == "vendor is down"
+
+
+def test_job_endpoints(monkeypatch):
+    async def shop(payload):
+        await asyncio.sleep(0.05)
+        return {"result": ", ".join(payload["groceries_list"]), "resolved": []}
+
+    monkeypatch.setattr(api, "job_queue", jobs.JobQueue(shop, workers=1, max_queued=0))
+    with TestClient(api.app) as client:
+        submitted = client.post("/jobs", json={"groceries_list": ["חלב"]}, headers={"Idempotency-Key": "k"})
+        assert submitted.status_code == 202
+        job_id = submitted.json()["id"]
+        assert submitted.headers["location"] == f"/jobs/{job_id}"
+
+        assert client.post("/jobs", json={"groceries_list": ["חלב"]}, headers={"Idempotency-Key": "k"}).json()["id"] == job_id
+        saturated = client.post("/jobs", json={"groceries_list": ["לחם"]})
+        assert saturated.status_code == 429
+        assert int(saturated.headers["retry-after"]) >= 1
+
+        pending = client.get(f"/jobs/{job_id}/result")
+        assert pending.status_code == 202 and "retry-after" in pending.headers
+        deadline = time.monotonic() + 5
+        while (result := client.get(f"/jobs/{job_id}/result")).status_code == 202 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert result.json()["status"] == "succeeded"
+        assert result.json()["result"] == {"result": "חלב", "resolved": []}
+        assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_user_header_is_required_with_a_cart_per_user(monkeypatch):
+    async def shop(payload):
+        return {"result": "", "resolved": []}
+
+    monkeypatch.setattr(jobs, "AGENT_CART_PER_USER", True)
+    monkeypatch.setattr(api, "job_queue", jobs.JobQueue(shop, workers=1))
+    with TestClient(api.app) as client:
+        assert client.post("/jobs", json={"groceries_list": ["חלב"]}).status_code == 400
+        assert client.post("/execute/stream", json={"groceries_list": ["חלב"]}).status_code == 400
+        assert client.post("/jobs", json={"groceries_list": ["חלב"]}, headers={"X-User-Id": "a"}).json()["user"] == "a"
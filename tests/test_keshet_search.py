@@ -0,0 +1,82 @@
+import asyncio
+import json
+import urllib.parse
+
+import pytest
+
+from mcp_groceries_server.server.providers.keshet import _service as service
+
+
+def params(url):
+    return dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+
+
+def test_query_is_encoded_with_the_page():
+    url = service.CatalogQuery("שמן זית & מלח", page=2, size=20).url()
+
+    assert url.startswith(f"{service.CATALOG_ENDPOINT}?")
+    query = params(url)
+    assert (query["query"], query["from"], query["size"]) == ("שמן זית & מלח", "40", "20")
+    assert json.loads(query["filters"]) == service.catalog_filters()
+
+
+def test_in_stock_only_filter():
+    should = service.catalog_filters(in_stock_only=True)["bool"]["should"]
+
+    assert should == [{"bool": {"must": [{"term": {"branch.isOutOfStock": False}}]}}]
+    assert len(service.catalog_filters()["bool"]["should"]) == 3
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    requests = []
+
+    async def request(url, method, step):
+        requests.append((params(url)["from"], step))
+        await asyncio.sleep(0)
+        size = int(params(url)["size"])
+        # three full pages then a partial one
+        count = size if int(params(url)["from"]) < 3 * size else 1
+        return {"suggestions": {"suggestProducts": {"products": [dict(id=n) for n in range(count)]}}}
+
+    monkeypatch.setattr(service, "_request", request)
+    monkeypatch.setattr(service, "KESHET_PREFETCH", True)
+    yield requests
+    service.clear_prefetched()
+
+
+@pytest.mark.asyncio
+async def test_first_pages_are_not_prefetched(requests, monkeypatch):
+    await service.search(service.CatalogQuery("חלב", size=5))
+    monkeypatch.setattr(service, "KESHET_PREFETCH", False)
+    await service.search(service.CatalogQuery("חלב", page=1, size=5))
+    await asyncio.sleep(0.01)
+
+    assert requests == [("0", "search"), ("5", "search")]
+    assert not service._prefetched
+
+
+@pytest.mark.asyncio
+async def test_full_more_pages_prefetch_the_next_one(requests):
+    first = await service.search(service.CatalogQuery("חלב", page=1, size=5))
+    await asyncio.sleep(0.01)
+    assert requests == [("5", "search"), ("10", "search_prefetch")]
+
+    second = await service.search(service.CatalogQuery("חלב", page=2, size=5))
+    await asyncio.sleep(0.01)
+    third = await service.search(service.CatalogQuery("חלב", page=3, size=5))
+
+    assert [len(service.products_of(page)) for page in (first, second, third)] == [5, 5, 1]
+    # each page reached the vendor once and nothing follows the partial page
+    assert requests == [("5", "search"), ("10", "search_prefetch"), ("15", "search_prefetch")]
+    assert not service._prefetched
+
+
+@pytest.mark.asyncio
+async def test_prefetched_pages_are_bounded(requests, monkeypatch):
+    monkeypatch.setattr(service, "KESHET_PREFETCH_PAGES", 2)
+
+    for item in ["חלב", "לחם", "ביצים"]:
+        await service.search(service.CatalogQuery(item, page=1))
+
+    assert [query.query for query in service._prefetched] == ["לחם", "ביצים"]
@@ -0,0 +1,80 @@
+import inspect
+
+import pytest
+
+from mcp_groceries_server.server import mcp_server, metrics
+
+
+def test_histogram_exposes_cumulative_buckets():
+    histogram = metrics.Histogram("test_seconds", "Test latency", ("step",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, step="search")
+    histogram.observe(0.5, step="search")
+    histogram.observe(5, step="search")
+
+    assert histogram.expose() == [
+        "# HELP test_seconds Test latency",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{step="search",le="0.1"} 1',
+        'test_seconds_bucket{step="search",le="1"} 2',
+        'test_seconds_bucket{step="search",le="+Inf"} 3',
+        'test_seconds_sum{step="search"} 5.55',
+        'test_seconds_count{step="search"} 3',
+    ]
+
+
+def test_counter_escapes_label_values_and_checks_label_names():
+    counter = metrics.Counter("test_total", "Test counter", ("query",))
+    counter.inc(query='חלב "3%"')
+
+    assert counter.expose()[-1] == 'test_total{query="חלב \\"3%\\""} 1'
+    with pytest.raises(ValueError):
+        counter.inc(vendor="keshet")
+
+
+def test_callback_is_read_at_scrape_time():
+    occupancy = dict(contexts=1)
+    gauge = metrics.Callback("test_pool", "Test pool", ("state",), lambda: [((state,), count) for state, count in occupancy.items()])
+    occupancy["contexts"] = 2
+
+    assert gauge.expose()[-1] == 'test_pool{state="contexts"} 2'
+
+
+@pytest.mark.asyncio
+async def test_instrumented_tool_keeps_the_signature_and_records_the_outcome():
+    async def search(item: str, limit: int = 10) -> list[str]:
+        if item == "broken":
+            raise RuntimeError("vendor error")
+        return [item] * limit
+
+    instrumented = metrics.instrument_tool("test-vendor", "search", search)
+
+    assert inspect.signature(instrumented) == inspect.signature(search)
+    assert await instrumented("חלב", limit=1) == ["חלב"]
+    with pytest.raises(RuntimeError):
+        await instrumented("broken")
+    assert metrics.TOOL_SECONDS.count(vendor="test-vendor", tool="search", outcome="ok") == 1
+    assert metrics.TOOL_SECONDS.count(vendor="test-vendor", tool="search", outcome="error") == 1
+
+
+def test_vendor_request_records_the_status_and_failures():
+    class Response:
+        status_code = 404
+        content = b"{}"
+
+    with metrics.vendor_request("test-vendor", "search") as record:
+        record(Response())
+    with pytest.raises(TimeoutError):
+        with metrics.vendor_request("test-vendor", "search"):
+            raise TimeoutError()
+
+    assert metrics.VENDOR_RESPONSES.value(vendor="test-vendor", step="search", status="404") == 1
+    assert metrics.VENDOR_RESPONSES.value(vendor="test-vendor", step="search", status="error") == 1
+    assert metrics.VENDOR_REQUEST_SECONDS.count(vendor="test-vendor", step="search") == 2
+
+
+@pytest.mark.asyncio
+async def test_metrics_route():
+    response = await mcp_server._metrics(None)
+
+    assert response.media_type == metrics.CONTENT_TYPE
+    assert b"# TYPE groceries_tool_duration_seconds histogram" in response.body
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from mcp_groceries_server.server import cache, catalog
+from mcp_groceries_server.server.providers.interface import provider
+
+from conftest import FakeProvider
+
+
+class EchoProvider(FakeProvider):
+    async def search_products(self, item: str) -> list[dict]:
+        self.searched.append(item)
+        if item == "broken":
+            raise RuntimeError("vendor error")
+        if item == "slow":
+            await asyncio.sleep(1)
+        return [dict(id=item, name=item)]
+
+
+@pytest.fixture(autouse=True)
+def clear_search_cache(monkeypatch):
+    monkeypatch.setattr(catalog, "catalog", catalog.Catalog(""))
+    cache.search_cache.invalidate()
+    yield
+    cache.search_cache.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_search_is_served_from_cache():
+    fake = EchoProvider()
+
+    first = await fake.search("לחם", response_format="full")
+    second = await fake.search(" לחם ", response_format="full")
+
+    assert first == second == {"content": [{"type": "text", "text": [dict(id="לחם", name="לחם", freshness=0)]}]}
+    assert fake.searched == ["לחם"]
+
+
+@pytest.mark.asyncio
+async def test_search_many_returns_a_block_per_term_and_isolates_failures(monkeypatch):
+    monkeypatch.setattr(provider, "SEARCH_MANY_TIMEOUT", 0.05)
+    fake = EchoProvider()
+
+    result = await fake.search_many(["חלב", "broken", "slow"], response_format="full")
+
+    blocks = [content["text"] for content in result["content"]]
+    assert blocks[0] == dict(query="חלב", products=[dict(id="חלב", name="חלב", freshness=0)])
+    assert blocks[1] == dict(query="broken", error="vendor error")
+    assert blocks[2] == dict(query="slow", error="TimeoutError")
+
+
+@pytest.mark.asyncio
+async def test_search_many_bounds_concurrency(monkeypatch):
+    monkeypatch.setattr(provider, "SEARCH_MANY_CONCURRENCY", 2)
+    running = 0
+    max_running = 0
+
+    class CountingProvider(FakeProvider):
+        async def search_products(self, item: str) -> list[dict]:
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return []
+
+    await CountingProvider().search_many([str(i) for i in range(6)])
+
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_search_is_answered_from_the_local_catalog(monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_MIN_RESULTS", 1)
+    fake = EchoProvider()
+    fake.catalog_store().add_products([dict(id="1", name="ביצים L")])
+
+    result = await fake.search("ביצים", response_format="full")
+
+    assert result["content"][0]["text"] == [dict(id="1", name="ביצים L", freshness=0)]
+    assert fake.searched == []
+
+
+@pytest.mark.asyncio
+async def test_prefix_matches_do_not_answer_from_the_local_catalog(monkeypatch):
+    monkeypatch.setattr(catalog, "CATALOG_MIN_RESULTS", 2)
+    fake = EchoProvider()
+    fake.catalog_store().add_products([dict(id="1", name="בצל יבש"), dict(id="2", name="צלי בקר"), dict(id="3", name="צלחות")])
+
+    await fake.search("בצל")
+
+    assert fake.searched == ["בצל"]
+
+
+@pytest.mark.asyncio
+async def test_vendor_results_are_added_to_the_local_catalog():
+    fake = EchoProvider()
+
+    await fake.search("חלב")
+
+    assert fake.catalog_store().search("חלב") == [dict(id="חלב", name="חלב")]
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from mcp_groceries_server.server import catalog, refresh
+
+
+class VendorSearch:
+    def __init__(self, prices):
+        self.prices = prices
+        self.searched = []
+
+    async def __call__(self, name):
+        self.searched.append(name)
+        return [dict(id=_id, name=name, price=price) for _id, (product_name, price) in self.prices.items() if product_name == name]
+
+
+def stocked_store(clock):
+    store = catalog.CatalogStore(clock)
+    store.add_products([dict(id="1", name="חלב", price=6), dict(id="2", name="לחם", price=8), dict(id="3", name="ביצים", price=12)])
+    return store
+
+
+@pytest.mark.asyncio
+async def test_hot_stale_products_are_refreshed_first(clock):
+    store = stocked_store(clock)
+    search = VendorSearch({"1": ("חלב", 5.5), "2": ("לחם", 9)})
+    scheduler = refresh.RefreshScheduler("test", store, search, batch_size=1, rate=0, refresh_after=60)
+    scheduler.touch([store.products["2"], store.products["1"]])
+    scheduler.touch([store.products["1"]])
+
+    assert await scheduler.refresh_once() == 0
+    clock.now += 120
+    assert scheduler.due() == ["1"]
+    assert await scheduler.refresh_once() == 1
+
+    assert search.searched == ["חלב"]
+    assert store.products["1"]["price"] == 5.5
+    assert store.age("1") == 0 and store.age("2") == 120
+
+
+@pytest.mark.asyncio
+async def test_refreshes_are_rate_limited(clock):
+    store = stocked_store(clock)
+    scheduler = refresh.RefreshScheduler("test", store, VendorSearch({}), rate=50, refresh_after=0)
+    scheduler.touch(store.products.values())
+
+    started = time.monotonic()
+    assert await scheduler.refresh_once() == 0
+
+    # 3 searches at 50 per second
+    assert time.monotonic() - started >= 0.035
+
+
+def test_products_are_returned_as_last_refreshed_with_their_freshness(clock):
+    store = stocked_store(clock)
+    cached = dict(store.products["1"])
+    clock.now += 30
+    store.add_products([dict(id="1", name="חלב", price=5.5)])
+    clock.now += 10
+
+    assert refresh.with_freshness(store, [cached, dict(id="9", name="unknown")]) == [
+        dict(id="1", name="חלב", price=5.5, freshness=10),
+        dict(id="9", name="unknown"),
+    ]
@@ -0,0 +1,97 @@
+import httpx
+import pytest
+
+from mcp_groceries_server.server import http_client, metrics, resilience
+from mcp_groceries_server.server.providers.rami_levy import _service as rami_levy
+
+
+def responses(*outcomes):
+    calls = []
+
+    async def send():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome)
+
+    return send, calls
+
+
+def policy(**kwargs):
+    return resilience.VendorPolicy("test-vendor", base_delay=0, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_idempotent_requests_are_retried_on_server_errors_and_timeouts():
+    send, calls = responses(503, httpx.ReadTimeout("slow"), 200)
+    retries = metrics.VENDOR_RETRIES.value(vendor="test-vendor", step="search")
+
+    response = await policy().call(send, "search", idempotent=True)
+
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert metrics.VENDOR_RETRIES.value(vendor="test-vendor", step="search") == retries + 2
+
+
+@pytest.mark.asyncio
+async def test_writes_are_only_retried_when_the_vendor_did_not_process_them():
+    send, calls = responses(503)
+    assert (await policy().call(send, "update_cart", idempotent=False)).status_code == 503
+    assert len(calls) == 1
+
+    send, calls = responses(httpx.ReadTimeout("slow"))
+    with pytest.raises(httpx.ReadTimeout):
+        await policy().call(send, "update_cart", idempotent=False)
+    assert len(calls) == 1
+
+    send, calls = responses(httpx.ConnectError("refused"), 429, 200)
+    assert (await policy().call(send, "update_cart", idempotent=False)).status_code == 200
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_attempts_are_bounded_and_client_errors_are_not_retried():
+    send, calls = responses(500, 500, 500)
+    assert (await policy(attempts=2).call(send, "search", idempotent=True)).status_code == 500
+    assert len(calls) == 2
+
+    send, calls = responses(404)
+    assert (await policy().call(send, "search", idempotent=True)).status_code == 404
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_fails_fast_and_closes_after_a_successful_trial(clock):
+    breaker = resilience.CircuitBreaker("test-vendor", threshold=2, reset_timeout=10, clock=clock)
+    vendor_policy = policy(attempts=1, breaker=breaker)
+
+    send, calls = responses(500, 500, 500, 200)
+    await vendor_policy.call(send, "search", idempotent=True)
+    await vendor_policy.call(send, "search", idempotent=True)
+    assert breaker.state == "open"
+
+    with pytest.raises(resilience.CircuitOpenError):
+        await vendor_policy.call(send, "search", idempotent=True)
+    assert len(calls) == 2
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    await vendor_policy.call(send, "search", idempotent=True)
+    assert breaker.state == "open"
+
+    clock.now = 20
+    assert (await vendor_policy.call(send, "search", idempotent=True)).status_code == 200
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_vendor_request_absorbs_a_transient_failure(monkeypatch):
+    statuses = iter([502, 200])
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(next(statuses), json={"data": []})))
+    monkeypatch.setitem(http_client._clients, rami_levy.VENDOR, client)
+    monkeypatch.setitem(resilience._policies, rami_levy.VENDOR, resilience.VendorPolicy(rami_levy.VENDOR, base_delay=0))
+    monkeypatch.setenv("VENDOR_API_KEY", "key")
+
+    assert await rami_levy.search("milk") == {"data": []}
+    await client.aclose()
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from mcp_groceries_server.server import cache
+
+
+def test_normalize_query():
+    assert cache.normalize_query("  קוטג׳  ") == cache.normalize_query("קוטג'")
+    assert cache.normalize_query("Olive  OIL") == "olive oil"
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl(clock):
+    search_cache = cache.TTLCache(max_size=10, ttl=5, clock=clock)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return [calls]
+
+    assert await search_cache.get_or_load("key", loader) == [1]
+    assert await search_cache.get_or_load("key", loader) == [1]
+    clock.now = 6
+    assert await search_cache.get_or_load("key", loader) == [2]
+    assert search_cache.stats()["hits"] == 1
+    assert search_cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    search_cache = cache.TTLCache(max_size=2, ttl=60)
+    search_cache.set("a", 1)
+    search_cache.set("b", 2)
+    search_cache.get("a")
+    search_cache.set("c", 3)
+
+    assert search_cache.get("a") == 1
+    assert search_cache.get("b") is None
+    assert search_cache.get("c") == 3
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_deduplicated():
+    search_cache = cache.TTLCache(max_size=10, ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["result"]
+
+    results = await asyncio.gather(*[search_cache.get_or_load("key", loader) for _ in range(5)])
+
+    assert calls == 1
+    assert results == [["result"]] * 5
+
+
+@pytest.mark.asyncio
+async def test_failed_loads_are_not_cached():
+    search_cache = cache.TTLCache(max_size=10, ttl=60)
+
+    async def failing_loader():
+        raise RuntimeError("vendor is down")
+
+    async def loader():
+        return ["result"]
+
+    with pytest.raises(RuntimeError):
+        await search_cache.get_or_load("key", failing_loader)
+    assert await search_cache.get_or_load("key", loader) == ["result"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_load_is_retried_by_the_waiting_callers():
+    search_cache = cache.TTLCache(max_size=10, ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return [calls]
+
+    async def leader():
+        async with asyncio.timeout(0.01):
+            return await search_cache.get_or_load("key", loader)
+
+    leading = asyncio.create_task(leader())
+    await asyncio.sleep(0)
+    following = asyncio.create_task(search_cache.get_or_load("key", loader))
+
+    with pytest.raises(TimeoutError):
+        await leading
+    assert await following == [2]
+    assert calls == 2
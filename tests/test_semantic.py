@@ -0,0 +1,115 @@
+import numpy
+import pytest
+
+from mcp_groceries_server.server import catalog, semantic
+
+from conftest import FakeProvider
+
+PRODUCTS = [
+    dict(id="1", name="רוטב סויה קיקומן 150 מל", second_level_category="רטבים"),
+    dict(id="2", name="שמן זית כתית מעולה 750 מל", second_level_category="שמנים"),
+    dict(id="3", name="חלב תנובה 3% 1 ליטר", second_level_category="חלב"),
+    dict(id="4", name="Soy Sauce Kikkoman 150ml", second_level_category="Sauces"),
+]
+
+
+class Batches:
+    """
+    Hashing embeddings recording the batch sizes and the embedded queries
+    """
+
+    def __init__(self):
+        self.embeddings = semantic.HashingEmbeddings()
+        self.batches = []
+        self.queries = []
+
+    async def aembed_documents(self, texts):
+        self.batches.append(len(texts))
+        return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        self.queries.append(text)
+        return await self.embeddings.aembed_query(text)
+
+
+@pytest.mark.asyncio
+async def test_typos_match_and_unrelated_queries_do_not():
+    index = semantic.VectorIndex("hashing", semantic.HashingEmbeddings())
+    index.add_products(PRODUCTS)
+
+    soy, olive, nothing = await index.search(["sauce soya kikoman", "שמן זיית", "מטאטא"], limit=2)
+
+    assert soy[0][0] == "4"
+    assert olive[0][0] == "2"
+    assert nothing == []
+
+
+@pytest.mark.asyncio
+async def test_products_are_embedded_in_batches_once():
+    embeddings = Batches()
+    index = semantic.VectorIndex("hashing", embeddings, batch_size=3)
+
+    index.add_products(PRODUCTS)
+    await index.flush()
+    index.add_products(PRODUCTS + [dict(PRODUCTS[2], name="חלב תנובה 1% 1 ליטר")])
+    await index.flush()
+
+    # 4 products in batches of 3, the renamed one, and the query is embedded on its own
+    assert (await index.search(["חלב 1%"], limit=1))[0][0][0] == "3"
+    assert embeddings.batches == [3, 1, 1]
+    assert embeddings.queries == ["חלב 1%"]
+    assert len(index) == 4
+
+
+@pytest.mark.asyncio
+async def test_index_syncs_only_the_products_changed_in_the_store():
+    embeddings = Batches()
+    index = semantic.VectorIndex("hashing", embeddings)
+    store = catalog.CatalogStore()
+    store.add_products(PRODUCTS)
+
+    index.sync(store)
+    await index.flush()
+    index.sync(store)
+    assert index.pending == 0
+
+    store.add_products([dict(PRODUCTS[2], name="חלב תנובה 1% 1 ליטר"), PRODUCTS[0]])
+    assert store.changed_since(1) == [dict(PRODUCTS[2], name="חלב תנובה 1% 1 ליטר"), PRODUCTS[0]]
+    index.sync(store)
+    await index.flush()
+
+    # the unchanged product is requeued but only the renamed one is embedded again
+    assert embeddings.batches == [4, 1]
+    assert len(index) == 4
+
+
+@pytest.mark.asyncio
+async def test_index_is_persisted_per_model(tmp_path):
+    saved = semantic.SemanticIndex(str(tmp_path))
+    saved.index("rami-levy").add_products(PRODUCTS)
+    await saved.index("rami-levy").flush()
+    saved.save()
+
+    loaded = semantic.SemanticIndex(str(tmp_path)).index("rami-levy")
+    loaded.add_products(PRODUCTS)
+    assert len(loaded) == 4 and loaded.pending == 0
+    assert (await loaded.search(["kikoman"]))[0][0][0] == "4"
+
+    other_model = semantic.VectorIndex("another-model", semantic.HashingEmbeddings())
+    with numpy.load(tmp_path / "rami-levy-default.vectors.npz") as data:
+        other_model.load(data)
+    assert len(other_model) == 0
+
+
+@pytest.mark.asyncio
+async def test_semantic_search_tool_uses_the_catalog(monkeypatch):
+    monkeypatch.setattr(catalog, "catalog", catalog.Catalog(""))
+    monkeypatch.setattr(semantic, "semantic_index", semantic.SemanticIndex(""))
+    fake = FakeProvider(vendor="semantic")
+    fake.catalog_store().add_products(PRODUCTS)
+
+    blocks = [block["text"] for block in (await fake.semantic_search(["olive oyl", "שמן זית"], limit=1, response_format="full"))["content"]]
+
+    assert blocks[0] == dict(query="olive oyl", products=[], scores=[])
+    assert blocks[1]["products"] == [dict(PRODUCTS[1], freshness=0)]
+    assert 0 < blocks[1]["scores"][0] <= 1
@@ -0,0 +1,107 @@
+import asyncio
+import contextlib
+
+import anyio
+import pytest
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.memory import create_client_server_memory_streams
+
+from mcp_groceries_server.agent import session_pool
+
+server = FastMCP("test")
+
+
+@server.tool()
+def search(query: str) -> dict:
+    return {"content": [{"type": "text", "text": query}]}
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    connections = []
+
+    @contextlib.asynccontextmanager
+    async def connect(endpoint, timeout):
+        connections.append(endpoint)
+        async with create_client_server_memory_streams() as (client, (server_read, server_write)):
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(lambda: server._mcp_server.run(server_read, server_write, server._mcp_server.create_initialization_options()))
+                yield (*client, None)
+                tg.cancel_scope.cancel()
+
+    monkeypatch.setattr(session_pool, "streamablehttp_client", connect)
+    return connections
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_reused_across_runs(connections):
+    logins = []
+
+    async def login(session):
+        logins.append(session)
+
+    pool = session_pool.SessionPool("http://mcp", size=2, on_connect=login)
+    for query in ["חלב", "לחם"]:
+        async with pool.session() as pooled:
+            assert [tool.name for tool in pooled.tools] == ["search"]
+            assert query in (await pooled.session.call_tool("search", {"query": query})).content[0].text
+
+    assert len(connections) == 1
+    assert len(logins) == 1
+    await pool.aclose()
+    assert len(pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_run_drops_its_session(connections):
+    pool = session_pool.SessionPool("http://mcp")
+
+    with pytest.raises(RuntimeError):
+        async with pool.session() as failed:
+            raise RuntimeError("agent failed")
+    async with pool.session() as pooled:
+        assert pooled is not failed
+
+    assert len(connections) == 2
+    assert failed.closed
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_idle_session_failing_its_ping_is_reconnected(connections, monkeypatch):
+    monkeypatch.setattr(session_pool, "MCP_SESSION_PING_AFTER", 0)
+    pool = session_pool.SessionPool("http://mcp")
+    async with pool.session() as stale:
+        pass
+
+    async def ping():
+        raise ConnectionError("session expired")
+
+    monkeypatch.setattr(stale.session, "send_ping", ping)
+    async with pool.session() as pooled:
+        assert pooled is not stale
+        await pooled.session.send_ping()
+
+    assert len(connections) == 2
+    assert len(pool) == 1
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_pool_bounds_concurrent_runs(connections):
+    pool = session_pool.SessionPool("http://mcp", size=1)
+    active, overlapped = [], False
+
+    async def run():
+        nonlocal overlapped
+        async with pool.session():
+            overlapped = overlapped or bool(active)
+            active.append(1)
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    await asyncio.gather(run(), run(), run())
+
+    assert not overlapped
+    assert len(connections) == 1
+    await pool.aclose()
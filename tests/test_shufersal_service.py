@@ -1,8 +1,9 @@
 import pytest
-import asyncio
-from unittest.mock import AsyncMock, patch
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from mcp_groceries_server.server.providers.shufersal import _service as service
+from mcp_groceries_server.server.providers.shufersal._browser_pool import BrowserPool
 from mcp_groceries_server.server.types import CartItemSchema
 
 @pytest.fixture
@@ -11,13 +12,17 @@ def mock_playwright_page():
     mock_page = AsyncMock()
     mock_page.goto = AsyncMock()
     mock_page.evaluate = AsyncMock(return_value={}) # Default return for evaluate
+    mock_page.is_closed = MagicMock(return_value=False)
     return mock_page
 
 @pytest.fixture
 def mock_playwright_browser(mock_playwright_page):
     """Mocks a Playwright Browser object."""
+    mock_context = AsyncMock()
+    mock_context.new_page.return_value = mock_playwright_page
     mock_browser = AsyncMock()
-    mock_browser.new_page.return_value = mock_playwright_page
+    mock_browser.new_context.return_value = mock_context
+    mock_browser.is_connected = MagicMock(return_value=True)
     mock_browser.close = AsyncMock()
     return mock_browser
 
@@ -25,19 +30,22 @@ def mock_playwright_browser(mock_playwright_page):
 def mock_async_playwright(mock_playwright_browser):
     """Mocks the async_playwright context."""
     mock_pw = AsyncMock()
-    mock_pw.chromium.launch.return_value = mock_playwright_browser
+    mock_pw.chromium.connect.return_value = mock_playwright_browser
     mock_pw.start.return_value = mock_pw # Mock the start() method
     mock_pw.stop.return_value = None # Mock the stop() method
     return mock_pw
 
-@pytest.mark.asyncio
-async def test_clear_cart(mock_playwright_page, mock_async_playwright):
-    with patch('playwright.async_api.async_playwright', return_value=mock_async_playwright):
-        # Reset globals for isolated test
-        service._browser = None
-        service._page = None
-        service._playwright_instance = None
+@pytest_asyncio.fixture(autouse=True)
+async def reset_browser_pool(monkeypatch):
+    # A fresh pool per test, the pool is bound to the event loop of the test
+    monkeypatch.setattr(service, "_pool", BrowserPool(service.launch_browser, service._create_context, service._prepare_page))
+    yield
+    await service.close_browser()
+
 
+@pytest.mark.asyncio
+async def test_clear_cart(mock_playwright_page, mock_playwright_browser, mock_async_playwright):
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
         await service.clear_cart()
 
         mock_async_playwright.start.assert_awaited_once()
@@ -45,7 +53,7 @@ async def test_clear_cart(mock_playwright_page, mock_async_playwright):
         # Check the script executed
         mock_playwright_page.evaluate.assert_any_call(
             """
-        async () => { # No args needed for clear_cart
+        async () => { // No args needed for clear_cart
             const response = await fetch('/cart/remove', {
                 method: 'POST',
                 headers: {
@@ -67,79 +75,121 @@ async def test_clear_cart(mock_playwright_page, mock_async_playwright):
 
 @pytest.mark.asyncio
 async def test_update_cart(mock_playwright_page, mock_async_playwright):
-    with patch('playwright.async_api.async_playwright', return_value=mock_async_playwright):
-        # Reset globals for isolated test
-        service._browser = None
-        service._page = None
-        service._playwright_instance = None
-        
+    mock_playwright_page.evaluate = AsyncMock(return_value=[{"ok": True}, {"ok": False, "error": "Bad Request"}])
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
         items_to_update = [
             CartItemSchema(id="123", quantity="2", selling_method="unit"),
             CartItemSchema(id="456", quantity="1", selling_method="weight"),
         ]
 
-        await service.update_cart(items_to_update)
-
-        mock_async_playwright.start.assert_awaited_once()
-        mock_playwright_page.goto.assert_awaited_with(service.BASE_URL)
-
-        # Check each item's script execution
-        expected_script_part = """
-            async (args) => {
-                const response = await window.ajaxCall("/cart/add", JSON.stringify({
-                    productCodePost: args.product_id,
-                    productCode: args.product_id,
-                    sellingMethod: args.sellingMethod,
-                    qty: args.qty,
-                    frontQuantity: args.qty,
-                    comment: "",
-                    affiliateCode: ""
-                }), () => { }, null, {
-                    openFrom: "BROWSER_AUTOMATION", # Custom context to identify calls
-                    recommendationType: "REGULAR"
-                });
-                console.log('update_cart ajaxCall response:', response);
-                return response;
-            }
-        """
+        results = await service.update_cart(items_to_update)
 
+        # All the items are sent from a single in-page script
         mock_playwright_page.evaluate.assert_any_call(
-            expected_script_part,
-            {"product_id": "123", "sellingMethod": "unit", "qty": 2}
+            service.UPDATE_CART_SCRIPT,
+            {
+                "items": [
+                    {"product_id": "123", "sellingMethod": "unit", "qty": 2},
+                    {"product_id": "456", "sellingMethod": "BY_WEIGHT", "qty": 1},
+                ],
+                "concurrency": service.CART_UPDATE_CONCURRENCY,
+            },
         )
-        mock_playwright_page.evaluate.assert_any_call(
-            expected_script_part,
-            {"product_id": "456", "sellingMethod": "BY_WEIGHT", "qty": 1}
-        )
-        # Ensure browser is not closed immediately after update_cart
-        mock_playwright_page.close.assert_not_awaited()
-        mock_playwright_browser.close.assert_not_awaited()
-        mock_async_playwright.stop.assert_not_awaited()
+        assert results == ["2 of 123 added", "1 of 456 failed to add"]
+        # The console logger is installed once and the page is reloaded once for the whole batch
+        mock_playwright_page.add_init_script.assert_awaited_once_with(service.CONSOLE_LOGGER_JS)
+        mock_playwright_page.reload.assert_awaited_once()
+
 
-# Add a test to ensure the browser is closed
 @pytest.mark.asyncio
-async def test_close_browser():
-    # Manually set up a mock browser and page for this specific test
-    mock_pw = AsyncMock()
-    mock_browser = AsyncMock()
-    mock_page = AsyncMock()
-    mock_browser.new_page.return_value = mock_page
-    mock_pw.chromium.launch.return_value = mock_browser
-    mock_pw.start.return_value = mock_pw
-    mock_pw.stop.return_value = None
+async def test_update_cart_resets_the_cart_first(mock_playwright_page, mock_async_playwright):
+    mock_playwright_page.evaluate = AsyncMock(side_effect=lambda script, args=None: [{"ok": True}] if script == service.UPDATE_CART_SCRIPT else [])
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
+        results = await service.update_cart([CartItemSchema(id="123", quantity="1", selling_method="unit")], reset=True)
+
+    scripts = [call.args[0] for call in mock_playwright_page.evaluate.await_args_list]
+    assert scripts.index(service.CLEAR_CART_SCRIPT) < scripts.index(service.UPDATE_CART_SCRIPT)
+    assert results == ["1 of 123 added"]
+
+
+@pytest.mark.asyncio
+async def test_update_cart_keeps_the_outcomes_processed_before_a_failure(mock_playwright_page, mock_async_playwright):
+    async def evaluate(script, args=None):
+        if script == service.UPDATE_CART_SCRIPT:
+            raise RuntimeError("Execution context was destroyed")
+        if "mcpCartUpdate" in script:
+            return [{"ok": True}, None]
+        return []
+
+    mock_playwright_page.evaluate = AsyncMock(side_effect=evaluate)
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
+        results = await service.update_cart([
+            CartItemSchema(id="1", quantity="1", selling_method="unit"),
+            CartItemSchema(id="2", quantity="1", selling_method="unit"),
+            CartItemSchema(id="3", quantity="1", selling_method="unit"),
+        ])
+
+    assert results == ["1 of 1 added", "1 of 2 failed to add", "1 of 3 failed to add"]
+
+
+@pytest.mark.asyncio
+async def test_pages_are_reused_between_calls(mock_playwright_browser, mock_async_playwright):
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
+        await service.clear_cart()
+        await service.clear_cart()
+
+        mock_async_playwright.chromium.connect.assert_awaited_once()
+        mock_playwright_browser.new_context.assert_awaited_once()
+        mock_playwright_browser.new_context.return_value.new_page.assert_awaited_once()
+
 
-    with patch('playwright.async_api.async_playwright', return_value=mock_pw):
+# Add a test to ensure the browser is closed
+@pytest.mark.asyncio
+async def test_close_browser(mock_playwright_browser, mock_async_playwright):
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
         # Ensure browser is launched
-        await service.launch_browser()
+        await service.clear_cart()
         try:
-            assert service._browser is not None
-            assert service._page is not None
+            assert service._pool.occupancy()["contexts"] == 1
             assert service._playwright_instance is not None
         finally:
             await service.close_browser()
 
-        mock_browser.close.assert_awaited_once()
-        mock_pw.stop.assert_awaited_once()
-        assert service._browser is None
-        assert service._page is None
+        mock_playwright_browser.new_context.return_value.close.assert_awaited_once()
+        mock_playwright_browser.close.assert_awaited_once()
+        mock_async_playwright.stop.assert_awaited_once()
+        assert service._pool.occupancy()["contexts"] == 0
         assert service._playwright_instance is None
+
+
+@pytest.mark.asyncio
+async def test_authorize_skips_login_when_the_session_is_valid(mock_playwright_page, mock_async_playwright, monkeypatch):
+    monkeypatch.setattr(service, "_validated_at", {})
+    mock_playwright_page.context = MagicMock()
+    mock_playwright_page.context.request.get = AsyncMock(return_value=MagicMock(ok=True, url=service.BASE_URL))
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
+        await service.authorize("alice")
+        await service.authorize("alice")
+
+        mock_playwright_page.context.request.get.assert_awaited_once()
+        for call in mock_playwright_page.goto.await_args_list:
+            assert call.args[0] != service.AUTH_URL
+
+
+@pytest.mark.asyncio
+async def test_authorize_doesnt_keep_a_timed_out_login(mock_playwright_page, mock_async_playwright, monkeypatch):
+    monkeypatch.setattr(service, "_validated_at", {})
+    auth_states = MagicMock()
+    monkeypatch.setattr(service, "_auth_states", auth_states)
+    monkeypatch.setenv("USERNAME", "alice")
+    monkeypatch.setenv("PASSWORD", "secret")
+    mock_playwright_page.url = service.AUTH_URL
+    mock_playwright_page.context = MagicMock()
+    mock_playwright_page.context.request.get = AsyncMock(return_value=MagicMock(ok=True, url=service.AUTH_URL))
+    mock_playwright_page.wait_for_url = AsyncMock(side_effect=TimeoutError("Timeout 30000ms exceeded"))
+    with patch.object(service, 'async_playwright', MagicMock(return_value=mock_async_playwright)):
+        await service.authorize("alice")
+
+    auth_states.save.assert_not_called()
+    auth_states.delete.assert_called_with("alice")
+    assert "alice" not in service._validated_at
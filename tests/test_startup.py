@@ -0,0 +1,30 @@
+import pytest
+
+from benchmarks import import_time
+from mcp_groceries_server.server import mcp_server
+
+
+def test_providers_register_without_credentials_or_heavy_imports():
+    report = import_time.measure()
+
+    assert report["deferred_imported"] == []
+    assert report["import_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_a_failing_warm_up_does_not_stop_the_others(monkeypatch):
+    warmed = []
+
+    async def _broken():
+        raise ConnectionError("vendor is down")
+
+    async def _healthy():
+        warmed.append("healthy")
+
+    monkeypatch.setattr(mcp_server, "_warm_up_callbacks", [])
+    mcp_server.on_warm_up(_broken)
+    mcp_server.on_warm_up(_healthy)
+
+    await mcp_server.warm_up()
+
+    assert warmed == ["healthy"]
@@ -0,0 +1,117 @@
+import asyncio
+import contextlib
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessageChunk, ToolMessage
+
+from mcp_groceries_server.agent import api, groceries_agent
+
+
+def tool_output(blocks):
+    return ToolMessage(content=json.dumps({"content": [{"type": "text", "text": block} for block in blocks]}), tool_call_id="1")
+
+
+def test_progress_events_report_items_as_they_are_searched_and_added():
+    search_many = dict(
+        event="on_tool_end",
+        name="rami_levy_search_many",
+        data=dict(
+            input={"items": ["חלב", "לחם"]},
+            output=tool_output([dict(query="חלב", products=dict(columns=["id"], rows=[[1], [2]])), dict(query="לחם", error="TimeoutError")]),
+        ),
+    )
+    add = dict(event="on_tool_end", name="add_items_to_cart", data=dict(input={"items": [{"id": "1", "quantity": "2"}]}, output="{}"))
+    delta = dict(event="on_chat_model_stream", name="model", data=dict(chunk=AIMessageChunk(content="Done")))
+
+    assert groceries_agent.progress_events(search_many) == [
+        dict(event="searched", tool="rami_levy_search_many", query="חלב", products=2, error=None),
+        dict(event="searched", tool="rami_levy_search_many", query="לחם", products=0, error="TimeoutError"),
+    ]
+    assert groceries_agent.progress_events(add) == [dict(event="added", tool="add_items_to_cart", items=[{"id": "1", "quantity": "2"}])]
+    assert groceries_agent.progress_events(delta) == [dict(event="message_delta", text="Done")]
+    assert groceries_agent.progress_events(dict(event="on_chain_start", name="agent", data={})) == []
+
+
+@pytest.mark.asyncio
+async def test_stream_cancels_the_run_when_the_consumer_goes_away(monkeypatch):
+    agent = groceries_agent.GroceriesAgent()
+    cancelled = asyncio.Event()
+
+    async def run(shopping_list, preferences, items, emit):
+        emit(dict(event="searched", query="חלב"))
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(agent, "_run_streaming", run)
+    events = agent.stream("<shopping_list>חלב</shopping_list>")
+
+    assert (await anext(events))["event"] == "start"
+    assert (await anext(events))["event"] == "searched"
+    await events.aclose()
+
+    assert cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_stream_reports_failures_as_an_error_event(monkeypatch):
+    agent = groceries_agent.GroceriesAgent()
+
+    async def run(shopping_list, preferences, items, emit):
+        raise ConnectionError("MCP server is down")
+
+    monkeypatch.setattr(agent, "_run_streaming", run)
+
+    assert [event async for event in agent.stream("")] == [dict(event="start"), dict(event="error", error="MCP server is down")]
+
+
+def test_execute_stream_serves_ndjson_and_sse(monkeypatch):
+    async def stream(shopping_list, preferences, items):
+        assert items == ["חלב"]
+        yield dict(event="start")
+        yield dict(event="result", result="ok", resolved=[])
+
+    monkeypatch.setattr(api.agent, "stream", stream)
+    client = TestClient(api.app)
+
+    response = client.post("/execute/stream", json={"groceries_list": ["חלב"]})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == [dict(event="start"), dict(event="result", result="ok", resolved=[])]
+
+    response = client.post("/execute/stream", json={"groceries_list": ["חלב"]}, headers={"accept": "text/event-stream"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.split("\n\n")[1] == 'event: result\ndata: {"event": "result", "result": "ok", "resolved": []}'
+
+
+@pytest.mark.asyncio
+async def test_every_run_authorizes_on_its_pooled_session():
+    class Pooled:
+        session = None
+        tools = []
+
+        def graph(self, model):
+            return None
+
+    calls = []
+
+    class Session:
+        async def call_tool(self, name, arguments=None):
+            calls.append(name)
+
+    class Pool:
+        @contextlib.asynccontextmanager
+        async def session(self):
+            pooled = Pooled()
+            pooled.session = Session()
+            yield pooled
+
+    agent = groceries_agent.GroceriesAgent(pool=Pool())
+    for _ in range(2):
+        async with agent._session():
+            pass
+
+    assert calls == ["user_authorization", "user_authorization"]
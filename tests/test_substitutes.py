@@ -0,0 +1,79 @@
+import pytest
+
+from mcp_groceries_server.server import cache, catalog, substitutes
+
+from conftest import FakeProvider
+
+GRUYERE = dict(id="1", name="גבינת גרוייר 200 גרם", price=30, unit_price=150, unit="kg", branding_name="עמק", second_level_category="גבינות קשות")
+EMMENTAL = dict(id="2", name="גבינת אמנטל 200 גרם", price=20, unit_price=100, unit="kg", branding_name="עמק", second_level_category="גבינות קשות")
+PARMESAN = dict(id="3", name="פרמזן מגורד 100 גרם", price=25, unit_price=250, unit="kg", branding_name="גלבני", second_level_category="גבינות קשות")
+CHEESE_BOX = dict(id="4", name="גבינת גרוייר פרוסות", price=20, unit_price=20, unit="unit", second_level_category="גבינות קשות")
+MILK = dict(id="5", name="חלב 3% 1 ליטר", price=6.9, unit_price=6.9, unit="l", second_level_category="חלב")
+
+
+def test_same_category_ranked_by_name_price_and_brand():
+    store = catalog.CatalogStore()
+    store.add_products([GRUYERE, EMMENTAL, PARMESAN, CHEESE_BOX, MILK])
+
+    suggested = substitutes.for_store(store).suggest("1")
+
+    # priced by unit instead of kg last
+    assert [product["id"] for product, _ in suggested] == ["2", "3", "4"]
+    assert suggested[0][1] > suggested[1][1]
+
+
+def test_products_without_category_are_grouped_by_their_first_word():
+    store = catalog.CatalogStore()
+    store.add_products([dict(id="1", name="חלב תנובה 3%"), dict(id="2", name="חלב טרה 1%"), dict(id="3", name="לחם אחיד")])
+
+    assert [product["id"] for product, _ in substitutes.for_store(store).suggest("1")] == ["2"]
+
+
+def test_out_of_stock_products_are_not_suggested():
+    store = catalog.CatalogStore()
+    store.add_products([GRUYERE, dict(EMMENTAL, out_of_stock=True), PARMESAN])
+
+    assert [product["id"] for product, _ in substitutes.for_store(store).suggest("1")] == ["3"]
+
+
+def test_search_term_is_the_first_word_as_named():
+    assert substitutes.search_term(dict(name="לחם אחיד פרוס")) == "לחם"
+    assert substitutes.search_term(dict(name="(קוטג') 5%")) == "קוטג'"
+    assert substitutes.search_term(dict(name="שמן, זית")) == "שמן"
+    assert substitutes.search_term(PARMESAN) == "גבינות קשות"
+    assert substitutes.search_term(dict(name="")) is None
+
+
+def test_suggestions_follow_catalog_changes():
+    store = catalog.CatalogStore()
+    store.add_products([GRUYERE, EMMENTAL])
+    engine = substitutes.for_store(store)
+    assert [product["id"] for product, _ in engine.suggest("1")] == ["2"]
+
+    store.add_products([dict(EMMENTAL, second_level_category="גבינות רכות"), PARMESAN])
+
+    assert [product["id"] for product, _ in engine.suggest("1")] == ["3"]
+    assert substitutes.for_store(store) is engine
+
+
+@pytest.fixture(autouse=True)
+def local_catalog(monkeypatch):
+    monkeypatch.setattr(catalog, "catalog", catalog.Catalog(""))
+    cache.search_cache.invalidate()
+    yield
+    cache.search_cache.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_tool_searches_the_category_once_when_the_catalog_has_too_few():
+    fake = FakeProvider([EMMENTAL, PARMESAN], "substitutes")
+    fake.catalog_store().add_products([GRUYERE])
+
+    first = (await fake.suggest_substitutes("1", limit=2, response_format="full"))["content"][0]["text"]
+    again = (await fake.suggest_substitutes("1", limit=2, response_format="full"))["content"][0]["text"]
+
+    assert first == again
+    assert [product["id"] for product in first["products"]] == ["2", "3"]
+    assert len(first["scores"]) == 2
+    assert fake.searched == ["גבינות קשות"]
+    assert (await fake.suggest_substitutes("9"))["content"][0]["text"]["error"] == "unknown product, search it first"
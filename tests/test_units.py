@@ -0,0 +1,84 @@
+import pytest
+
+from mcp_groceries_server.server import units
+from mcp_groceries_server.server.providers.keshet.tools import transform_product as keshet_transform
+from mcp_groceries_server.server.providers.rami_levy.tools import transform_product as rami_levy_transform
+from mcp_groceries_server.server.providers.shufersal.tools import transform_product as shufersal_transform
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("חלב 3% 1 ליטר", (1.0, units.LITER)),
+        ("קוטג' 5% 250 גרם", (0.25, units.KILOGRAM)),
+        ("קמח 1 ק\"ג", (1.0, units.KILOGRAM)),
+        ("שמן זית 750 מ\"ל", (0.75, units.LITER)),
+        ("מים 6 x 1.5 ל'", (9.0, units.LITER)),
+        ("ביצים L 12 יח'", (12.0, units.UNIT)),
+        ("12 גדולות", None),
+        ("לחם אחיד", None),
+        (None, None),
+    ],
+)
+def test_parse_quantity(text, expected):
+    assert units.parse_quantity(text) == expected
+
+
+def test_unit_price_uses_the_first_parsable_hint():
+    assert units.unit_price(10, None, "500 גרם", "1 ק\"ג") == (20.0, units.KILOGRAM)
+    assert units.unit_price(10, "לחם") is None
+    assert units.unit_price(None, "500 גרם") is None
+
+
+def test_weighed_products_are_priced_per_kg():
+    assert units.unit_price(29.9, "עגבניות", sold_by_weight=True) == (29.9, units.KILOGRAM)
+
+
+def test_sort_by_unit_price_within_the_dominant_unit_only():
+    products = [
+        dict(id=1, unit_price=12.0, unit=units.KILOGRAM),
+        dict(id=2),
+        dict(id=3, unit_price=1.0, unit=units.UNIT),
+        dict(id=4, unit_price=8.5, unit=units.KILOGRAM),
+        dict(id=5, unit_price=10.0, unit=units.KILOGRAM),
+    ]
+
+    # kg products are reordered in their positions, the others keep the vendor order
+    assert [p["id"] for p in units.sort_by_unit_price(products)] == [4, 2, 3, 5, 1]
+    assert units.sort_by_unit_price([dict(id=1), dict(id=2)]) == [dict(id=1), dict(id=2)]
+
+
+def test_vendor_transform_adds_the_unit_price():
+    packaged = shufersal_transform(
+        dict(baseProduct="P_1", baseProductDescription="קוטג' 5% 250 גרם", price=dict(value=5.0), sellingMethod="BY_UNIT")
+    )
+    weighed = shufersal_transform(
+        dict(baseProduct="P_2", baseProductDescription="עגבניות", price=dict(value=7.9), sellingMethod="BY_WEIGHT")
+    )
+
+    assert (packaged["unit_price"], packaged["unit"]) == (20.0, units.KILOGRAM)
+    assert (weighed["unit_price"], weighed["unit"]) == (7.9, units.KILOGRAM)
+
+
+def test_rami_levy_weighted_products_are_priced_per_kg():
+    weighted = rami_levy_transform(
+        dict(id=1, name="עגבניות שרי", price=dict(price=14.9), gs=dict(Product_Dimensions=dict(Net_Weight="500 גרם")), is_weighted=True)
+    )
+    packaged = rami_levy_transform(
+        dict(id=2, name="עגבניות שרי 500 גרם", price=dict(price=9.9), gs=dict(Product_Dimensions=dict(Net_Weight="500 גרם")), is_weighted=False)
+    )
+
+    assert (weighted["unit_price"], weighted["unit"]) == (14.9, units.KILOGRAM)
+    assert [p["id"] for p in units.sort_by_unit_price([weighted, packaged])] == [1, 2]
+
+
+def test_structured_quantities_come_before_the_name():
+    rami_levy = rami_levy_transform(
+        dict(id=1, name="חלב 3% 1 ליטר", price=dict(price=12.0), gs=dict(Product_Dimensions=dict(Net_Weight="2 ליטר")))
+    )
+    keshet = keshet_transform(
+        dict(id=2, localName="אורז", weight=500, branch=dict(regularPrice=6.0), original=dict(unitOfMeasure=dict(defaultName="גרם")))
+    )
+
+    assert (rami_levy["unit_price"], rami_levy["unit"]) == (6.0, units.LITER)
+    assert (keshet["unit_price"], keshet["unit"]) == (12.0, units.KILOGRAM)